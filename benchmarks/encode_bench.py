@@ -0,0 +1,265 @@
+#!/usr/bin/python3
+# This Python file uses the following encoding: utf-8
+# Measures whole encodes on synthetic clips, so changes to the runner, the split modes or the generated
+# encoder options can be checked for speed. Clips are made locally with ffmpeg's lavfi sources and kept
+# between runs: "static" is testsrc2 (one scene, little motion), "motion" is a mandelbrot zoom (every pixel
+# changes) and "cuts" switches between several sources (scene changes for the split modes to find).
+# Every case goes through get_args and QueueRunner like an encode started from the gui, in a fresh process
+# with an empty cache so scene detection is never skipped. The report has fps, wall time, cpu use and
+# output size per case.
+#
+#   python benchmarks/encode_bench.py --json encode.json
+#   python benchmarks/encode_bench.py --resolutions 1080p --encoders aom vp9 --workers 2 8 --baseline encode.json
+#
+# ffmpeg, aomenc/vpxenc and av1an have to be installed. The preset comes from --preset or the gui's saved
+# settings, only the options being compared are changed.
+import argparse
+import itertools
+import json
+import os
+import pickle
+import platform
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+import psutil
+
+from qencoder.cache import cache_dir
+
+PATTERNS = {
+    'static': ['testsrc2'],
+    'motion': ['mandelbrot'],
+    'cuts': ['testsrc2', 'mandelbrot', 'cellauto=rule=18:seed=1', 'smptehdbars', 'mandelbrot=start_scale=1'],
+}
+RESOLUTIONS = {'480p': '854x480', '720p': '1280x720', '1080p': '1920x1080', '2160p': '3840x2160'}
+ENCODERS = {'aom': 0, 'vp9': 1, 'vp8': 2}
+SPLIT_METHODS = {'ffmpeg': 0, 'none': 1, 'pyscene': 2}
+FPS = 24
+
+
+def lavfi_source(source, size, seconds):
+    name, _, options = source.partition('=')
+    return name + '=' + ':'.join(filter(None, [options, 'size=' + size, 'rate=' + str(FPS),
+                                               'duration=' + str(seconds)]))
+
+
+def make_clip(clipDir, pattern, resolution, seconds):
+    path = os.path.join(clipDir, pattern + '-' + resolution + '-' + str(seconds) + 's.y4m')
+    if os.path.exists(path):
+        return path
+    sources = PATTERNS[pattern]
+    cmd = ['ffmpeg', '-y', '-hide_banner', '-loglevel', 'error']
+    for source in sources:
+        cmd += ['-f', 'lavfi', '-i', lavfi_source(source, RESOLUTIONS[resolution], seconds / len(sources))]
+    if len(sources) > 1:
+        cmd += ['-filter_complex', ''.join('[' + str(i) + ':v]' for i in range(len(sources))) +
+                'concat=n=' + str(len(sources)) + ':v=1:a=0[v]', '-map', '[v]']
+    partial = path + '.part'
+    print("Generating " + os.path.basename(path), flush=True)
+    subprocess.run(cmd + ['-pix_fmt', 'yuv420p', '-f', 'yuv4mpegpipe', partial], check=True)
+    os.replace(partial, path)
+    return path
+
+
+def load_base_preset(path=None):
+    from qencoder.presets import config_path, load_preset
+    if path:
+        return load_preset(path)
+    try:
+        return load_preset(config_path())
+    except (OSError, EOFError, pickle.UnpicklingError):
+        pass
+    # No saved settings, use the gui's defaults
+    os.environ.setdefault('QT_QPA_PLATFORM', 'offscreen')
+    from PyQt5 import QtWidgets
+    from qencoder.window import window
+    app = QtWidgets.QApplication(sys.argv[:1])
+    return window().getPresetDict()
+
+
+def case_preset(base, encoder, split, workers, args):
+    preset = dict(base)
+    preset.update({'enc': ENCODERS[encoder], 'splitmethod': SPLIT_METHODS[split], 'jobs': workers,
+                   'useautotune': False, 'resume': False, 'keeptmp': False, 'audio': False, 'cusaud': False,
+                   'cusvid': False, 'cusffmpeg': False, 'isTargetVMAF': False, 'usinglsmas': False,
+                   'iscropping': False, 'rescale': False, 'parallelsd': False, 'inputFmt': 0, '10b': False})
+    if args.cpu_used is not None:
+        preset['cpuused'] = args.cpu_used
+    if args.threads is not None:
+        preset['threads'] = args.threads
+    return preset
+
+
+class BenchListener:
+    def __init__(self):
+        self.errorCode = None
+
+    def new_task(self, index, taskDesc, taskFrames):
+        pass
+
+    def start_encode(self, index, totalFrames, initFrames):
+        pass
+
+    def new_frames(self, index, addFrames):
+        pass
+
+    def chunk_done(self, index, doneChunks, totalChunks):
+        pass
+
+    def encode_finished(self, index, errorCode):
+        if index != -1:
+            self.errorCode = errorCode
+
+
+def cpu_seconds(times):
+    # Children only count once they have exited, which every encoder has by the end of the run
+    return sum(getattr(times, field, 0.0) for field in ('user', 'system', 'children_user', 'children_system'))
+
+
+def child_run(casePath):
+    from qencoder.mediaprobe import media_info
+    from qencoder.presets import get_args
+    from qencoder.runner import QueueRunner
+    with open(casePath) as f:
+        case = json.load(f)
+    info = media_info(case['input'])
+    args = get_args(case['preset'], case['input'], case['output'], False, info)
+    listener = BenchListener()
+    proc = psutil.Process()
+    psutil.cpu_percent(None)
+    before = cpu_seconds(proc.cpu_times())
+    start = time.perf_counter()
+    QueueRunner([[args, case['preset']]], 1, listener, prefetch=0).run()
+    wall = time.perf_counter() - start
+    systemCpu = psutil.cpu_percent(None)
+    cpu = cpu_seconds(proc.cpu_times()) - before
+    if listener.errorCode != 0 or not os.path.exists(case['output']):
+        result = {'error': "encode failed with code " + str(listener.errorCode)}
+    else:
+        size = os.path.getsize(case['output'])
+        result = {'frames': info['frames'], 'wall': round(wall, 3), 'fps': round(info['frames'] / wall, 3),
+                  'cpu': round(100 * cpu / (wall * (psutil.cpu_count() or 1)), 1), 'system_cpu': systemCpu,
+                  'size': size, 'kbps': round(size * 8 / 1000 / (info['frames'] / (info['fps'] or FPS)), 1)}
+    print("RESULT " + json.dumps(result), flush=True)
+
+
+def run_case(case, workDir, verbose):
+    # One encode in a fresh process with its own empty cache folder
+    casePath = os.path.join(workDir, 'case.json')
+    with open(casePath, 'w') as f:
+        json.dump(case, f)
+    env = dict(os.environ)
+    env['PYTHONPATH'] = ROOT + os.pathsep + env.get('PYTHONPATH', '')
+    env['LOCALAPPDATA' if 'LOCALAPPDATA' in env else 'XDG_CACHE_HOME'] = os.path.join(workDir, 'cache')
+    out = subprocess.run([sys.executable, os.path.abspath(__file__), '--child', casePath], env=env, cwd=workDir,
+                         stdout=subprocess.PIPE, stderr=None if verbose else subprocess.DEVNULL,
+                         universal_newlines=True).stdout
+    for path in (case['output'], os.path.join(workDir, 'temp_out.mkv'), os.path.join(workDir, 'cache')):
+        if os.path.isdir(path):
+            shutil.rmtree(path, ignore_errors=True)
+        elif os.path.exists(path):
+            os.remove(path)
+    for line in reversed(out.splitlines()):
+        if line.startswith("RESULT "):
+            return json.loads(line[len("RESULT "):])
+    if verbose:
+        print(out)
+    return {'error': "no result, run with --verbose to see the encode's output"}
+
+
+def summarize(samples):
+    failed = [s for s in samples if 'error' in s]
+    if failed:
+        return failed[0]
+    result = dict(samples[0])
+    for key in ('wall', 'fps', 'cpu', 'system_cpu'):
+        result[key] = round(statistics.median(s[key] for s in samples), 3)
+    return result
+
+
+def measure(args):
+    base = load_base_preset(args.preset)
+    clipDir = args.clips or cache_dir('bench')
+    results = {}
+    workDir = tempfile.mkdtemp(prefix='qencoder_bench_')
+    try:
+        for pattern, resolution in itertools.product(args.patterns, args.resolutions):
+            clip = make_clip(clipDir, pattern, resolution, args.seconds)
+            for encoder, split, workers in itertools.product(args.encoders, args.splits, sorted(set(args.workers))):
+                name = pattern + "-" + resolution + " " + encoder + " " + split + " " + str(workers) + " workers"
+                case = {'input': clip, 'output': os.path.join(workDir, 'out.mkv'),
+                        'preset': case_preset(base, encoder, split, workers, args)}
+                result = summarize([run_case(case, workDir, args.verbose) for _ in range(args.repeat)])
+                results[name] = result
+                if 'error' in result:
+                    print(name + ": " + result['error'], flush=True)
+                else:
+                    print(name + ": " + "%.2f" % result['fps'] + " fps, " + "%.2f" % result['wall'] + "s, cpu " +
+                          "%.0f" % result['cpu'] + "%, " + str(result['kbps']) + " kbps", flush=True)
+    finally:
+        shutil.rmtree(workDir, ignore_errors=True)
+    return {'machine': {'cpus': psutil.cpu_count(), 'platform': platform.platform(),
+                        'python': platform.python_version()},
+            'settings': {'seconds': args.seconds, 'cpu_used': args.cpu_used, 'threads': args.threads,
+                         'repeat': args.repeat},
+            'cases': results}
+
+
+def compare(report, baselinePath, tolerance):
+    with open(baselinePath) as f:
+        baseline = json.load(f)
+    regressed = False
+    for name, result in report['cases'].items():
+        old = baseline.get('cases', {}).get(name)
+        if old is None or 'error' in old:
+            continue
+        if 'error' in result:
+            print(name + ": failed, worked in the baseline")
+            regressed = True
+            continue
+        ratio = result['fps'] / old['fps']
+        print(name + ": " + "%+.1f" % (100 * (ratio - 1)) + "% fps, " +
+              "%+.1f" % (100 * (result['size'] / old['size'] - 1)) + "% size compared to baseline")
+        if ratio < 1 - tolerance:
+            regressed = True
+    return regressed
+
+
+def main():
+    parser = argparse.ArgumentParser(description="qencoder encode benchmark on synthetic clips")
+    parser.add_argument("--child", help=argparse.SUPPRESS)
+    parser.add_argument("--preset", help="preset (.qec) to start from. Defaults to the gui's saved settings")
+    parser.add_argument("--patterns", nargs='+', choices=sorted(PATTERNS), default=['static', 'motion', 'cuts'])
+    parser.add_argument("--resolutions", nargs='+', choices=sorted(RESOLUTIONS), default=['480p', '720p'])
+    parser.add_argument("--encoders", nargs='+', choices=sorted(ENCODERS), default=['aom'])
+    parser.add_argument("--splits", nargs='+', choices=sorted(SPLIT_METHODS), default=['ffmpeg', 'none'])
+    parser.add_argument("--workers", nargs='+', type=int, default=[1, max(1, (os.cpu_count() or 1) // 2)])
+    parser.add_argument("--seconds", type=int, default=5, help="length of each clip")
+    parser.add_argument("--cpu-used", type=int, default=8, help="encoder speed for every case (default: %(default)s)")
+    parser.add_argument("--threads", type=int, help="threads per worker (default: the preset's)")
+    parser.add_argument("--repeat", type=int, default=1, help="encodes per case, the median is reported")
+    parser.add_argument("--clips", help="folder to keep the generated clips in")
+    parser.add_argument("--json", help="write the report to this file")
+    parser.add_argument("--baseline", help="report from an earlier run to compare against")
+    parser.add_argument("--tolerance", type=float, default=0.1, help="allowed fps loss against the baseline")
+    parser.add_argument("--verbose", action="store_true", help="show the output of every encode")
+    args = parser.parse_args()
+    if args.child:
+        return child_run(args.child)
+    report = measure(args)
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump(report, f, indent=2)
+    if args.baseline and compare(report, args.baseline, args.tolerance):
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
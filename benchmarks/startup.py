@@ -0,0 +1,101 @@
+#!/usr/bin/python3
+# This Python file uses the following encoding: utf-8
+# Measures how long qencoder takes to start: importing qencoder.window, and the time from
+# interpreter start until the main window is first painted. Every sample runs in a fresh process.
+#
+#   python benchmarks/startup.py --repeat 10 --json startup.json
+#   python benchmarks/startup.py --baseline startup.json      (exits 1 if more than 20% slower)
+#
+# Set QT_QPA_PLATFORM=offscreen to run it on machines without a display.
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def child_import():
+    start = time.perf_counter()
+    import qencoder.window
+    print(time.perf_counter() - start)
+
+
+def child_paint():
+    start = time.perf_counter()
+    from PyQt5 import QtCore, QtWidgets
+    from qencoder.window import window
+
+    class PaintWatcher(QtCore.QObject):
+        def eventFilter(self, obj, event):
+            if event.type() == QtCore.QEvent.Paint:
+                print(time.perf_counter() - start, flush=True)
+                os._exit(0)
+            return False
+
+    app = QtWidgets.QApplication(sys.argv[:1])
+    win = window()
+    watcher = PaintWatcher()
+    win.installEventFilter(watcher)
+    win.show()
+    QtCore.QTimer.singleShot(30000, lambda: os._exit(1))
+    app.exec_()
+
+
+def sample(kind):
+    env = dict(os.environ)
+    env['PYTHONPATH'] = ROOT + os.pathsep + env.get('PYTHONPATH', '')
+    out = subprocess.run([sys.executable, os.path.abspath(__file__), '--child', kind], env=env, cwd=ROOT,
+                         stdout=subprocess.PIPE, check=True, universal_newlines=True).stdout
+    return float(out.strip().splitlines()[-1])
+
+
+def measure(repeat):
+    results = {}
+    for kind in ('import', 'paint'):
+        samples = [sample(kind) for _ in range(repeat)]
+        results[kind] = {'median': statistics.median(samples), 'min': min(samples), 'max': max(samples)}
+        print(kind + ": median " + "%.3f" % results[kind]['median'] + "s, min " + "%.3f" % results[kind]['min'] +
+              "s, max " + "%.3f" % results[kind]['max'] + "s")
+    return results
+
+
+def compare(results, baselinePath, tolerance):
+    with open(baselinePath) as f:
+        baseline = json.load(f)
+    regressed = False
+    for kind in results:
+        if kind not in baseline:
+            continue
+        ratio = results[kind]['median'] / baseline[kind]['median']
+        print(kind + ": " + "%+.1f" % (100 * (ratio - 1)) + "% compared to baseline")
+        if ratio > 1 + tolerance:
+            regressed = True
+    return regressed
+
+
+def main():
+    parser = argparse.ArgumentParser(description="qencoder startup benchmark")
+    parser.add_argument("--child", choices=["import", "paint"], help=argparse.SUPPRESS)
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--json", help="write results to this file")
+    parser.add_argument("--baseline", help="results file from an earlier run to compare against")
+    parser.add_argument("--tolerance", type=float, default=0.2, help="allowed slowdown against the baseline")
+    args = parser.parse_args()
+    if args.child == "import":
+        return child_import()
+    if args.child == "paint":
+        return child_paint()
+    results = measure(args.repeat)
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump(results, f, indent=2)
+    if args.baseline and compare(results, args.baseline, args.tolerance):
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,131 @@
+#!/usr/bin/python3
+# This Python file uses the following encoding: utf-8
+# Compares target quality searches on simulated scenes: av1an's search ("bisect") against the curve fit
+# search ("fit"). Reports probe encodes per scene and how much further from the target vmaf the chosen q
+# lands than the best q in range would.
+# Scenes are q -> vmaf curves that drift from one scene to the next, with a little noise on every probe.
+# The bisect search uses av1an's own interpolation, so av1an (and scipy) have to be installed.
+#
+#   python benchmarks/tq_probes.py --scenes 500 --steps 5 --target 95
+#   python benchmarks/tq_probes.py --json tq.json
+import argparse
+import json
+import math
+import os
+import random
+import statistics
+import sys
+import types
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from qencoder.targetquality import fit_search_q, search_q, scene_line, neighbour_line, save_line, known_q
+
+
+class SimulatedScene:
+    def __init__(self, intercept, slope, curve, noise, seed):
+        self.intercept = intercept
+        self.slope = slope
+        self.curve = curve
+        self.noise = noise
+        self.seed = seed
+
+    def vmaf(self, q):
+        t = self.intercept + self.slope * q + self.curve * (q - 30) ** 2
+        return 100 * (1 - math.exp(-max(t, 0.01)))
+
+    def best_q(self, target, minQ, maxQ):
+        return min(range(minQ, maxQ + 1), key=lambda q: abs(self.vmaf(q) - target))
+
+
+class SimulatedProbes:
+    def __init__(self, scene):
+        self.scene = scene
+        self.points = {}
+        self.probed = 0
+
+    def score(self, q):
+        if q not in self.points:
+            noise = random.Random(self.scene.seed * 1000 + q).gauss(0, self.scene.noise)
+            self.points[q] = round(min(100.0, self.scene.vmaf(q) + noise), 2)
+            self.probed += 1
+        return self.points[q]
+
+
+def make_scenes(count, noise, seed):
+    rng = random.Random(seed)
+    scenes = []
+    intercept, slope = 4.8, -0.07
+    for i in range(count):
+        if rng.random() < 0.15:
+            # A different kind of content, unrelated to the scene before it
+            intercept, slope = rng.uniform(3.6, 6.0), rng.uniform(-0.11, -0.04)
+        else:
+            intercept += rng.gauss(0, 0.15)
+            slope = min(-0.02, slope + rng.gauss(0, 0.006))
+        scenes.append(SimulatedScene(intercept, slope, rng.uniform(0, 0.0006), noise, seed * 100000 + i))
+    return scenes
+
+
+def run(method, scenes, target, minQ, maxQ, steps, tolerance):
+    project = types.SimpleNamespace()
+    probes = []
+    errors = []
+    qErrors = []
+    for index, scene in enumerate(scenes):
+        p = SimulatedProbes(scene)
+        if method == 'fit':
+            q = fit_search_q(p, target, minQ, maxQ, steps, neighbour_line(project, index), tolerance)
+            save_line(project, index, scene_line(p.points, minQ, maxQ))
+        else:
+            q = search_q(p, target, minQ, maxQ, steps)
+        best = scene.best_q(target, minQ, maxQ)
+        probes.append(p.probed)
+        errors.append(abs(scene.vmaf(q) - target) - abs(scene.vmaf(best) - target))
+        qErrors.append(abs(q - best))
+    return {'probes_per_scene': statistics.mean(probes), 'vmaf_error_mean': statistics.mean(errors),
+            'vmaf_error_p95': sorted(errors)[int(0.95 * (len(errors) - 1))], 'q_error_mean': statistics.mean(qErrors)}
+
+
+def run_cached(scenes, target, newTarget, minQ, maxQ, steps, tolerance):
+    # Probes saved from an encode at target, then encoding again at newTarget
+    probes = []
+    project = types.SimpleNamespace()
+    for index, scene in enumerate(scenes):
+        p = SimulatedProbes(scene)
+        fit_search_q(p, target, minQ, maxQ, steps, neighbour_line(project, index), tolerance)
+        save_line(project, index, scene_line(p.points, minQ, maxQ))
+        p.probed = 0
+        if known_q(p.points, newTarget, minQ, maxQ) is None:
+            fit_search_q(p, newTarget, minQ, maxQ, steps, neighbour_line(project, index), tolerance)
+        probes.append(p.probed)
+    return {'probes_per_scene': statistics.mean(probes)}
+
+
+def main():
+    parser = argparse.ArgumentParser(description="qencoder target quality probe benchmark")
+    parser.add_argument("--scenes", type=int, default=300)
+    parser.add_argument("--steps", type=int, default=5, help="probe limit per scene (Test steps in the gui)")
+    parser.add_argument("--target", type=float, default=95.0)
+    parser.add_argument("--min-q", type=int, default=15)
+    parser.add_argument("--max-q", type=int, default=55)
+    parser.add_argument("--tolerance", type=float, default=0.5, help="vmaf tolerance of the fit search")
+    parser.add_argument("--noise", type=float, default=0.3, help="standard deviation of probe vmaf noise")
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--json", help="write results to this file")
+    args = parser.parse_args()
+    scenes = make_scenes(args.scenes, args.noise, args.seed)
+    results = {}
+    for method in ('bisect', 'fit'):
+        results[method] = run(method, scenes, args.target, args.min_q, args.max_q, args.steps, args.tolerance)
+    results['fit_cached'] = run_cached(scenes, args.target, args.target - 1, args.min_q, args.max_q, args.steps,
+                                       args.tolerance)
+    for method, r in results.items():
+        print(method + ": " + ", ".join(k + " " + "%.3f" % v for k, v in r.items()))
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump(results, f, indent=2)
+
+
+if __name__ == '__main__':
+    main()
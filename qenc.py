@@ -1,9 +1,6 @@
 #!/usr/bin/python3
 # This Python file uses the following encoding: utf-8
 import qencoder
-from qencoder.window import window
-from PyQt5 import QtWidgets
-from PyQt5.QtWidgets import QApplication
 
 import sys
 import multiprocessing
@@ -12,12 +9,16 @@ import os
 #baseUIClass, baseUIWidget = uic.loadUiType("mainwindow.ui")
 
 def main():
+    if sys.platform.startswith('win'):
+        multiprocessing.freeze_support()
+    if "--headless" in sys.argv[1:]:
+        from qencoder.headless import main as headless_main
+        sys.exit(headless_main(sys.argv[1:]))
     if not sys.platform.startswith('win'):
         os.setpgrp()
     global window
-    if sys.platform.startswith('win'):
-        multiprocessing.freeze_support()
-    print("Loading program... please wait!")
+    from qencoder.window import window
+    from PyQt5 import QtWidgets
     app = QtWidgets.QApplication(sys.argv)
     window = window()
     window.show()
@@ -0,0 +1,135 @@
+# This Python file uses the following encoding: utf-8
+# Finds the split of the cpu between chunk jobs and encoder threads that encodes fastest.
+# A short sample from the middle of the input is encoded with the preset's own settings at each
+# jobs x threads combination that fills the machine, all jobs of a combination at once,
+# and the one with the highest total frame rate wins. Results are stored in the preset by
+# tune_key, and get_args uses them for later encodes of the same kind.
+import os
+import shlex
+import shutil
+import subprocess
+import tempfile
+import time
+
+import psutil
+
+from qencoder.presets import INPUT_FORMATS, encode_size, get_ffmpeg_params, get_video_params, match_input_format, \
+    tune_key
+from qencoder.scheduler import chunk_memory
+
+SAMPLE_FRAMES = 48
+MAX_THREADS = 16
+POLL_INTERVAL = 0.1
+
+
+class AutotuneError(Exception):
+    pass
+
+
+def candidates(cores, memoryPerThreads=None, available=None):
+    # (jobs, threads) pairs using every core, from one thread per job up to MAX_THREADS.
+    # memoryPerThreads(threads) is the memory one job needs, jobs are capped to what fits.
+    pairs = []
+    threads = 1
+    while threads <= min(cores, MAX_THREADS):
+        jobs = max(1, cores // threads)
+        if memoryPerThreads is not None and available is not None:
+            jobs = max(1, min(jobs, available // memoryPerThreads(threads)))
+        if (jobs, threads) not in pairs:
+            pairs.append((jobs, threads))
+        threads *= 2
+    return pairs
+
+
+def make_sample(preset, inputPath, info, path, frames):
+    # Decodes frames from the middle of the input through the preset's filters to a y4m file,
+    # so the encoders are timed without ffmpeg in the way
+    start = 0.0
+    if info and info.get('duration') and info.get('fps'):
+        start = max(0.0, info['duration'] / 2 - frames / info['fps'] / 2)
+    cmd = ['ffmpeg', '-y', '-hide_banner', '-loglevel', 'error', '-ss', str(round(start, 3)), '-i', str(inputPath),
+           '-map', '0:v:0', '-frames:v', str(frames)]
+    cmd += shlex.split(get_ffmpeg_params(preset))
+    cmd += ['-pix_fmt', INPUT_FORMATS[preset['inputFmt']], '-strict', '-1', '-f', 'yuv4mpegpipe', path]
+    try:
+        result = subprocess.run(cmd, stdout=subprocess.DEVNULL, stderr=subprocess.PIPE, universal_newlines=True)
+    except OSError as e:
+        raise AutotuneError("Unable to run ffmpeg: " + str(e))
+    if result.returncode != 0 or not os.path.exists(path):
+        raise AutotuneError("Unable to cut a sample from the input: " + result.stderr.strip())
+
+
+def measure(preset, size, sample, jobs, threads, frames, workDir, cancelled):
+    # Runs jobs encoders on the sample at once. Returns the total frame rate, None if cancelled.
+    binary = 'aomenc' if preset['enc'] == 0 else 'vpxenc'
+    params = shlex.split(get_video_params(dict(preset, threads=threads), size))
+    procs = []
+    logs = []
+    start = time.time()
+    try:
+        for i in range(jobs):
+            logs.append(open(os.path.join(workDir, "enc" + str(i) + ".log"), 'w+'))
+            cmd = [binary, '--passes=1'] + params + ['--limit=' + str(frames), '-o',
+                                                     os.path.join(workDir, "enc" + str(i) + ".ivf"), sample]
+            procs.append(subprocess.Popen(cmd, stdout=subprocess.DEVNULL, stderr=logs[-1]))
+        while any(proc.poll() is None for proc in procs):
+            if cancelled():
+                return None
+            time.sleep(POLL_INTERVAL)
+        elapsed = time.time() - start
+        for proc, log in zip(procs, logs):
+            if proc.returncode != 0:
+                log.seek(0)
+                raise AutotuneError(binary + " exited with " + str(proc.returncode) + ": " +
+                                    log.read().strip()[-500:])
+        return jobs * frames / max(elapsed, 1e-6)
+    except OSError as e:
+        raise AutotuneError("Unable to run " + binary + ": " + str(e))
+    finally:
+        for proc in procs:
+            if proc.poll() is None:
+                proc.kill()
+                proc.wait()
+        for log in logs:
+            log.close()
+
+
+def autotune(preset, inputPath, info, frames=SAMPLE_FRAMES, cores=None, on_progress=None, cancelled=None):
+    # Returns (key, best, results) where best and each result are {'jobs', 'threads', 'fps'}.
+    # Returns None if cancelled. Raises AutotuneError if the sample cannot be encoded.
+    on_progress = on_progress or (lambda text: None)
+    cancelled = cancelled or (lambda: False)
+    if preset['cusvid']:
+        raise AutotuneError("Custom video options are set, autotune needs the generated ones")
+    size = encode_size(preset, info)
+    if size is None:
+        raise AutotuneError("Unable to read the size of " + str(inputPath))
+    inputFmt = match_input_format((info or {}).get('pix_fmt'))
+    if inputFmt is not None:
+        preset = dict(preset, inputFmt=inputFmt)
+    if info and info.get('frames'):
+        frames = max(1, min(frames, info['frames']))
+    cores = cores or psutil.cpu_count() or 1
+    encoder = 'aom' if preset['enc'] == 0 else 'vpx'
+    depth = 10 if preset['10b'] else 8
+    pairs = candidates(cores, lambda threads: chunk_memory(size[0], size[1], encoder, depth, threads),
+                       psutil.virtual_memory().available * 4 // 5)
+    workDir = tempfile.mkdtemp(prefix='qencoder_autotune_')
+    try:
+        on_progress("Autotune: cutting a " + str(frames) + " frame sample")
+        sample = os.path.join(workDir, "sample.y4m")
+        make_sample(preset, inputPath, info, sample, frames)
+        results = []
+        for jobs, threads in pairs:
+            on_progress("Autotune: testing " + str(jobs) + " jobs x " + str(threads) + " threads (" +
+                        str(len(results) + 1) + "/" + str(len(pairs)) + ")")
+            fps = measure(preset, size, sample, jobs, threads, frames, workDir, cancelled)
+            if fps is None:
+                return None
+            results.append({'jobs': jobs, 'threads': threads, 'fps': round(fps, 2)})
+            on_progress("Autotune: " + str(jobs) + " jobs x " + str(threads) + " threads, " + str(round(fps, 2)) +
+                        " fps")
+        best = max(results, key=lambda r: r['fps'])
+        return tune_key(preset, *size), best, results
+    finally:
+        shutil.rmtree(workDir, ignore_errors=True)
@@ -1,7 +1,17 @@
-from av1an.manager import Manager
-from av1an.project import Project
-from av1an.startup.setup import startup_check
+# av1an, vapoursynth and scenedetect are imported when first used so the gui can start quickly
+import concurrent.futures
+import importlib
 import json
+import os
+import psutil
+import re
+import shutil
+import tempfile
+import threading
+import time
+from pathlib import Path
+
+from qencoder.metrics import record_busy, timed_stage
 
 def get_default_args():
     return {'input': None, 'temp': None, 'output_file': None, 'mkvmerge': False, 'logging': None,
@@ -15,10 +25,13 @@ def get_default_args():
 
 
 def get_av1an_proj(args):
+    from av1an.project import Project
     return Project(args)
 
 
 def get_av1an(proj):
+    from av1an.manager import Manager
+    from av1an.startup.setup import startup_check
     startup_check(proj)
     return Manager.Main(proj)
 
@@ -27,6 +40,275 @@ def run_av1an(manager):
     manager.run()
 
 
+def attach_core_budget(proj, budget, threads, workers):
+    # av1an sizes its chunk pool once per project. With a budget attached the pool is sized for
+    # the whole machine and every chunk waits for budget before it starts encoding.
+    install_queue_hooks()
+    proj.core_budget = budget
+    proj.core_cost = max(1, threads)
+    proj.core_cap = workers
+    proj.workers = workers if workers > 0 else budget.max_workers(proj.core_cost)
+    proj.core_memory = project_chunk_memory(proj, threads)
+
+
+def as_text(params):
+    return " ".join(params) if isinstance(params, (list, tuple)) else str(params or "")
+
+
+def project_chunk_memory(proj, threads):
+    # Expected memory of one of this project's encoders, from the probed input size or the scale filter
+    from qencoder.scheduler import chunk_memory
+    info = getattr(proj, 'media_info', None) or {}
+    width, height = info.get('width') or 1920, info.get('height') or 1080
+    scale = re.search(r'scale=(\d+):(\d+)', as_text(proj.ffmpeg))
+    if scale:
+        width, height = int(scale.group(1)), int(scale.group(2))
+    depth = re.search(r'--bit-depth=(\d+)', as_text(proj.video_params))
+    return chunk_memory(width, height, proj.encoder, int(depth.group(1)) if depth else 8, max(1, threads))
+
+
+def attach_stage_timer(proj, timer):
+    # timer is a metrics.StageTimer, av1an's stages for this project are timed into it
+    install_queue_hooks()
+    install_manager_hooks()
+    proj.stage_timer = timer
+
+
+def attach_chunk_pool(proj, pool):
+    # Chunks go to a pool shared with the other running items instead of a pool of av1an's own.
+    # Needs a core budget attached, the pool runs chunks under the same budget.
+    install_queue_hooks()
+    proj.chunk_pool = pool
+
+
+class ProgressCounter:
+    # Wraps av1an's frame counter so every update is pushed to a queue instead of being polled
+    def __init__(self, counter, events):
+        self.counter = counter
+        self.events = events
+
+    def update(self, value):
+        self.counter.update(value)
+        self.events.put(('frames', value))
+
+    def __getattr__(self, item):
+        return getattr(self.counter, item)
+
+
+def watch_progress(proj, events):
+    # events receives ('start', total frames, chunks left) once chunks start encoding, then ('frames', n)
+    # per counter update and ('chunk', name, frames) as each chunk finishes
+    install_queue_hooks()
+    proj.progress_events = events
+
+
+class JobCancelled(Exception):
+    pass
+
+
+def cancel_project(proj):
+    # Chunks that have not started yet are skipped, the caller kills the ones already running
+    proj.cancelled = True
+    pool = getattr(proj, 'chunk_pool', None)
+    if pool is not None:
+        pool.cancel(proj)
+    budget = getattr(proj, 'core_budget', None)
+    if budget is not None:
+        budget.unregister(proj)
+
+
+def project_cancelled(proj):
+    return getattr(proj, 'cancelled', False)
+
+
+def project_processes(proj):
+    # Every encoder, ffmpeg and vspipe process av1an starts for a project has a path inside its temp folder
+    temps = {str(proj.temp), os.path.abspath(str(proj.temp))}
+    found = []
+    for child in psutil.Process(os.getpid()).children(recursive=True):
+        try:
+            cmdline = " ".join(child.cmdline())
+        except (psutil.NoSuchProcess, psutil.AccessDenied):
+            continue
+        if any(t in cmdline for t in temps):
+            found.append(child)
+    return found
+
+
+def kill_process_tree(proc):
+    try:
+        for child in proc.children(recursive=True):
+            child.kill()
+        proc.kill()
+    except psutil.NoSuchProcess:
+        pass
+
+
+def kill_project_processes(proj):
+    for proc in project_processes(proj):
+        kill_process_tree(proc)
+
+
+hookLock = threading.Lock()
+
+
+def install_queue_hooks():
+    # Queue items start on several threads at once, none of them may see av1an's Queue half patched
+    with hookLock:
+        queue_module = importlib.import_module('av1an.manager.Queue')
+        if not getattr(queue_module.Queue, 'qencoderHooks', False):
+            patch_queue(queue_module)
+
+
+def patch_queue(queue_module):
+    Queue = queue_module.Queue
+    # Queue imported av1an's routine by name, so it has to be replaced in Queue's namespace
+    from qencoder.distributed import remote_encode_chunk
+    from qencoder.targetquality import per_shot_target_quality_routine
+    queue_module.per_shot_target_quality_routine = per_shot_target_quality_routine
+    encode_chunk = Queue.encode_chunk
+    encoding_loop = Queue.encoding_loop
+    resume_module = importlib.import_module('av1an.resume')
+    write_progress_file = resume_module.write_progress_file
+    # The project whose chunk this thread is encoding
+    current = threading.local()
+
+    def checked_encode_chunk(self, chunk):
+        if project_cancelled(self.project):
+            return None
+        return encode_chunk(self, chunk)
+
+    def budgeted_encode_chunk(self, chunk):
+        budget = getattr(self.project, 'core_budget', None)
+        if budget is None:
+            return checked_encode_chunk(self, chunk)
+        with budget.slot(self.project):
+            return checked_encode_chunk(self, chunk)
+
+    def timed_encode_chunk(self, chunk, encode, *args):
+        start = time.perf_counter()
+        current.project = self.project
+        try:
+            return encode(self, chunk, *args)
+        finally:
+            current.project = None
+            record_busy(self.project, 'chunks', time.perf_counter() - start)
+
+    def reported_write_progress_file(progress_file, chunk, encoded_frames):
+        # av1an only writes chunks that passed the frame check to done.json, failed ones are encoded again
+        # on resume. Reporting from here means the gui counts exactly the chunks a resume would skip.
+        write_progress_file(progress_file, chunk, encoded_frames)
+        project = getattr(current, 'project', None)
+        events = getattr(project, 'progress_events', None)
+        if events is not None and not project_cancelled(project):
+            events.put(('chunk', chunk.name, encoded_frames))
+
+    def hooked_encode_chunk(self, chunk):
+        return timed_encode_chunk(self, chunk, budgeted_encode_chunk)
+
+    def pooled_encode_chunk(self, chunk):
+        # The pool already holds a budget slot for this chunk, or runs it on a remote worker
+        slot = self.project.chunk_pool.current_slot()
+        if slot is None:
+            return timed_encode_chunk(self, chunk, checked_encode_chunk)
+        elif project_cancelled(self.project):
+            return None
+        return timed_encode_chunk(self, chunk, remote_encode_chunk, slot)
+
+    def pooled_encoding_loop(self, pool):
+        pending = {pool.submit(self.project, pooled_encode_chunk, self, chunk) for chunk in self.chunk_queue}
+        try:
+            while pending and not project_cancelled(self.project):
+                # Remote chunks cannot be killed from here, a cancelled item stops waiting for them
+                done, pending = concurrent.futures.wait(pending, timeout=1,
+                                                        return_when=concurrent.futures.FIRST_COMPLETED)
+                for future in done:
+                    if future.cancelled():
+                        continue
+                    exc = future.exception()
+                    if exc is not None:
+                        # av1an kills the whole process here, with a shared pool only this item fails
+                        print(f'Encoding error {exc}')
+                        raise exc
+        finally:
+            pool.cancel(self.project)
+        self.project.counter.close()
+
+    def hooked_encoding_loop(self):
+        if project_cancelled(self.project):
+            raise JobCancelled()
+        events = getattr(self.project, 'progress_events', None)
+        if events is not None:
+            self.project.counter = ProgressCounter(self.project.counter, events)
+            events.put(('start', self.project.get_frames(), len(self.chunk_queue)))
+        budget = getattr(self.project, 'core_budget', None)
+        if budget is not None:
+            budget.register(self.project, len(self.chunk_queue), self.project.core_cost, self.project.core_cap,
+                            self.project.core_memory)
+        pool = getattr(self.project, 'chunk_pool', None)
+        try:
+            with timed_stage(self.project, 'encode'):
+                if pool is not None and budget is not None:
+                    result = pooled_encoding_loop(self, pool)
+                else:
+                    result = encoding_loop(self)
+        finally:
+            if budget is not None:
+                budget.unregister(self.project)
+        # Stop av1an here so it does not concat a partial encode. temp is kept for resuming later.
+        if project_cancelled(self.project):
+            raise JobCancelled()
+        return result
+
+    Queue.encode_chunk = hooked_encode_chunk
+    Queue.encoding_loop = hooked_encoding_loop
+    # Queue imported it by name, remote_encode_chunk imports it from av1an.resume when it runs
+    queue_module.write_progress_file = reported_write_progress_file
+    resume_module.write_progress_file = reported_write_progress_file
+    Queue.qencoderHooks = True
+
+
+def install_manager_hooks():
+    with hookLock:
+        manager_module = importlib.import_module('av1an.manager.Manager')
+        if not getattr(manager_module.EncodingManager, 'qencoderHooks', False):
+            patch_manager(manager_module)
+
+
+def patch_manager(manager_module):
+    # encode_file calls av1an's stages by their names in the Manager module. Several projects encode at once,
+    # each on its own thread, so the project a stage belongs to is kept per thread.
+    from av1an.project import Project
+    current = threading.local()
+    encode_file = manager_module.EncodingManager.encode_file
+    concat_routine = Project.concat_routine
+
+    def timed(stage, routine):
+        def run_timed(*args, **kwargs):
+            with timed_stage(getattr(current, 'project', None), stage):
+                return routine(*args, **kwargs)
+        return run_timed
+
+    def tracked_encode_file(self, project):
+        current.project = project
+        try:
+            return encode_file(self, project)
+        finally:
+            current.project = None
+
+    def timed_concat_routine(self):
+        with timed_stage(self, 'concat'):
+            return concat_routine(self)
+
+    manager_module.split_routine = timed('scenes', manager_module.split_routine)
+    manager_module.load_or_gen_chunk_queue = timed('split', manager_module.load_or_gen_chunk_queue)
+    manager_module.segment_first_pass = timed('split', manager_module.segment_first_pass)
+    manager_module.extract_audio = timed('audio', manager_module.extract_audio)
+    manager_module.EncodingManager.encode_file = tracked_encode_file
+    Project.concat_routine = timed_concat_routine
+    manager_module.EncodingManager.qencoderHooks = True
+
+
 def merge_args(dictargs):
     args1 = get_default_args()
     for key in dictargs:
@@ -35,11 +317,49 @@ def merge_args(dictargs):
     return args1
 
 
-def done_count(temp, resume):
-    done_path = temp / 'done.json'
-    if resume and done_path.exists():
-        with open(done_path) as done_file:
-            data = json.load(done_file)
-        return sum(data['done'].values())
-    else:
-        return 0
+def detect_scenes(dictargs, scenePath):
+    # Runs av1an's scene detection on its own, outside of an encode, and saves the result where
+    # av1an looks for saved scenes. Uses a throwaway temp folder so it cannot touch a running encode.
+    from av1an.project import Project
+    from av1an.split import calc_split_locations
+    temp = tempfile.mkdtemp(prefix="qencoder_scenes_")
+    try:
+        args = get_default_args()
+        args.update(dictargs)
+        args['scenes'] = None
+        args['temp'] = Path(temp)
+        args['resume'] = False
+        proj = Project(args)
+        # One project per input, like av1an's create_project_list
+        proj.input = Path(dictargs['input'][0])
+        if dictargs.get('parallel_scenes') and dictargs['split_method'] == 'pyscene':
+            # Saved like av1an's own detection, without extra splits. av1an adds them when it loads the file.
+            from qencoder.scenesplit import parallel_detect
+            scenes, frames = parallel_detect(dictargs['input'][0], proj.threshold, proj.min_scene_len,
+                                             frames=proj.get_frames())
+        else:
+            scenes = calc_split_locations(proj)
+            frames = proj.get_frames()
+    finally:
+        shutil.rmtree(temp, ignore_errors=True)
+    partial = str(scenePath) + ".part"
+    with open(partial, 'w') as scene_file:
+        json.dump({'scenes': scenes, 'frames': frames}, scene_file)
+    os.replace(partial, str(scenePath))
+
+
+def lsmash_available():
+    try:
+        from vapoursynth import core
+        core.lsmas.get_functions()
+        return True
+    except Exception:
+        return False
+
+
+def scenedetect_available():
+    try:
+        from scenedetect.video_manager import VideoManager
+        return True
+    except ImportError:
+        return False
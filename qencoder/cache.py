@@ -0,0 +1,38 @@
+# This Python file uses the following encoding: utf-8
+# Shared helpers for qencoder's on-disk caches.
+import hashlib
+import json
+import os
+
+SAMPLE_SIZE = 1 << 20
+
+
+def cache_home():
+    if 'LOCALAPPDATA' in os.environ:
+        return os.path.join(os.environ['LOCALAPPDATA'], 'qencoder', 'cache')
+    elif 'XDG_CACHE_HOME' in os.environ:
+        return os.path.join(os.environ['XDG_CACHE_HOME'], 'qencoder')
+    else:
+        return os.path.join(os.path.expanduser('~'), '.cache', 'qencoder')
+
+
+def cache_dir(name):
+    path = os.path.join(cache_home(), name)
+    os.makedirs(path, exist_ok=True)
+    return path
+
+
+def file_fingerprint(path):
+    # Hashes the size and three 1MiB samples (start, middle, end). Reads at most 3MiB no matter how
+    # large the file is, so it is cheap on multi gigabyte masters but still follows the content.
+    size = os.path.getsize(path)
+    h = hashlib.blake2b(str(size).encode(), digest_size=16)
+    with open(path, 'rb') as f:
+        for offset in (0, max(0, size // 2 - SAMPLE_SIZE // 2), max(0, size - SAMPLE_SIZE)):
+            f.seek(offset)
+            h.update(f.read(SAMPLE_SIZE))
+    return h.hexdigest()
+
+
+def cache_key(parts):
+    return hashlib.sha1(json.dumps(parts, sort_keys=True, default=str).encode()).hexdigest()
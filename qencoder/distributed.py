@@ -0,0 +1,244 @@
+# This Python file uses the following encoding: utf-8
+# Coordinator side of multi machine encoding. Each slot of a qencoder-worker becomes a slot of the
+# runner's ChunkPool, so remote machines take chunks from the same queue as the local cores.
+# Scene detection, target quality probes, retries and concat all stay on this machine.
+import os
+import subprocess
+import socket
+import time
+from pathlib import Path
+
+from qencoder.cache import cache_key
+from qencoder.scheduler import SlotLost
+from qencoder.worker import PROTOCOL_VERSION, DEFAULT_PORT, check_ffmpeg, read_message, receive_file, send_file, \
+    send_message, token_digest
+
+# aomenc and vpxenc print "Pass 1/1 frame   10/9 ..." style lines, same as av1an's match_line
+PROGRESS = [r"frame.*?/([^ ]+?) ", ['Pass 2/2', 'Pass 1/1']]
+CONNECT_TIMEOUT = 10
+
+
+class WorkerLost(SlotLost):
+    pass
+
+
+class RemoteJobFailed(Exception):
+    pass
+
+
+def chunk_passes(project, chunk):
+    # The piped commands av1an's make_pipes would run for every pass of the chunk
+    from av1an.encoder import ENCODERS
+    enc = ENCODERS[project.encoder]
+    if project.passes == 1:
+        pairs = enc.compose_1_pass(project, chunk, chunk.output)
+    else:
+        pairs = enc.compose_2_pass(project, chunk, chunk.output)
+    start = 2 if project.reuse_first_pass and project.passes >= 2 else 1
+    passes = []
+    for filterCmd, encCmd in pairs[start - 1:]:
+        if chunk.per_shot_target_quality_cq:
+            encCmd = enc.man_q(encCmd, chunk.per_shot_target_quality_cq)
+        passes.append([list(chunk.ffmpeg_gen_cmd), list(filterCmd), list(encCmd)])
+    return passes
+
+
+def source_key(path):
+    st = os.stat(path)
+    return cache_key([os.path.abspath(path), st.st_size, st.st_mtime_ns])
+
+
+def transfer_job(project, chunk, passes):
+    # Rewrites the commands for a worker without the coordinator's files. Paths in the temp folder
+    # become {scratch}, other existing files become {file:KEY} and are sent unless the worker has them.
+    temp = Path(project.temp).as_posix().rstrip('/') + '/'
+    output = Path(chunk.output).as_posix()
+    files = {}
+    scratchFiles = {}
+    rewritten = []
+    for commands in passes:
+        rewritten.append([])
+        for cmd in commands:
+            args = []
+            for arg in cmd:
+                if arg.startswith(temp) and arg != output and os.path.isfile(arg):
+                    scratchFiles[arg[len(temp):]] = arg
+                if temp in arg:
+                    arg = arg.replace(temp, '{scratch}/')
+                elif arg.startswith('-') or not os.path.isfile(arg):
+                    pass
+                else:
+                    key = source_key(arg)
+                    files[key] = arg
+                    arg = '{file:' + key + '}'
+                args.append(arg)
+            rewritten[-1].append(args)
+    return {'type': 'job', 'passes': rewritten, 'progress': PROGRESS,
+            'files': {key: os.path.getsize(path) for key, path in files.items()},
+            'scratch_files': [[rel, os.path.getsize(path)] for rel, path in scratchFiles.items()],
+            'outputs': [output[len(temp):]]}, files, scratchFiles
+
+
+def shared_job(passes):
+    return {'type': 'job', 'passes': passes, 'progress': PROGRESS, 'files': {},
+            'scratch_files': [], 'outputs': []}
+
+
+def remotable(project):
+    # Workers only run ffmpeg and the encoders, vapoursynth chunks need vspipe
+    if project.encoder not in ('aom', 'vpx') or project.target_quality_method == 'per_frame' or \
+            project.chunk_method in ('vs_lsmash', 'vs_ffms2'):
+        return False
+    # Custom ffmpeg options a worker would refuse keep the item's chunks here
+    try:
+        check_ffmpeg(list(project.ffmpeg), '/', ['/'])
+    except ValueError:
+        return False
+    return True
+
+
+def open_connection(spec):
+    # host[:port] for tcp, ssh://[user@]host[:port] to start a worker over ssh. Returns (rfile, wfile, close).
+    if spec.startswith('ssh://'):
+        target = spec[len('ssh://'):]
+        cmd = ['ssh', '-T', '-o', 'BatchMode=yes']
+        host, _, port = target.partition(':')
+        if port:
+            cmd += ['-p', port]
+        proc = subprocess.Popen(cmd + [host, 'qencoder-worker', '--stdio'], stdin=subprocess.PIPE,
+                                stdout=subprocess.PIPE)
+
+        def close():
+            proc.stdin.close()
+            proc.kill()
+            proc.wait()
+        return proc.stdout, proc.stdin, close
+    host, _, port = spec.rpartition(':')
+    if not host:
+        host, port = spec, DEFAULT_PORT
+    sock = socket.create_connection((host, int(port)), timeout=CONNECT_TIMEOUT)
+    sock.settimeout(None)
+    rfile = sock.makefile('rb')
+    wfile = sock.makefile('wb')
+
+    def close():
+        for f in (rfile, wfile):
+            try:
+                f.close()
+            except OSError:
+                pass
+        sock.close()
+    return rfile, wfile, close
+
+
+class RemoteSlot:
+    # One connection to a worker, running one chunk at a time
+    def __init__(self, spec, token=None, transfer=False):
+        self.spec = spec
+        self.transfer = transfer
+        self.rfile, self.wfile, self.closeConnection = open_connection(spec)
+        try:
+            send_message(self.wfile, {'type': 'hello', 'version': PROTOCOL_VERSION})
+            reply = read_message(self.rfile)
+            if reply.get('type') == 'challenge':
+                send_message(self.wfile, {'type': 'auth', 'digest': token_digest(token or '', reply['nonce'])})
+                reply = read_message(self.rfile)
+        except (OSError, ValueError) as e:
+            self.close()
+            raise ConnectionError("no reply from " + spec + ": " + str(e))
+        if reply.get('type') != 'hello':
+            self.close()
+            raise ConnectionError(spec + " refused the connection: " + str(reply.get('error')))
+        self.slots = reply['slots']
+        self.host = reply.get('host') or spec
+
+    def __str__(self):
+        return "worker " + self.host + " (" + self.spec + ")"
+
+    def close(self):
+        self.closeConnection()
+
+    def encode(self, project, chunk, counter):
+        passes = chunk_passes(project, chunk)
+        if self.transfer:
+            job, files, scratchFiles = transfer_job(project, chunk, passes)
+        else:
+            job, files, scratchFiles = shared_job(passes), {}, {}
+        try:
+            send_message(self.wfile, job)
+            need = read_message(self.rfile)['files']
+            for key in need:
+                send_file(self.wfile, files[key])
+            for rel, _ in job['scratch_files']:
+                send_file(self.wfile, scratchFiles[rel])
+            while True:
+                reply = read_message(self.rfile)
+                if reply['type'] == 'progress':
+                    counter.update(reply['frames'])
+                elif reply['type'] == 'failed':
+                    raise RemoteJobFailed(str(self) + ": " + reply['error'] + "\n" + "\n".join(reply['log']))
+                elif reply['type'] == 'done':
+                    break
+            temp = Path(project.temp)
+            for rel, size in reply['outputs']:
+                receive_file(self.rfile, str(temp / rel), size)
+        except (OSError, ValueError, KeyError) as e:
+            raise WorkerLost(str(e))
+
+
+def connect_workers(specs, token=None, transfer=False):
+    # Opens as many connections to each worker as it has slots. Workers that cannot be reached are skipped.
+    slots = []
+    for spec in specs:
+        try:
+            first = RemoteSlot(spec, token, transfer)
+        except (OSError, ConnectionError) as e:
+            print("Unable to use worker " + spec + ": " + str(e))
+            continue
+        slots.append(first)
+        for i in range(first.slots - 1):
+            try:
+                slots.append(RemoteSlot(spec, token, transfer))
+            except (OSError, ConnectionError) as e:
+                print("Unable to open another connection to " + spec + ": " + str(e))
+                break
+        print("Using " + str(first) + " with " + str(first.slots) + " slots")
+    return slots
+
+
+def remote_encode_chunk(queue, chunk, slot):
+    # av1an's Queue.encode_chunk, with the passes run by a worker instead of locally
+    from av1an.logger import log
+    from av1an.resume import write_progress_file
+    from qencoder.targetquality import per_shot_target_quality_routine
+    project = queue.project
+    restarts = 0
+    while restarts < 3:
+        try:
+            start = time.time()
+            log(f'Enc: {chunk.index}, {chunk.frames} fr on {slot}\n\n')
+            if project.target_quality:
+                per_shot_target_quality_routine(project, chunk)
+            slot.encode(project, chunk, project.counter)
+            encoded = chunk.frames if project.no_check else queue.frame_check_output(chunk, chunk.frames)
+            if encoded == chunk.frames:
+                write_progress_file(Path(project.temp / 'done.json'), chunk, encoded)
+            log(f'Done: {chunk.index} Fr: {encoded}/{chunk.frames} on {slot}\n'
+                f'Time: {round(time.time() - start, 2)} sec.\n\n')
+            return
+        except WorkerLost:
+            raise
+        except Exception as e:
+            msg = f':: Chunk #{chunk.index} crashed with:\n:: Exception: {type(e)}\n {e}\n:: Restarting chunk\n'
+            log(msg + '\n')
+            print(msg)
+            restarts += 1
+    msg = f'::FATAL::\n::Chunk #{chunk.index} failed more than 3 times, shutting down thread\n\n'
+    log(msg)
+    print(msg)
+    queue.status = 'FATAL'
+
+
+def attach_workers(pool, specs, token=None, transfer=False):
+    for slot in connect_workers(specs, token, transfer):
+        pool.add_slot(slot, remotable)
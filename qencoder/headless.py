@@ -0,0 +1,181 @@
+# This Python file uses the following encoding: utf-8
+# Runs a queue without starting Qt. Accepts a saved .eqd queue, or a json/csv manifest
+# listing inputs and outputs which are encoded with a .qec preset (default: the gui's saved settings).
+import argparse
+import csv
+import json
+import os
+
+from qencoder.av1anworkarounds import lsmash_available
+from qencoder.ingest import default_output
+from qencoder.mediaprobe import media_info
+from qencoder.presets import config_path, load_preset, get_args
+from qencoder.queuestore import read_queue_file
+from qencoder.runner import QueueRunner, QueueListener
+from qencoder.scheduler import ORDER_POLICIES
+
+
+def load_eqd(path):
+    return read_queue_file(path)
+
+
+def load_manifest_rows(path):
+    if path.endswith(".csv"):
+        with open(path, newline='') as f:
+            return {'items': list(csv.DictReader(f))}
+    with open(path) as f:
+        data = json.load(f)
+    if isinstance(data, list):
+        return {'items': data}
+    return data
+
+
+def load_manifest(path, presetPath=None):
+    manifest = load_manifest_rows(path)
+    basedir = os.path.dirname(os.path.abspath(path))
+    # Paths from the manifest are relative to it, a --preset given on the command line to the working directory
+    if presetPath:
+        presetPath = os.path.abspath(presetPath)
+    elif manifest.get('preset'):
+        presetPath = os.path.join(basedir, manifest['preset'])
+    else:
+        presetPath = config_path()
+    presets = {}
+    hasLsmash = None
+    encodeList = []
+    for row in manifest['items']:
+        itemPreset = os.path.join(basedir, row['preset']) if row.get('preset') else presetPath
+        if itemPreset not in presets:
+            presets[itemPreset] = load_preset(itemPreset)
+        preset = presets[itemPreset]
+        if preset['usinglsmas'] and hasLsmash is None:
+            hasLsmash = lsmash_available()
+        inputPath = os.path.join(basedir, row['input'])
+        outputPath = row.get('output') or default_output(inputPath)
+        outputPath = os.path.join(basedir, outputPath)
+        encodeList.append([get_args(preset, inputPath, outputPath, bool(hasLsmash), media_info(inputPath)), preset])
+    return encodeList, manifest.get('qjobs')
+
+
+class HeadlessListener(QueueListener):
+    def __init__(self, encodeList):
+        self.encodeList = encodeList
+        self.currentFrames = [0] * len(encodeList)
+        self.totalFrames = [(q[0].get('media_info') or {}).get('frames', 0) for q in encodeList]
+        self.lastPercent = [-1] * len(encodeList)
+        self.chunks = [""] * len(encodeList)
+        self.failed = 0
+
+    def describe(self, index):
+        q = self.encodeList[index]
+        return "[" + str(index + 1) + "/" + str(len(self.encodeList)) + "] " + \
+               str(q[0]['input'][0].parts[-1]) + " -> " + str(q[0]['output_file'].parts[-1])
+
+    def report(self, index):
+        if self.totalFrames[index] <= 0:
+            return
+        percent = int(100 * self.currentFrames[index] / self.totalFrames[index])
+        if percent != self.lastPercent[index]:
+            self.lastPercent[index] = percent
+            print(self.describe(index) + ": encoding " + str(self.currentFrames[index]) + "/" +
+                  str(self.totalFrames[index]) + " (" + str(percent) + "%)" + self.chunks[index], flush=True)
+
+    def new_task(self, index, taskDesc, taskFrames):
+        print(self.describe(index) + ": " + taskDesc, flush=True)
+
+    def start_encode(self, index, totalFrames, initFrames):
+        self.totalFrames[index] = totalFrames
+        self.currentFrames[index] = initFrames
+        self.report(index)
+
+    def new_frames(self, index, addFrames):
+        self.currentFrames[index] += addFrames
+        self.report(index)
+
+    def chunk_done(self, index, doneChunks, totalChunks):
+        self.chunks[index] = ", " + str(doneChunks) + "/" + str(totalChunks) + " chunks"
+
+    def encode_finished(self, index, errorCode):
+        if index == -1:
+            return
+        if errorCode != 0:
+            self.failed += 1
+        print(self.describe(index) + ": " + ("complete", "failed", "cancelled")[errorCode], flush=True)
+
+
+def parse_args(argv):
+    parser = argparse.ArgumentParser(prog="qencoder --headless",
+                                     description="Encode a queue without starting the gui.")
+    parser.add_argument("--headless", action="store_true", help=argparse.SUPPRESS)
+    parser.add_argument("queue", help="saved queue (.eqd) or manifest (.json or .csv with input,output[,preset] columns)")
+    parser.add_argument("--preset", help="preset (.qec) used for manifest items. Defaults to the gui's saved settings")
+    parser.add_argument("--qjobs", type=int, help="queue items to encode simultaneously")
+    parser.add_argument("--core-budget", type=int,
+                        help="cpu threads shared by all running items (default: all logical cores)")
+    parser.add_argument("--prefetch", type=int, default=2,
+                        help="queue items to run scene detection for ahead of time (0 to disable)")
+    parser.add_argument("--parallel-scenes", action="store_true",
+                        help="split long inputs into ranges and run pyscenedetect on them in parallel")
+    parser.add_argument("--adaptive-workers", type=int, nargs=2, metavar=("MIN", "MAX"),
+                        help="follow the cpu load, running between MIN and MAX chunks at once. Defaults to the "
+                             "preset's setting")
+    parser.add_argument("--memory-reserve", type=int, metavar="MIB",
+                        help="memory to keep free, new chunks wait while less is available "
+                             "(default: 5%% of the system's memory, at least 512)")
+    parser.add_argument("--remote", action="append", default=[], metavar="WORKER",
+                        help="also encode chunks on a qencoder-worker, as host[:port] or ssh://[user@]host[:port]. "
+                             "Can be given several times")
+    parser.add_argument("--remote-token", default=os.environ.get('QENCODER_WORKER_TOKEN'),
+                        help="token the workers were started with (default: $QENCODER_WORKER_TOKEN)")
+    parser.add_argument("--remote-transfer", action="store_true",
+                        help="send inputs to the workers and fetch the encoded chunks back, for workers that do not "
+                             "see the same files at the same paths")
+    parser.add_argument("--metrics-dir",
+                        help="write each item's stage timings here (default: its temp folder if kept, else next to "
+                             "the output)")
+    parser.add_argument("--prometheus-textfile", metavar="FILE",
+                        help="keep stage timings of the finished items in this file in Prometheus text format, "
+                             "for node_exporter's textfile collector")
+    parser.add_argument("--order", choices=ORDER_POLICIES,
+                        help="order to start items in: manual (queue order), lpt (longest first, finishes the "
+                             "whole queue soonest) or spt (shortest first). Defaults to the preset's setting")
+    return parser.parse_args(argv)
+
+
+def main(argv):
+    args = parse_args(argv)
+    if args.queue.endswith(".eqd"):
+        encodeList = load_eqd(args.queue)
+        qjobs = None
+    else:
+        encodeList, qjobs = load_manifest(args.queue, args.preset)
+    if len(encodeList) == 0:
+        print("Nothing to encode in " + args.queue)
+        return 0
+    if args.parallel_scenes:
+        for q in encodeList:
+            q[0]['parallel_scenes'] = True
+    qjobs = args.qjobs or qjobs or encodeList[0][1].get('qjobs', 1)
+    order = args.order or ORDER_POLICIES[encodeList[0][1].get('qorder', 0)]
+    adaptive = args.adaptive_workers
+    if adaptive is None and encodeList[0][1].get('adaptive', False):
+        adaptive = (encodeList[0][1]['adaptivemin'], encodeList[0][1]['adaptivemax'])
+    if order != 'manual':
+        # Queues saved by older versions have no probed sizes
+        for q in encodeList:
+            if 'media_info' not in q[0]:
+                q[0]['media_info'] = media_info(q[0]['input'][0])
+    print("Encoding " + str(len(encodeList)) + " queue items, " + str(qjobs) + " at a time", flush=True)
+    listener = HeadlessListener(encodeList)
+    if all(listener.totalFrames):
+        print("Total: " + str(sum(listener.totalFrames)) + " frames", flush=True)
+    runner = QueueRunner(encodeList, qjobs, listener, coreBudget=args.core_budget, prefetch=args.prefetch,
+                         order=order, remotes=args.remote, remoteToken=args.remote_token,
+                         remoteTransfer=args.remote_transfer,
+                         memoryReserve=(args.memory_reserve << 20 if args.memory_reserve is not None else None),
+                         adaptive=adaptive, metricsDir=args.metrics_dir, prometheusPath=args.prometheus_textfile)
+    try:
+        runner.run()
+    except KeyboardInterrupt:
+        return 130
+    return 1 if listener.failed else 0
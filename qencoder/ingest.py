@@ -0,0 +1,117 @@
+# This Python file uses the following encoding: utf-8
+# Adds a whole folder tree to the queue. The tree is walked lazily with os.scandir while a pool of
+# threads runs ffprobe on the files found so far, and finished items are handed over in batches.
+# Nothing here touches Qt, the gui runs it on a thread and headless could call it directly.
+import collections
+import concurrent.futures
+import os
+import subprocess
+
+from qencoder.mediaprobe import cached_probe
+
+VIDEO_EXTENSIONS = ('.mkv', '.mp4', '.webm', '.y4m', '.avi', '.mov', '.m4v', '.ts', '.m2ts', '.mts', '.mpg',
+                    '.mpeg', '.wmv', '.flv', '.ogv')
+
+
+def default_output(inputPath, outputDir=None):
+    dirn, fname = os.path.split(inputPath)
+    if outputDir is None or os.path.abspath(outputDir) == os.path.abspath(dirn):
+        fname = "enc_" + fname
+        outputDir = dirn
+    if not fname.endswith(".mkv") and not fname.endswith(".webm"):
+        fname = fname + ".mkv"
+    return os.path.join(outputDir, fname)
+
+
+def output_for(root, inputPath, outputDir):
+    # Files in subfolders keep their subfolder below the output folder
+    relDir = os.path.relpath(os.path.dirname(inputPath), root)
+    return default_output(inputPath, os.path.normpath(os.path.join(outputDir, relDir)))
+
+
+def walk_videos(root, skipDirs=()):
+    skipDirs = set(os.path.abspath(d) for d in skipDirs)
+    pending = [root]
+    while pending:
+        folder = pending.pop()
+        try:
+            with os.scandir(folder) as it:
+                entries = sorted(it, key=lambda e: e.name)
+        except OSError:
+            continue
+        subdirs = []
+        for entry in entries:
+            try:
+                if entry.is_dir(follow_symlinks=False):
+                    if os.path.abspath(entry.path) not in skipDirs and not entry.name.startswith("temp_"):
+                        subdirs.append(entry.path)
+                elif entry.is_file() and entry.name.lower().endswith(VIDEO_EXTENSIONS):
+                    yield entry.path
+            except OSError:
+                continue
+        pending.extend(reversed(subdirs))
+
+
+def probe_or_none(path):
+    # Returns (accept, info)
+    try:
+        info = cached_probe(path)
+        return info is not None, info
+    except OSError:
+        # No ffprobe, go by the file extension alone
+        return True, None
+    except (subprocess.SubprocessError, ValueError):
+        return False, None
+
+
+def ingest_folder(root, outputDir, make_item, on_batch, on_progress=None, cancelled=None, workers=None,
+                  batchSize=50):
+    # make_item(inputPath, outputPath, info) returns a queue item. Files without a video stream, files
+    # qencoder itself wrote (enc_ prefix in the same folder) and inputs whose output exists are skipped.
+    # Returns (added, skipped).
+    cancelled = cancelled or (lambda: False)
+    workers = workers or min(16, (os.cpu_count() or 1) * 2)
+    sameFolder = os.path.abspath(root) == os.path.abspath(outputDir)
+    skipDirs = [] if sameFolder else [outputDir]
+    added = 0
+    skipped = 0
+    batch = []
+    inFlight = collections.deque()
+
+    def collect(limit):
+        nonlocal added, skipped
+        # Results are taken in walk order so the queue order does not depend on probe timing. Waits
+        # until at most limit probes are left, then takes whatever else is already done.
+        while inFlight and (len(inFlight) > limit or inFlight[0][2].done()):
+            path, output, future = inFlight.popleft()
+            accept, info = future.result()
+            if accept:
+                os.makedirs(os.path.dirname(output), exist_ok=True)
+                batch.append(make_item(path, output, info))
+                added += 1
+            else:
+                skipped += 1
+            if len(batch) >= batchSize:
+                on_batch(list(batch))
+                batch.clear()
+            if on_progress is not None:
+                on_progress(added, skipped)
+
+    with concurrent.futures.ThreadPoolExecutor(max_workers=workers) as executor:
+        for path in walk_videos(root, skipDirs):
+            if cancelled():
+                break
+            output = output_for(root, path, outputDir)
+            if (sameFolder and os.path.basename(path).startswith("enc_")) or os.path.exists(output):
+                skipped += 1
+                continue
+            inFlight.append((path, output, executor.submit(probe_or_none, path)))
+            collect(workers * 4)
+        if cancelled():
+            for _, _, future in inFlight:
+                future.cancel()
+            inFlight.clear()
+        collect(0)
+    if batch:
+        on_batch(list(batch))
+    return added, skipped
@@ -294,6 +294,24 @@ class Ui_qencoder(object):
         self.doubleSpinBox_split.setProperty("value", 0.3)
         self.doubleSpinBox_split.setObjectName("doubleSpinBox_split")
         self.gridLayout.addWidget(self.doubleSpinBox_split, 1, 1, 1, 1)
+        self.label_tilecols = QtWidgets.QLabel(self.tab_advanced)
+        self.label_tilecols.setObjectName("label_tilecols")
+        self.gridLayout.addWidget(self.label_tilecols, 7, 0, 1, 1)
+        self.spinBox_tilecols = QtWidgets.QSpinBox(self.tab_advanced)
+        self.spinBox_tilecols.setMinimum(-1)
+        self.spinBox_tilecols.setMaximum(6)
+        self.spinBox_tilecols.setProperty("value", -1)
+        self.spinBox_tilecols.setObjectName("spinBox_tilecols")
+        self.gridLayout.addWidget(self.spinBox_tilecols, 7, 1, 1, 1)
+        self.label_tilerows = QtWidgets.QLabel(self.tab_advanced)
+        self.label_tilerows.setObjectName("label_tilerows")
+        self.gridLayout.addWidget(self.label_tilerows, 7, 3, 1, 1)
+        self.spinBox_tilerows = QtWidgets.QSpinBox(self.tab_advanced)
+        self.spinBox_tilerows.setMinimum(-1)
+        self.spinBox_tilerows.setMaximum(6)
+        self.spinBox_tilerows.setProperty("value", -1)
+        self.spinBox_tilerows.setObjectName("spinBox_tilerows")
+        self.gridLayout.addWidget(self.spinBox_tilerows, 7, 4, 1, 1)
         self.gridLayout_5.addLayout(self.gridLayout, 1, 0, 1, 1)
         self.tabWidget.addTab(self.tab_advanced, "")
         self.tab_dimensions = QtWidgets.QWidget()
@@ -394,13 +412,16 @@ class Ui_qencoder(object):
         self.spinBox_vmafsteps.setObjectName("spinBox_vmafsteps")
         self.gridLayout_11.addWidget(self.spinBox_vmafsteps, 0, 7, 1, 1)
         spacerItem9 = QtWidgets.QSpacerItem(20, 40, QtWidgets.QSizePolicy.Minimum, QtWidgets.QSizePolicy.Expanding)
-        self.gridLayout_11.addItem(spacerItem9, 4, 0, 1, 1)
+        self.gridLayout_11.addItem(spacerItem9, 5, 0, 1, 1)
         self.checkBox_shutdown = QtWidgets.QCheckBox(self.tab_experimental)
         self.checkBox_shutdown.setObjectName("checkBox_shutdown")
         self.gridLayout_11.addWidget(self.checkBox_shutdown, 3, 0, 1, 4)
         self.checkBox_lsmash = QtWidgets.QCheckBox(self.tab_experimental)
         self.checkBox_lsmash.setObjectName("checkBox_lsmash")
         self.gridLayout_11.addWidget(self.checkBox_lsmash, 3, 4, 1, 4)
+        self.checkBox_parallelsd = QtWidgets.QCheckBox(self.tab_experimental)
+        self.checkBox_parallelsd.setObjectName("checkBox_parallelsd")
+        self.gridLayout_11.addWidget(self.checkBox_parallelsd, 3, 8, 1, 3)
         spacerItem10 = QtWidgets.QSpacerItem(40, 20, QtWidgets.QSizePolicy.Expanding, QtWidgets.QSizePolicy.Minimum)
         self.gridLayout_11.addItem(spacerItem10, 0, 5, 1, 1)
         self.doubleSpinBox_vmaf = QtWidgets.QDoubleSpinBox(self.tab_experimental)
@@ -438,6 +459,54 @@ class Ui_qencoder(object):
         self.label_maxq.setEnabled(False)
         self.label_maxq.setObjectName("label_maxq")
         self.gridLayout_11.addWidget(self.label_maxq, 1, 3, 1, 1)
+        self.label_tqsearch = QtWidgets.QLabel(self.tab_experimental)
+        self.label_tqsearch.setEnabled(False)
+        self.label_tqsearch.setObjectName("label_tqsearch")
+        self.gridLayout_11.addWidget(self.label_tqsearch, 1, 6, 1, 1)
+        self.comboBox_tqsearch = QtWidgets.QComboBox(self.tab_experimental)
+        self.comboBox_tqsearch.setEnabled(False)
+        self.comboBox_tqsearch.setObjectName("comboBox_tqsearch")
+        self.comboBox_tqsearch.addItem("")
+        self.comboBox_tqsearch.addItem("")
+        self.gridLayout_11.addWidget(self.comboBox_tqsearch, 1, 7, 1, 1)
+        self.label_proberate = QtWidgets.QLabel(self.tab_experimental)
+        self.label_proberate.setEnabled(False)
+        self.label_proberate.setObjectName("label_proberate")
+        self.gridLayout_11.addWidget(self.label_proberate, 2, 0, 1, 1)
+        self.spinBox_proberatemin = QtWidgets.QSpinBox(self.tab_experimental)
+        self.spinBox_proberatemin.setEnabled(False)
+        self.spinBox_proberatemin.setMinimum(1)
+        self.spinBox_proberatemin.setMaximum(64)
+        self.spinBox_proberatemin.setProperty("value", 2)
+        self.spinBox_proberatemin.setObjectName("spinBox_proberatemin")
+        self.gridLayout_11.addWidget(self.spinBox_proberatemin, 2, 1, 1, 1)
+        self.spinBox_proberatemax = QtWidgets.QSpinBox(self.tab_experimental)
+        self.spinBox_proberatemax.setEnabled(False)
+        self.spinBox_proberatemax.setMinimum(1)
+        self.spinBox_proberatemax.setMaximum(64)
+        self.spinBox_proberatemax.setProperty("value", 8)
+        self.spinBox_proberatemax.setObjectName("spinBox_proberatemax")
+        self.gridLayout_11.addWidget(self.spinBox_proberatemax, 2, 2, 1, 1)
+        self.checkBox_adaptive = QtWidgets.QCheckBox(self.tab_experimental)
+        self.checkBox_adaptive.setObjectName("checkBox_adaptive")
+        self.gridLayout_11.addWidget(self.checkBox_adaptive, 4, 0, 1, 4)
+        self.spinBox_adaptivemin = QtWidgets.QSpinBox(self.tab_experimental)
+        self.spinBox_adaptivemin.setEnabled(False)
+        self.spinBox_adaptivemin.setMinimum(1)
+        self.spinBox_adaptivemin.setMaximum(256)
+        self.spinBox_adaptivemin.setProperty("value", 1)
+        self.spinBox_adaptivemin.setObjectName("spinBox_adaptivemin")
+        self.gridLayout_11.addWidget(self.spinBox_adaptivemin, 4, 4, 1, 1)
+        self.label_adaptiveto = QtWidgets.QLabel(self.tab_experimental)
+        self.label_adaptiveto.setObjectName("label_adaptiveto")
+        self.gridLayout_11.addWidget(self.label_adaptiveto, 4, 6, 1, 1)
+        self.spinBox_adaptivemax = QtWidgets.QSpinBox(self.tab_experimental)
+        self.spinBox_adaptivemax.setEnabled(False)
+        self.spinBox_adaptivemax.setMinimum(1)
+        self.spinBox_adaptivemax.setMaximum(256)
+        self.spinBox_adaptivemax.setProperty("value", 64)
+        self.spinBox_adaptivemax.setObjectName("spinBox_adaptivemax")
+        self.gridLayout_11.addWidget(self.spinBox_adaptivemax, 4, 7, 1, 1)
         self.tabWidget.addTab(self.tab_experimental, "")
         self.tab_custom = QtWidgets.QWidget()
         self.tab_custom.setObjectName("tab_custom")
@@ -501,9 +570,10 @@ class Ui_qencoder(object):
         self.label_queueprog.setText("")
         self.label_queueprog.setObjectName("label_queueprog")
         self.gridLayout_8.addWidget(self.label_queueprog, 0, 1, 1, 1)
-        self.listWidget = QtWidgets.QListWidget(self.tab_queue)
-        self.listWidget.setObjectName("listWidget")
-        self.gridLayout_8.addWidget(self.listWidget, 1, 0, 1, 8)
+        self.listView_queue = QtWidgets.QListView(self.tab_queue)
+        self.listView_queue.setUniformItemSizes(True)
+        self.listView_queue.setObjectName("listView_queue")
+        self.gridLayout_8.addWidget(self.listView_queue, 1, 0, 1, 8)
         self.spinBox_qjobs = QtWidgets.QSpinBox(self.tab_queue)
         self.spinBox_qjobs.setMinimum(1)
         self.spinBox_qjobs.setMaximum(128)
@@ -512,6 +582,19 @@ class Ui_qencoder(object):
         self.label_qjobs = QtWidgets.QLabel(self.tab_queue)
         self.label_qjobs.setObjectName("label_qjobs")
         self.gridLayout_8.addWidget(self.label_qjobs, 2, 0, 1, 1)
+        self.pushButton_cancelitem = QtWidgets.QPushButton(self.tab_queue)
+        self.pushButton_cancelitem.setEnabled(False)
+        self.pushButton_cancelitem.setObjectName("pushButton_cancelitem")
+        self.gridLayout_8.addWidget(self.pushButton_cancelitem, 2, 5, 1, 1)
+        self.label_qorder = QtWidgets.QLabel(self.tab_queue)
+        self.label_qorder.setObjectName("label_qorder")
+        self.gridLayout_8.addWidget(self.label_qorder, 2, 3, 1, 1)
+        self.comboBox_qorder = QtWidgets.QComboBox(self.tab_queue)
+        self.comboBox_qorder.setObjectName("comboBox_qorder")
+        self.comboBox_qorder.addItem("")
+        self.comboBox_qorder.addItem("")
+        self.comboBox_qorder.addItem("")
+        self.gridLayout_8.addWidget(self.comboBox_qorder, 2, 4, 1, 1)
         self.tabWidget.addTab(self.tab_queue, "")
         self.gridLayout_3.addWidget(self.tabWidget, 2, 0, 1, 4)
         qencoder.setCentralWidget(self.centralwidget)
@@ -548,6 +631,12 @@ class Ui_qencoder(object):
         self.actionReset_All_Settings.setObjectName("actionReset_All_Settings")
         self.actionAdd_folder_to_queue = QtWidgets.QAction(qencoder)
         self.actionAdd_folder_to_queue.setObjectName("actionAdd_folder_to_queue")
+        self.actionAutotune = QtWidgets.QAction(qencoder)
+        self.actionAutotune.setObjectName("actionAutotune")
+        self.actionUse_autotune = QtWidgets.QAction(qencoder)
+        self.actionUse_autotune.setCheckable(True)
+        self.actionUse_autotune.setChecked(True)
+        self.actionUse_autotune.setObjectName("actionUse_autotune")
         self.menuFile.addAction(self.actionOpen)
         self.menuFile.addAction(self.actionSave)
         self.menuFile.addSeparator()
@@ -555,6 +644,9 @@ class Ui_qencoder(object):
         self.menuPreset.addAction(self.actionOpen_Preset)
         self.menuPreset.addAction(self.actionSave_Preset)
         self.menuPreset.addAction(self.actionReset_All_Settings)
+        self.menuPreset.addSeparator()
+        self.menuPreset.addAction(self.actionAutotune)
+        self.menuPreset.addAction(self.actionUse_autotune)
         self.menuQueue.addAction(self.actionOpen_Queue)
         self.menuQueue.addAction(self.actionSave_Queue)
         self.menuQueue.addAction(self.actionSave_Queue_As)
@@ -628,6 +720,14 @@ class Ui_qencoder(object):
         self.checkBox_bitrate.setText(_translate("qencoder", "Use Bitrate"))
         self.label_threads.setStatusTip(_translate("qencoder", "Fewer threads per job and more jobs is usually recommended."))
         self.label_threads.setText(_translate("qencoder", "Threads Per Job"))
+        self.label_tilecols.setStatusTip(_translate("qencoder", "Log2 of the tile columns and rows for aomenc and vp9. Auto picks them from the output resolution and threads per job."))
+        self.label_tilecols.setText(_translate("qencoder", "Tile Columns"))
+        self.spinBox_tilecols.setStatusTip(_translate("qencoder", "Log2 of the tile columns and rows for aomenc and vp9. Auto picks them from the output resolution and threads per job."))
+        self.spinBox_tilecols.setSpecialValueText(_translate("qencoder", "auto"))
+        self.label_tilerows.setStatusTip(_translate("qencoder", "Log2 of the tile columns and rows for aomenc and vp9. Auto picks them from the output resolution and threads per job."))
+        self.label_tilerows.setText(_translate("qencoder", "Tile Rows"))
+        self.spinBox_tilerows.setStatusTip(_translate("qencoder", "Log2 of the tile columns and rows for aomenc and vp9. Auto picks them from the output resolution and threads per job."))
+        self.spinBox_tilerows.setSpecialValueText(_translate("qencoder", "auto"))
         self.label_6.setStatusTip(_translate("qencoder", "Encoder speed preset. Lower means a slower speed. Does not affect actual cpu usage."))
         self.label_6.setText(_translate("qencoder", "cpu-used (speed)"))
         self.spinBox_speed.setStatusTip(_translate("qencoder", "Encoder speed preset. Lower means a slower speed. Does not affect actual cpu usage."))
@@ -701,12 +801,28 @@ class Ui_qencoder(object):
         self.checkBox_shutdown.setText(_translate("qencoder", "Shutdown after completion"))
         self.checkBox_lsmash.setStatusTip(_translate("qencoder", "Recommended if possible. Requires vapoursynth, lsmash. Uses more ram, but otherwise better."))
         self.checkBox_lsmash.setText(_translate("qencoder", "use vs+lsmash for splits"))
+        self.checkBox_parallelsd.setStatusTip(_translate("qencoder", "Splits long inputs into ranges and runs pyscenedetect on all of them at once. Uses one process per range."))
+        self.checkBox_parallelsd.setText(_translate("qencoder", "parallel scene detection"))
         self.doubleSpinBox_vmaf.setStatusTip(_translate("qencoder", "Percent visual fidelity compared to source video to target. Recommended range: 80-99"))
         self.pushButton_vmafmodel.setStatusTip(_translate("qencoder", "Select model file to use for vmaf analysis."))
         self.pushButton_vmafmodel.setText(_translate("qencoder", "Choose Model"))
         self.label_target.setStatusTip(_translate("qencoder", "Percent visual fidelity compared to source video to target. Recommended range: 80-99"))
         self.label_target.setText(_translate("qencoder", "Target"))
         self.label_maxq.setText(_translate("qencoder", "max crf"))
+        self.label_tqsearch.setStatusTip(_translate("qencoder", "How the crf for each scene is searched. Curve fit usually needs fewer test encodes."))
+        self.label_tqsearch.setText(_translate("qencoder", "Search"))
+        self.comboBox_tqsearch.setStatusTip(_translate("qencoder", "How the crf for each scene is searched. Curve fit usually needs fewer test encodes."))
+        self.comboBox_tqsearch.setItemText(0, _translate("qencoder", "binary search"))
+        self.comboBox_tqsearch.setItemText(1, _translate("qencoder", "curve fit"))
+        self.label_proberate.setStatusTip(_translate("qencoder", "Test encodes use every Nth frame. Long or static scenes use up to max, short or busy ones down to min."))
+        self.label_proberate.setText(_translate("qencoder", "Probe rate"))
+        self.spinBox_proberatemin.setStatusTip(_translate("qencoder", "Test encodes use every Nth frame. Long or static scenes use up to max, short or busy ones down to min."))
+        self.spinBox_proberatemax.setStatusTip(_translate("qencoder", "Test encodes use every Nth frame. Long or static scenes use up to max, short or busy ones down to min."))
+        self.checkBox_adaptive.setStatusTip(_translate("qencoder", "Watches cpu usage while encoding and runs between min and max chunks at once, fewer when other programs are busy and more when cores sit idle."))
+        self.checkBox_adaptive.setText(_translate("qencoder", "adapt chunks to cpu load"))
+        self.spinBox_adaptivemin.setStatusTip(_translate("qencoder", "Watches cpu usage while encoding and runs between min and max chunks at once, fewer when other programs are busy and more when cores sit idle."))
+        self.label_adaptiveto.setText(_translate("qencoder", "to"))
+        self.spinBox_adaptivemax.setStatusTip(_translate("qencoder", "Watches cpu usage while encoding and runs between min and max chunks at once, fewer when other programs are busy and more when cores sit idle."))
         self.tabWidget.setTabText(self.tabWidget.indexOf(self.tab_experimental), _translate("qencoder", "Experimental"))
         self.tab_custom.setStatusTip(_translate("qencoder", "Set custom command options"))
         self.label_3.setText(_translate("qencoder", "Warning! Checking these custom boxes can override some simple/advanced settings"))
@@ -723,6 +839,14 @@ class Ui_qencoder(object):
         self.spinBox_qjobs.setStatusTip(_translate("qencoder", "Number of items from the queue to encode simultaneously."))
         self.label_qjobs.setStatusTip(_translate("qencoder", "Number of items from the queue to encode simultaneously."))
         self.label_qjobs.setText(_translate("qencoder", "Queue jobs:"))
+        self.pushButton_cancelitem.setStatusTip(_translate("qencoder", "Stop encoding the selected item. Other items keep running and its progress is kept for resuming."))
+        self.pushButton_cancelitem.setText(_translate("qencoder", "✖  cancel item"))
+        self.label_qorder.setStatusTip(_translate("qencoder", "Order queue items are started in. Longest first finishes the whole queue soonest when several items run at once."))
+        self.label_qorder.setText(_translate("qencoder", "Order:"))
+        self.comboBox_qorder.setStatusTip(_translate("qencoder", "Order queue items are started in. Longest first finishes the whole queue soonest when several items run at once."))
+        self.comboBox_qorder.setItemText(0, _translate("qencoder", "queue order"))
+        self.comboBox_qorder.setItemText(1, _translate("qencoder", "longest first"))
+        self.comboBox_qorder.setItemText(2, _translate("qencoder", "shortest first"))
         self.tabWidget.setTabText(self.tabWidget.indexOf(self.tab_queue), _translate("qencoder", "Queue"))
         self.menuFile.setTitle(_translate("qencoder", "File"))
         self.menuPreset.setTitle(_translate("qencoder", "Preset"))
@@ -740,3 +864,7 @@ class Ui_qencoder(object):
         self.actionSave_Queue_As.setText(_translate("qencoder", "Save Queue As"))
         self.actionReset_All_Settings.setText(_translate("qencoder", "Reset All Settings"))
         self.actionAdd_folder_to_queue.setText(_translate("qencoder", "Add folder to queue"))
+        self.actionAutotune.setText(_translate("qencoder", "Autotune jobs and threads"))
+        self.actionAutotune.setStatusTip(_translate("qencoder", "Encodes a short sample of the input video with several jobs and threads splits and keeps the fastest for this encoder, speed and resolution."))
+        self.actionUse_autotune.setText(_translate("qencoder", "Use autotuned jobs and threads"))
+        self.actionUse_autotune.setStatusTip(_translate("qencoder", "Encodes with the autotuned jobs and threads when there is a result for the encoder, speed and resolution, instead of the advanced tab's."))
@@ -0,0 +1,89 @@
+# This Python file uses the following encoding: utf-8
+# Reads stream information of input files with ffprobe. Only container and stream headers are
+# read, nothing is decoded, so this takes milliseconds per file. Results are cached on disk by
+# path, size and modification time so each input is only probed once.
+import json
+import os
+import subprocess
+
+from qencoder.cache import cache_dir, cache_key
+
+PROBE_VERSION = 1
+
+
+def parse_rate(rate):
+    num, _, den = str(rate).partition('/')
+    try:
+        num = float(num)
+        den = float(den or 1)
+    except ValueError:
+        return 0.0
+    return num / den if den else 0.0
+
+
+def probe_media(path):
+    # Returns a dict describing the first video stream, or None if the file has no video.
+    # Raises OSError if ffprobe cannot be run and CalledProcessError if it cannot read the file.
+    out = subprocess.run(['ffprobe', '-v', 'error', '-show_entries',
+                          'format=duration:stream=codec_type,codec_name,width,height,pix_fmt,r_frame_rate,'
+                          'avg_frame_rate,nb_frames,duration,color_space,color_primaries,color_transfer,'
+                          'color_range:stream_tags=NUMBER_OF_FRAMES,NUMBER_OF_FRAMES-eng,DURATION',
+                          '-of', 'json', str(path)],
+                         stdout=subprocess.PIPE, stderr=subprocess.DEVNULL, check=True,
+                         universal_newlines=True).stdout
+    data = json.loads(out)
+    video = [s for s in data.get('streams', []) if s.get('codec_type') == 'video']
+    # Cover art and other single pictures show up as video streams too
+    video = [s for s in video if s.get('codec_name') not in ('mjpeg', 'png', 'bmp', 'gif')]
+    if not video:
+        return None
+    stream = video[0]
+    tags = stream.get('tags', {})
+    fps = parse_rate(stream.get('avg_frame_rate')) or parse_rate(stream.get('r_frame_rate'))
+    try:
+        duration = float(stream.get('duration') or data.get('format', {}).get('duration') or 0)
+    except ValueError:
+        duration = 0.0
+    frames = stream.get('nb_frames') or tags.get('NUMBER_OF_FRAMES') or tags.get('NUMBER_OF_FRAMES-eng')
+    if frames and str(frames).isdigit():
+        frames = int(frames)
+    else:
+        # mkv and webm rarely store a frame count, so estimate it from the duration
+        frames = int(round(duration * fps))
+    return {'codec': stream.get('codec_name'), 'width': stream.get('width', 0), 'height': stream.get('height', 0),
+            'pix_fmt': stream.get('pix_fmt', ''), 'fps': fps, 'duration': duration, 'frames': frames,
+            'color_space': stream.get('color_space', ''), 'color_primaries': stream.get('color_primaries', ''),
+            'color_transfer': stream.get('color_transfer', ''), 'color_range': stream.get('color_range', '')}
+
+
+def media_cache_path(path):
+    st = os.stat(path)
+    return os.path.join(cache_dir('media'),
+                        cache_key([PROBE_VERSION, os.path.abspath(path), st.st_size, st.st_mtime_ns]) + '.json')
+
+
+def cached_probe(path):
+    # Same as probe_media but reads and writes the media cache
+    cachePath = media_cache_path(path)
+    try:
+        with open(cachePath) as f:
+            return json.load(f)['info']
+    except (OSError, ValueError, KeyError):
+        pass
+    info = probe_media(path)
+    partial = cachePath + '.' + str(os.getpid()) + '.part'
+    try:
+        with open(partial, 'w') as f:
+            json.dump({'info': info}, f)
+        os.replace(partial, cachePath)
+    except OSError as e:
+        print("Unable to write the media cache: " + str(e))
+    return info
+
+
+def media_info(path):
+    # For filling in queue items, None if the file could not be probed for any reason
+    try:
+        return cached_probe(path)
+    except (OSError, subprocess.SubprocessError, ValueError):
+        return None
@@ -0,0 +1,134 @@
+# This Python file uses the following encoding: utf-8
+# Wall time of each stage of an encode, to find out what limits throughput on a machine.
+# Stages run one after the other, so their times add up to the job's wall time. Chunk encodes and
+# target quality probes run in parallel, they are reported as busy time summed over all chunks.
+# Every job gets a json summary, and a Prometheus textfile with the latest job per output can be kept too.
+import json
+import os
+import threading
+import time
+from contextlib import contextmanager
+
+STAGES = ['scenes', 'split', 'audio', 'encode', 'concat']
+STATUS = ('complete', 'failed', 'cancelled')
+
+
+class StageTimer:
+    def __init__(self):
+        self.started = time.time()
+        self.start = time.perf_counter()
+        self.stages = {}
+        self.busy = {}
+        self.lock = threading.Lock()
+
+    @contextmanager
+    def stage(self, name):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.add(self.stages, name, time.perf_counter() - start)
+
+    def add_busy(self, name, seconds):
+        self.add(self.busy, name, seconds)
+
+    def add(self, table, name, seconds):
+        with self.lock:
+            table[name] = table.get(name, 0.0) + seconds
+
+    def summary(self, dictargs, errorCode, frames, totalFrames, chunks, workers, progress=None):
+        # progress is the ResumeTracker snapshot, chunks done in this run and earlier ones that can be resumed
+        wall = time.perf_counter() - self.start
+        stages = {name: round(self.stages.get(name, 0.0), 3) for name in STAGES}
+        stages['other'] = round(max(0.0, wall - sum(self.stages.values())), 3)
+        encode = self.stages.get('encode', 0.0)
+        return {'input': str(dictargs['input'][0]), 'output': str(dictargs['output_file']),
+                'status': STATUS[errorCode], 'started': time.strftime('%Y-%m-%dT%H:%M:%S', time.localtime(self.started)),
+                'wall': round(wall, 3), 'stages': stages,
+                'busy': {name: round(seconds, 3) for name, seconds in self.busy.items()},
+                'frames': frames, 'total_frames': totalFrames, 'fps': round(frames / encode, 3) if encode else 0.0,
+                'chunks': chunks, 'workers': workers, 'threads': dictargs['threads'],
+                'encoder': dictargs['encoder'], 'split_method': dictargs['split_method'],
+                'done_chunks': progress['done_chunks'] if progress else 0,
+                'total_chunks': progress['total_chunks'] if progress else 0,
+                'done_frames': progress['done_frames'] if progress else 0,
+                'done': progress['chunks'] if progress else {}}
+
+
+def record_busy(project, name, seconds):
+    timer = getattr(project, 'stage_timer', None)
+    if timer is not None:
+        timer.add_busy(name, seconds)
+
+
+@contextmanager
+def timed_stage(project, name):
+    timer = getattr(project, 'stage_timer', None)
+    if timer is None:
+        yield
+        return
+    with timer.stage(name):
+        yield
+
+
+def summary_path(dictargs, metricsDir=None):
+    # In metricsDir if given, else in the temp folder if it was kept, else next to the output
+    output = str(dictargs['output_file'])
+    if metricsDir:
+        return os.path.join(metricsDir, os.path.basename(output) + '.stages.json')
+    if os.path.isdir(str(dictargs['temp'])):
+        return os.path.join(str(dictargs['temp']), 'stages.json')
+    return output + '.stages.json'
+
+
+def write_atomic(path, text):
+    partial = path + '.' + str(os.getpid()) + '.part'
+    with open(partial, 'w') as f:
+        f.write(text)
+    os.replace(partial, path)
+
+
+def write_summary(summary, path):
+    try:
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        write_atomic(path, json.dumps(summary, indent=2))
+    except OSError as e:
+        print("Unable to write stage timings to " + path + ": " + str(e))
+
+
+def label(value):
+    return '"' + str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n') + '"'
+
+
+def prometheus_text(summaries):
+    # Metrics in the Prometheus text format, for node_exporter's textfile collector
+    lines = ['# HELP qencoder_stage_seconds Wall time of each stage of the latest encode of an output.',
+             '# TYPE qencoder_stage_seconds gauge']
+    for s in summaries:
+        for stage, seconds in s['stages'].items():
+            lines.append('qencoder_stage_seconds{output=' + label(s['output']) + ',stage=' + label(stage) + '} ' +
+                         str(seconds))
+    lines += ['# HELP qencoder_busy_seconds Time summed over all chunks, for work that runs in parallel.',
+              '# TYPE qencoder_busy_seconds gauge']
+    for s in summaries:
+        for name, seconds in s['busy'].items():
+            lines.append('qencoder_busy_seconds{output=' + label(s['output']) + ',work=' + label(name) + '} ' +
+                         str(seconds))
+    for name, key, text in (('job_seconds', 'wall', 'Wall time of the latest encode of an output.'),
+                            ('job_frames', 'frames', 'Frames encoded by the latest encode of an output.'),
+                            ('job_fps', 'fps', 'Frames per second while chunks were encoding.'),
+                            ('job_done_chunks', 'done_chunks', 'Chunks in done.json, a resume skips them.'),
+                            ('job_total_chunks', 'total_chunks', 'Chunks the latest encode was split into.')):
+        lines += ['# HELP qencoder_' + name + ' ' + text, '# TYPE qencoder_' + name + ' gauge']
+        for s in summaries:
+            lines.append('qencoder_' + name + '{output=' + label(s['output']) + ',status=' + label(s['status']) +
+                         '} ' + str(s[key]))
+    return '\n'.join(lines) + '\n'
+
+
+def write_prometheus(path, summaries):
+    # Written whole and renamed into place, the collector must never read a partial file
+    try:
+        write_atomic(path, prometheus_text(summaries))
+    except OSError as e:
+        print("Unable to write the Prometheus textfile " + path + ": " + str(e))
@@ -0,0 +1,273 @@
+# This Python file uses the following encoding: utf-8
+# Builds av1an arguments from a preset dict without needing any Qt widgets.
+# window.py uses these for the gui and headless.py uses them for batch runs.
+import os
+import pickle
+from pathlib import Path
+
+INPUT_FORMATS = ['yuv420p', 'yuv420p10le', 'yuv420p12le',
+                 'yuv422p', 'yuv422p10le', 'yuv422p12le',
+                 'yuv444p', 'yuv444p10le', 'yuv444p12le']
+
+# Smallest tile size generated tiling goes down to. Every tile boundary costs some quality,
+# so tiles are only added until each thread has one, never narrower or shorter than this.
+TILE_WIDTH = 512
+TILE_HEIGHT = 720
+MAX_TILES_LOG2 = 6
+
+
+def match_input_format(pixFmt):
+    # Index in INPUT_FORMATS for a pix_fmt reported by ffprobe, None if there is no matching entry
+    if not pixFmt:
+        return None
+    # Full range jpeg formats have the same layout
+    pixFmt = pixFmt.replace('yuvj', 'yuv')
+    if pixFmt in INPUT_FORMATS:
+        return INPUT_FORMATS.index(pixFmt)
+    return None
+
+
+def config_home():
+    if 'APPDATA' in os.environ:
+        return os.environ['APPDATA']
+    elif 'XDG_CONFIG_HOME' in os.environ:
+        return os.environ['XDG_CONFIG_HOME']
+    else:
+        return os.path.join(os.environ['HOME'], '.config')
+
+
+def config_path():
+    return os.path.join(config_home(), 'qencoder.qec')
+
+
+def load_preset(path):
+    with open(path, 'rb') as filehandler:
+        return pickle.load(filehandler)
+
+
+def has_cropping(preset):
+    return preset['iscropping'] and (preset['cropdown'] > 0 or preset['cropright'] > 0 or
+                                     preset['croptop'] > 0 or preset['cropleft'] > 0)
+
+
+def get_ffmpeg_params(preset):
+    if preset['cusffmpeg']:
+        return preset['ffmpegcmd']
+    astr = " "
+    addedStuff = False
+    if has_cropping(preset):
+        widthSub = preset['cropright'] + preset['cropleft']
+        heightSub = preset['croptop'] + preset['cropdown']
+        astr += "-filter:v \"crop=iw-" + str(widthSub) + ":ih-" + str(heightSub) + ":" + str(
+            preset['cropleft']) + ":" + str(preset['croptop'])
+        addedStuff = True
+    if preset['rescale']:
+        if addedStuff:
+            astr += ",scale=" + str(preset['rescalex']) + ":" + str(preset['rescaley'])
+        else:
+            astr += "-filter:v \"scale=" + str(preset['rescalex']) + ":" + str(preset['rescaley'])
+            addedStuff = True
+    if addedStuff:
+        astr += "\" "
+    return astr
+
+
+def log2_floor(n):
+    return max(0, int(n).bit_length() - 1)
+
+
+def log2_ceil(n):
+    return max(0, int(n - 1).bit_length())
+
+
+def get_tiling(preset, size=None):
+    # (log2 tile columns, log2 tile rows) for aomenc and vpxenc vp9. -1 in the preset means automatic:
+    # enough columns for the threads as far as the width allows, and for aomenc rows on tall frames
+    # when the threads still outnumber the columns. vp9 only encodes tile columns in parallel.
+    width, height = size or (1920, 1080)
+    threads = max(1, preset['threads'])
+    cols = preset.get('tilecols', -1)
+    rows = preset.get('tilerows', -1)
+    if cols < 0:
+        cols = min(log2_ceil(threads), log2_floor(max(1, width // TILE_WIDTH)), MAX_TILES_LOG2)
+    if rows < 0:
+        rows = 0
+        if preset['enc'] == 0:
+            rows = min(log2_ceil(max(1, threads >> cols)), log2_floor(max(1, height // TILE_HEIGHT)), MAX_TILES_LOG2)
+    return cols, rows
+
+
+def get_video_params(preset, size=None):
+    # size is the frame size the encoder sees, see encode_size. 1080p is assumed when it is unknown.
+    if preset['cusvid']:
+        return preset['vidcmd']
+    vparams = " --threads=" + str(preset['threads'])
+    if preset['maxkfdist'] > 0 and preset['splitmethod'] != 1:
+        vparams += " --kf-max-dist=" + str(preset['maxkfdist'])
+    if preset['enc'] < 2:
+        cols, rows = get_tiling(preset, size)
+        vparams += " --tile-columns=" + str(cols) + " --tile-rows=" + str(rows)
+        if preset['threads'] > 1:
+            # Threads also work on rows of superblocks inside a tile, needed to use them on small frames
+            vparams += " --row-mt=1"
+        vparams += " --cpu-used=" + str(preset['cpuused'])
+    else:
+        vparams += " --codec=vp8 --cpu-used=" + str(preset['cpuused'])
+
+    if preset['enc'] == 1:
+        vparams += " --codec=vp9"
+
+    if preset['rtenc']:
+        vparams += " --rt"
+    else:
+        vparams += " --good"
+    if preset['brmode']:
+        vparams += " --end-usage=vbr --target-bitrate=" + str(preset['qual'])
+    else:
+        if preset['qual'] < 4 and preset['enc'] == 2:
+            vparams += " --end-usage=q --cq-level=4"
+        else:
+            vparams += " --end-usage=q --cq-level=" + str(preset['qual'])
+        if preset['qual'] == 0 and preset['enc'] <= 1:
+            vparams += " --lossless=1"
+
+    if preset['10b']:
+        vparams += " --bit-depth=10 "
+    else:
+        vparams += " --bit-depth=8 "
+    input_depth = 8 + 2 * (preset['inputFmt'] % 3)
+    vparams += "--input-bit-depth=" + str(input_depth) + " "
+    vparams += preset['colordataText']
+    if preset['inputFmt'] <= 2:
+        vparams += " --i420"
+    elif preset['inputFmt'] <= 5:
+        vparams += " --i422"
+    else:
+        vparams += " --i444 "
+    return vparams
+
+
+def encode_size(preset, mediaInfo):
+    # Frame size the encoder sees after cropping and rescaling, None without a probed input
+    if preset['rescale']:
+        return preset['rescalex'], preset['rescaley']
+    if not mediaInfo or not mediaInfo.get('width'):
+        return None
+    width, height = mediaInfo['width'], mediaInfo['height']
+    if has_cropping(preset):
+        width -= preset['cropleft'] + preset['cropright']
+        height -= preset['croptop'] + preset['cropdown']
+    return width, height
+
+
+def resolution_class(width, height):
+    pixels = width * height
+    for name, limit in (('480p', 854 * 480), ('720p', 1280 * 720), ('1080p', 1920 * 1080), ('1440p', 2560 * 1440)):
+        if pixels <= limit:
+            return name
+    return '2160p'
+
+
+def tune_key(preset, width, height):
+    # Autotune results are kept per encoder, speed and resolution class
+    return (('aom', 'vp9', 'vp8')[preset['enc']] + " cpu-used " + str(preset['cpuused']) +
+            (" rt" if preset['rtenc'] else "") + " " + resolution_class(width, height))
+
+
+def tuned_split(preset, mediaInfo):
+    # (jobs, threads) found by autotune for this kind of encode, None if there is no result to use
+    if not preset.get('useautotune', True) or preset['cusvid'] or not preset.get('autotune'):
+        return None
+    size = encode_size(preset, mediaInfo)
+    if size is None:
+        return None
+    result = preset['autotune'].get(tune_key(preset, *size))
+    if result is None:
+        return None
+    return result['jobs'], result['threads']
+
+
+def get_split_method(preset):
+    if preset['splitmethod'] == 0:
+        return "ffmpeg"
+    elif preset['splitmethod'] == 1:
+        return "none"
+    else:
+        return "pyscene"
+
+
+def get_audio_params(preset):
+    if preset['cusaud']:
+        return preset['audcmd']
+    if preset['audio']:
+        return "-b:a " + str(preset['audiobr']) + "k -c:a libopus"
+    else:
+        return "-c:a copy"
+
+
+def get_vmaf_filter(preset):
+    astr = ""
+    addedStuff = False
+    if has_cropping(preset):
+        widthSub = preset['cropright'] + preset['cropleft']
+        heightSub = preset['croptop'] + preset['cropdown']
+        astr += "crop=iw-" + str(widthSub) + ":ih-" + str(heightSub) + ":" + str(
+            preset['cropleft']) + ":" + str(preset['croptop'])
+        addedStuff = True
+    if preset['rescale']:
+        if addedStuff:
+            astr += ",scale=" + str(preset['rescalex']) + ":" + str(preset['rescaley'])
+        else:
+            astr += "scale=" + str(preset['rescalex']) + ":" + str(preset['rescaley'])
+    return astr
+
+
+def get_vmaf_res(preset):
+    if preset['rescale']:
+        return str(preset['rescalex']) + "x" + str(preset['rescaley'])
+    else:
+        return "1920x1080"
+
+
+def get_args(preset, inputPath, outputPath, lsmash=True, mediaInfo=None):
+    tuned = tuned_split(preset, mediaInfo)
+    if tuned is not None:
+        preset = dict(preset, jobs=tuned[0], threads=tuned[1])
+    # The probed format wins over the preset's, a wrong one makes ffmpeg convert every frame.
+    # Set before anything is built so the pipe format and the encoder's input options agree.
+    inputFmt = match_input_format((mediaInfo or {}).get('pix_fmt'))
+    if inputFmt is not None:
+        preset = dict(preset, inputFmt=inputFmt)
+    args = {'video_params': get_video_params(preset, encode_size(preset, mediaInfo)), 'input': [Path(inputPath)],
+            'encoder': 'aom',
+            'workers': preset['jobs'], 'audio_params': get_audio_params(preset),
+            'threshold': preset['splittr'],
+            'passes': (2 if preset['2p'] else 1), 'output_file': Path(outputPath),
+            'scenes': None, 'resume': preset['resume'],
+            'keep': preset['keeptmp'],
+            'pix_format': INPUT_FORMATS[preset['inputFmt']], 'ffmpeg': get_ffmpeg_params(preset),
+            'threads': preset['threads'],
+            'split_method': get_split_method(preset),
+            'chunk_method': ("vs_lsmash" if preset['usinglsmas'] and lsmash else "segment"),
+            'temp': Path(
+            str(os.path.dirname(outputPath)) + "/temp_" + str(
+                os.path.basename(outputPath))), 'probes': preset['TargetVMAFSteps'],
+            'min_q': preset['TargetVMAFMinQ'], 'max_q': preset['TargetVMAFMaxQ'],
+            'target_quality': (preset['TargetVMAFValue'] if preset['isTargetVMAF'] else None),
+            'vmaf_path': preset['TargetVMAFPath'], 'vmaf_filter': get_vmaf_filter(preset),
+            'vmaf_res': get_vmaf_res(preset), 'min_scene_len': 60, 'target_quality_method': 'per_shot',
+            'probing_rate': 2, 'n_threads': preset['threads'],
+            'parallel_scenes': preset.get('parallelsd', False),
+            'tq_search': ('fit' if preset.get('tqsearch', 0) == 1 else 'bisect'),
+            'probe_rate_min': preset.get('TargetVMAFMinRate', 2), 'probe_rate_max': preset.get('TargetVMAFMaxRate', 8)}
+    if preset['splitmethod'] == 1:
+        args["extra_split"] = preset['maxkfdist']
+    else:
+        args["extra_split"] = None
+
+    if preset['enc'] >= 1:
+        args['encoder'] = 'vpx'
+    if mediaInfo is not None:
+        args['media_info'] = mediaInfo
+    args['temp'] = Path(str((args['temp'])).replace("'", "_"))
+    return args
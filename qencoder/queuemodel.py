@@ -0,0 +1,95 @@
+# This Python file uses the following encoding: utf-8
+# Qt model for the queue tab. Row text is built when the view asks for it, so only visible rows
+# are ever formatted, and a progress update or a move only touches the rows involved.
+from PyQt5 import QtCore
+
+
+def queue_item_name(item):
+    return str(item[0]['input'][0].parts[-1]) + " -> " + str(item[0]['output_file'].parts[-1])
+
+
+def queue_item_text(item):
+    preset = item[1]
+    finalString = queue_item_name(item)
+    if (preset['brmode']):
+        finalString += ", " + str(preset['qual']) + "kbps"
+    else:
+        finalString += ", crf=" + str(preset['qual']) + ""
+    if (preset['rtenc']):
+        finalString += ", spd=" + str(preset['cpuused']) + "r"
+    else:
+        finalString += ", spd=" + str(preset['cpuused'])
+    finalString += ", 2p=" + str(int(preset['2p']))
+    if (preset['enc'] == 0):
+        finalString += ", enc=av1"
+    elif (preset['enc'] == 1):
+        finalString += ", enc=vp9"
+    else:
+        finalString += ", enc=vp8"
+    if (preset['audio']):
+        finalString += ", aud=" + str(preset['audiobr']) + "k"
+    return finalString
+
+
+class QueueModel(QtCore.QAbstractListModel):
+    def __init__(self, encodeList, parent=None):
+        QtCore.QAbstractListModel.__init__(self, parent)
+        self.encodeList = encodeList
+        # Keyed by item id so they follow items when the queue is reordered
+        self.status = {}
+        self.text = {}
+
+    def rowCount(self, parent=QtCore.QModelIndex()):
+        if parent.isValid():
+            return 0
+        return len(self.encodeList)
+
+    def data(self, index, role=QtCore.Qt.DisplayRole):
+        if not index.isValid() or role != QtCore.Qt.DisplayRole:
+            return None
+        itemId = self.encodeList.ids[index.row()]
+        if itemId in self.status:
+            return self.status[itemId] + queue_item_name(self.encodeList[index.row()])
+        if itemId not in self.text:
+            self.text[itemId] = queue_item_text(self.encodeList[index.row()])
+        return self.text[itemId]
+
+    def set_status(self, row, status):
+        # status is shown in front of the item's file names instead of its settings
+        self.status[self.encodeList.ids[row]] = status
+        index = self.index(row)
+        self.dataChanged.emit(index, index, [QtCore.Qt.DisplayRole])
+
+    def append_items(self, items):
+        items = list(items)
+        if not items:
+            return
+        first = len(self.encodeList)
+        self.beginInsertRows(QtCore.QModelIndex(), first, first + len(items) - 1)
+        self.encodeList.extend(items)
+        self.endInsertRows()
+
+    def remove_row(self, row):
+        self.beginRemoveRows(QtCore.QModelIndex(), row, row)
+        itemId = self.encodeList.ids[row]
+        del self.encodeList[row]
+        self.status.pop(itemId, None)
+        self.text.pop(itemId, None)
+        self.endRemoveRows()
+
+    def move_row(self, row, newRow):
+        # Only moves to a neighbouring row, which is all the up and down buttons need
+        if newRow < 0 or newRow >= len(self.encodeList) or abs(newRow - row) != 1:
+            return False
+        dest = newRow + 1 if newRow > row else newRow
+        self.beginMoveRows(QtCore.QModelIndex(), row, row, QtCore.QModelIndex(), dest)
+        self.encodeList.swap(row, newRow)
+        self.endMoveRows()
+        return True
+
+    def reset(self):
+        # For changes to the whole queue, like opening a saved one or clearing it
+        self.beginResetModel()
+        self.status = {}
+        self.text = {}
+        self.endResetModel()
@@ -0,0 +1,204 @@
+# This Python file uses the following encoding: utf-8
+# Queue storage. The gui's queue lives in a sqlite database in the config folder and every add,
+# edit, move or delete is written as it happens, so a crash loses nothing. Presets shared by many
+# items are stored once, and items are only unpickled when they are looked at.
+# Saved queues (.eqd) use the same format. Older pickled .eqd files can still be opened.
+import os
+import pickle
+import sqlite3
+import threading
+
+from qencoder.cache import cache_key
+from qencoder.presets import config_home
+
+SQLITE_HEADER = b'SQLite format 3\x00'
+
+
+def autosave_path():
+    return os.path.join(config_home(), 'qencoder_queue.sqlite')
+
+
+def is_queue_store(path):
+    with open(path, 'rb') as f:
+        return f.read(len(SQLITE_HEADER)) == SQLITE_HEADER
+
+
+def create_tables(db):
+    db.execute("CREATE TABLE IF NOT EXISTS presets (id INTEGER PRIMARY KEY, hash TEXT UNIQUE, data BLOB)")
+    db.execute("CREATE TABLE IF NOT EXISTS items (id INTEGER PRIMARY KEY, position INTEGER, "
+               "preset INTEGER REFERENCES presets(id), args BLOB)")
+    db.execute("CREATE INDEX IF NOT EXISTS items_position ON items (position)")
+
+
+def read_queue_file(path):
+    # Returns the whole queue in a saved file as [args, preset] items, whichever format it is in
+    if not is_queue_store(path):
+        with open(path, 'rb') as filehandler:
+            return pickle.load(filehandler)
+    db = sqlite3.connect("file:" + os.path.abspath(path) + "?mode=ro", uri=True)
+    try:
+        presets = {pid: pickle.loads(data) for pid, data in db.execute("SELECT id, data FROM presets")}
+        return [[pickle.loads(args), presets[pid]] for pid, args in
+                db.execute("SELECT preset, args FROM items ORDER BY position")]
+    finally:
+        db.close()
+
+
+class QueueStore:
+    def __init__(self, path):
+        self.path = path
+        self.lock = threading.RLock()
+        self.db = sqlite3.connect(path, check_same_thread=False)
+        self.db.execute("PRAGMA journal_mode=WAL")
+        self.db.execute("PRAGMA synchronous=NORMAL")
+        with self.db:
+            create_tables(self.db)
+        self.presetIds = {}
+        self.presets = {}
+
+    def preset_id(self, preset):
+        key = cache_key(preset)
+        if key not in self.presetIds:
+            row = self.db.execute("SELECT id FROM presets WHERE hash = ?", (key,)).fetchone()
+            if row is None:
+                row = (self.db.execute("INSERT INTO presets (hash, data) VALUES (?, ?)",
+                                       (key, pickle.dumps(preset))).lastrowid,)
+            self.presetIds[key] = row[0]
+            self.presets[row[0]] = preset
+        return self.presetIds[key]
+
+    def add_many(self, items):
+        with self.lock, self.db:
+            position = self.db.execute("SELECT COALESCE(MAX(position), -1) FROM items").fetchone()[0]
+            ids = []
+            for args, preset in items:
+                position += 1
+                ids.append(self.db.execute("INSERT INTO items (position, preset, args) VALUES (?, ?, ?)",
+                                           (position, self.preset_id(preset), pickle.dumps(args))).lastrowid)
+            return ids
+
+    def add(self, item):
+        return self.add_many([item])[0]
+
+    def update(self, itemId, item):
+        with self.lock, self.db:
+            self.db.execute("UPDATE items SET preset = ?, args = ? WHERE id = ?",
+                            (self.preset_id(item[1]), pickle.dumps(item[0]), itemId))
+
+    def swap(self, itemA, itemB):
+        with self.lock, self.db:
+            posA = self.db.execute("SELECT position FROM items WHERE id = ?", (itemA,)).fetchone()[0]
+            posB = self.db.execute("SELECT position FROM items WHERE id = ?", (itemB,)).fetchone()[0]
+            self.db.execute("UPDATE items SET position = ? WHERE id = ?", (posB, itemA))
+            self.db.execute("UPDATE items SET position = ? WHERE id = ?", (posA, itemB))
+
+    def remove(self, itemId):
+        with self.lock, self.db:
+            self.db.execute("DELETE FROM items WHERE id = ?", (itemId,))
+
+    def clear(self):
+        with self.lock, self.db:
+            self.db.execute("DELETE FROM items")
+            self.db.execute("DELETE FROM presets")
+        self.presetIds = {}
+        self.presets = {}
+
+    def item_ids(self):
+        with self.lock:
+            return [row[0] for row in self.db.execute("SELECT id FROM items ORDER BY position")]
+
+    def load(self, itemId):
+        with self.lock:
+            pid, args = self.db.execute("SELECT preset, args FROM items WHERE id = ?", (itemId,)).fetchone()
+            if pid not in self.presets:
+                self.presets[pid] = pickle.loads(
+                    self.db.execute("SELECT data FROM presets WHERE id = ?", (pid,)).fetchone()[0])
+            return [pickle.loads(args), self.presets[pid]]
+
+    def save_to(self, path):
+        # Copies the database page by page, then swaps it in so a crash never leaves half a file
+        partial = path + ".part"
+        if os.path.exists(partial):
+            os.remove(partial)
+        dest = sqlite3.connect(partial)
+        try:
+            with self.lock:
+                self.db.backup(dest)
+            dest.execute("PRAGMA journal_mode=DELETE")
+        finally:
+            dest.close()
+        os.replace(partial, path)
+
+    def load_from(self, path):
+        if not is_queue_store(path):
+            items = read_queue_file(path)
+            self.clear()
+            self.add_many(items)
+            return
+        with self.lock:
+            self.db.execute("ATTACH DATABASE ? AS src", (path,))
+            try:
+                with self.db:
+                    self.db.execute("DELETE FROM items")
+                    self.db.execute("DELETE FROM presets")
+                    self.db.execute("INSERT INTO presets SELECT id, hash, data FROM src.presets")
+                    self.db.execute("INSERT INTO items SELECT id, position, preset, args FROM src.items")
+            finally:
+                self.db.execute("DETACH DATABASE src")
+            self.presetIds = {}
+            self.presets = {}
+
+    def close(self):
+        self.db.close()
+
+
+class QueueList:
+    # List of [args, preset] items backed by a QueueStore. Items are loaded on first access and
+    # every change is written to the store straight away.
+    def __init__(self, store):
+        self.store = store
+        self.refresh()
+
+    def refresh(self):
+        self.ids = self.store.item_ids()
+        self.loaded = {}
+
+    def __len__(self):
+        return len(self.ids)
+
+    def __getitem__(self, index):
+        itemId = self.ids[index]
+        if itemId not in self.loaded:
+            self.loaded[itemId] = self.store.load(itemId)
+        return self.loaded[itemId]
+
+    def __setitem__(self, index, item):
+        itemId = self.ids[index]
+        self.store.update(itemId, item)
+        self.loaded[itemId] = item
+
+    def __delitem__(self, index):
+        itemId = self.ids.pop(index)
+        self.store.remove(itemId)
+        self.loaded.pop(itemId, None)
+
+    def __iter__(self):
+        for i in range(len(self.ids)):
+            yield self[i]
+
+    def swap(self, a, b):
+        self.store.swap(self.ids[a], self.ids[b])
+        self.ids[a], self.ids[b] = self.ids[b], self.ids[a]
+
+    def append(self, item):
+        self.extend([item])
+
+    def extend(self, items):
+        items = list(items)
+        ids = self.store.add_many(items)
+        self.ids.extend(ids)
+        self.loaded.update(zip(ids, items))
+
+    def clear(self):
+        self.store.clear()
+        self.refresh()
@@ -0,0 +1,67 @@
+# This Python file uses the following encoding: utf-8
+# Keeps track of which chunks av1an has finished for a project (temp/done.json).
+# The runner calls refresh as progress comes in, which only parses the file again when its size or
+# mtime changed behind our back. Chunks finished while we are watching are added to the running
+# total without reading the file at all.
+import json
+import os
+import threading
+
+
+class ResumeTracker:
+    def __init__(self, temp, resume=True):
+        self.path = os.path.join(str(temp), 'done.json')
+        self.resume = resume
+        self.chunks = {}
+        self.totalChunks = 0
+        self.frames = 0
+        self.stamp = None
+        self.lock = threading.Lock()
+        if resume:
+            self.refresh()
+
+    def file_stamp(self):
+        try:
+            st = os.stat(self.path)
+        except OSError:
+            return None
+        return st.st_mtime_ns, st.st_size
+
+    def refresh(self):
+        stamp = self.file_stamp()
+        if stamp is None or stamp == self.stamp:
+            return False
+        try:
+            with open(self.path) as done_file:
+                data = json.load(done_file)
+        except ValueError:
+            # av1an is in the middle of rewriting it, the next refresh will pick it up
+            return False
+        with self.lock:
+            self.stamp = stamp
+            self.chunks = dict(data.get('done', {}))
+            self.frames = sum(self.chunks.values())
+        return True
+
+    def mark_done(self, name, frames):
+        # Called once av1an has written the chunk to done.json, so that write needs no refresh
+        stamp = self.file_stamp()
+        with self.lock:
+            self.frames += frames - self.chunks.get(name, 0)
+            self.chunks[name] = frames
+            self.stamp = stamp
+
+    def set_pending(self, pending):
+        with self.lock:
+            self.totalChunks = len(self.chunks) + pending
+
+    def done_chunks(self):
+        return len(self.chunks)
+
+    def done_frames(self):
+        return self.frames
+
+    def snapshot(self):
+        with self.lock:
+            return {'done_chunks': len(self.chunks), 'total_chunks': self.totalChunks,
+                    'done_frames': self.frames, 'chunks': dict(self.chunks)}
@@ -0,0 +1,210 @@
+# This Python file uses the following encoding: utf-8
+# Runs a list of queue items through av1an. This has no Qt dependency so it can be
+# driven by EncodeWorker in the gui or by headless.py on machines without a display.
+import concurrent
+import concurrent.futures
+import threading
+import traceback
+
+import os
+import queue
+
+from qencoder.av1anworkarounds import run_av1an, get_av1an, get_av1an_proj, merge_args, \
+    attach_core_budget, attach_chunk_pool, attach_stage_timer, watch_progress, cancel_project, \
+    kill_project_processes, JobCancelled
+from qencoder.distributed import attach_workers
+from qencoder.metrics import StageTimer, summary_path, write_prometheus, write_summary
+from qencoder.resume import ResumeTracker
+from qencoder.scenecache import ScenePrefetcher
+from qencoder.scheduler import ChunkPool, CoreBudget, LoadController, MemoryGate, queue_order
+
+
+class QueueListener:
+    # Receives progress from a QueueRunner. Indexes are positions in the queue.
+    def new_task(self, index, taskDesc, taskFrames):
+        pass
+
+    def start_encode(self, index, totalFrames, initFrames):
+        pass
+
+    def new_frames(self, index, addFrames):
+        pass
+
+    def chunk_done(self, index, doneChunks, totalChunks):
+        pass
+
+    def encode_finished(self, index, errorCode):
+        # errorCode is 0 on success, 1 on failure and 2 if the item was cancelled
+        pass
+
+
+class QueueRunner:
+    def __init__(self, argdata, numcores, listener=None, coreBudget=None, prefetch=2, order='manual', remotes=(),
+                 remoteToken=None, remoteTransfer=False, memoryReserve=None, adaptive=None, metricsDir=None,
+                 prometheusPath=None):
+        self.argdat = argdata
+        self.numcores = numcores
+        # Items keep their queue index for progress, only the order they are started in changes
+        self.order = queue_order(argdata, order)
+        self.budget = CoreBudget(coreBudget, MemoryGate(memoryReserve))
+        self.pool = ChunkPool(self.budget)
+        self.controller = None
+        if adaptive:
+            # adaptive is (fewest, most) chunks to run at once, a chunk costs its item's --threads
+            step = max(max(1, item[0]['threads']) for item in argdata) if argdata else 1
+            self.controller = LoadController(self.budget, self.pool, adaptive[0] * step, adaptive[1] * step, step)
+        self.remotes = remotes
+        # Stage timings of finished items, by output, for the Prometheus textfile
+        self.metricsDir = metricsDir
+        self.prometheusPath = prometheusPath
+        self.summaries = {}
+        self.remoteToken = remoteToken
+        self.remoteTransfer = remoteTransfer
+        self.listener = listener if listener is not None else QueueListener()
+        self.prefetcher = ScenePrefetcher(prefetch, self.listener,
+                                          lambda index: self.killFlag or index in self.cancelled)
+        self.killFlag = False
+        self.active = {}
+        self.cancelled = set()
+        self.trackers = {}
+        self.lock = threading.Lock()
+
+    def cancel(self):
+        self.killFlag = True
+        with self.lock:
+            indexes = list(self.active.keys())
+        for index in indexes:
+            self.cancel_job(index)
+
+    def cancel_job(self, index):
+        # Stops one queue item. Its temp folder is kept so it can be resumed, other items keep running.
+        with self.lock:
+            self.cancelled.add(index)
+            if index not in self.active:
+                return
+            proj, events = self.active[index]
+        cancel_project(proj)
+        events.put(('cancel',))
+
+    def run_av1an_job(self, av1an, events):
+        errorCode = 0
+        try:
+            run_av1an(av1an)
+        except JobCancelled:
+            errorCode = 2
+        except BaseException as e:
+            errorCode = 1
+            print(e)
+            traceback.print_exc()
+        finally:
+            events.put(('exit', errorCode))
+
+    def run_processing(self, dictargs, index):
+        if self.killFlag or index in self.cancelled:
+            self.listener.encode_finished(index, 2)
+            return
+        if os.path.isfile(dictargs['output_file']):
+            print("Already completed file: " + str(dictargs['output_file']) + " . Please delete this file first")
+            self.listener.encode_finished(index, 0)
+            return
+        timer = StageTimer()
+        with timer.stage('scenes'):
+            args = self.prefetcher.get(index, dictargs)
+        if self.killFlag or index in self.cancelled:
+            self.listener.encode_finished(index, 2)
+            return
+        av1an = get_av1an(get_av1an_proj(merge_args(args)))
+        proj = av1an.projects[0]
+        attach_core_budget(proj, self.budget, dictargs['threads'], dictargs['workers'])
+        attach_chunk_pool(proj, self.pool)
+        attach_stage_timer(proj, timer)
+        events = queue.Queue()
+        watch_progress(proj, events)
+        with self.lock:
+            self.active[index] = (proj, events)
+            if index in self.cancelled:
+                cancel_project(proj)
+        t = threading.Thread(target=self.run_av1an_job, args=[av1an, events])
+        t.start()
+        errorCode = 0
+        frames = 0
+        totalFrames = 0
+        chunks = 0
+        try:
+            while True:
+                event = events.get()
+                if event[0] == 'start':
+                    totalFrames = event[1]
+                    tracker = ResumeTracker(dictargs['temp'], dictargs['resume'])
+                    tracker.set_pending(event[2])
+                    self.trackers[index] = tracker
+                    self.listener.start_encode(index, event[1], tracker.done_frames())
+                    self.listener.chunk_done(index, tracker.done_chunks(), tracker.totalChunks)
+                elif event[0] == 'frames':
+                    frames += event[1]
+                    self.listener.new_frames(index, event[1])
+                    tracker = self.trackers.get(index)
+                    if tracker is not None and tracker.refresh():
+                        self.listener.chunk_done(index, tracker.done_chunks(), tracker.totalChunks)
+                elif event[0] == 'chunk':
+                    tracker = self.trackers[index]
+                    tracker.mark_done(event[1], event[2])
+                    chunks += 1
+                    self.listener.chunk_done(index, tracker.done_chunks(), tracker.totalChunks)
+                elif event[0] == 'cancel':
+                    # av1an retries chunks whose encoder died, so keep killing until its thread gives up
+                    while t.is_alive():
+                        kill_project_processes(proj)
+                        t.join(0.25)
+                    errorCode = 2
+                    break
+                elif event[0] == 'exit':
+                    errorCode = event[1]
+                    break
+        finally:
+            with self.lock:
+                del self.active[index]
+        tracker = self.trackers.get(index)
+        self.save_metrics(dictargs, timer.summary(dictargs, errorCode, frames, totalFrames, chunks, proj.workers,
+                                                  tracker.snapshot() if tracker is not None else None))
+        self.listener.encode_finished(index, errorCode)
+        if errorCode == 0:
+            print("\n\nEncode completed for " + str(dictargs['input']) + " -> " + str(dictargs['output_file']))
+        elif errorCode == 2:
+            print("Cancelled " + str(dictargs['input']) + ", its temp folder was kept for resuming")
+
+    def save_metrics(self, dictargs, summary):
+        write_summary(summary, summary_path(dictargs, self.metricsDir))
+        if self.prometheusPath:
+            with self.lock:
+                self.summaries[summary['output']] = summary
+                write_prometheus(self.prometheusPath, list(self.summaries.values()))
+
+    def run(self):
+        print("Running")
+        if self.remotes:
+            attach_workers(self.pool, self.remotes, self.remoteToken, self.remoteTransfer)
+        if self.controller is not None:
+            self.controller.start()
+        # The first items detect their own scenes as they start, prefetch the ones that have to wait
+        for i in self.order[self.numcores:]:
+            self.prefetcher.submit(i, self.argdat[i][0])
+        with concurrent.futures.ThreadPoolExecutor(max_workers=self.numcores) as executor:
+            future_cmd = {executor.submit(self.run_processing, self.argdat[i][0], i): i for i in self.order}
+            try:
+                for future in concurrent.futures.as_completed(future_cmd):
+                    try:
+                        future.result()
+                    except Exception as e:
+                        print(e)
+                        traceback.print_exc()
+            except KeyboardInterrupt:
+                self.cancel()
+                raise
+            finally:
+                self.prefetcher.shutdown()
+                self.pool.shutdown()
+                if self.controller is not None:
+                    self.controller.stop()
+        if len(self.argdat) > 1:
+            self.listener.encode_finished(-1, 2 if self.killFlag else 0)
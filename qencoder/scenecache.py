@@ -0,0 +1,137 @@
+# This Python file uses the following encoding: utf-8
+# Scene lists are cached on disk so re-encoding the same source with the same split settings
+# skips scene detection. av1an reads the scenes file when it exists, but only writes one that is
+# already there, so detect_scenes fills the cache before av1an starts.
+import concurrent.futures
+import json
+import multiprocessing
+import os
+import traceback
+from pathlib import Path
+
+import psutil
+
+from qencoder.av1anworkarounds import detect_scenes, kill_process_tree
+from qencoder.cache import cache_dir, cache_key, file_fingerprint
+
+POLL_INTERVAL = 0.25
+
+
+def scene_cache_key(dictargs):
+    # Extra splits are added after av1an loads the file, so they are left out of the key
+    return cache_key({'input': file_fingerprint(dictargs['input'][0]), 'split_method': dictargs['split_method'],
+                      'threshold': dictargs['threshold'], 'min_scene_len': dictargs['min_scene_len'],
+                      'ffmpeg': dictargs['ffmpeg'].strip()})
+
+
+def scene_cache_path(dictargs):
+    return os.path.join(cache_dir('scenes'), scene_cache_key(dictargs) + '.json')
+
+
+def valid_scene_file(path):
+    try:
+        with open(path) as f:
+            data = json.load(f)
+        return 'scenes' in data and 'frames' in data
+    except (OSError, ValueError):
+        return False
+
+
+def with_cached_scenes(dictargs):
+    # Returns a copy of dictargs pointing av1an at the cached scene file for this input
+    if dictargs['split_method'] == 'none' or dictargs.get('scenes'):
+        return dictargs
+    try:
+        path = scene_cache_path(dictargs)
+    except OSError as e:
+        print("Unable to use the scene cache: " + str(e))
+        return dictargs
+    if os.path.exists(path) and not valid_scene_file(path):
+        # Left behind by an encode that died while av1an was writing it
+        os.remove(path)
+    args = dict(dictargs)
+    args['scenes'] = Path(path)
+    return args
+
+
+def needs_detection(dictargs):
+    if dictargs['split_method'] == 'none' or not dictargs.get('scenes'):
+        return False
+    if os.path.isfile(dictargs['output_file']):
+        return False
+    # av1an resumes when done.json is there, reads temp/scenes.txt and never looks at the cache
+    temp = Path(dictargs['temp'])
+    if dictargs['resume'] and (temp / 'done.json').exists() and (temp / 'scenes.txt').exists():
+        return False
+    return not os.path.exists(dictargs['scenes'])
+
+
+def detect_in_process(args, cancelled):
+    # pyscenedetect would run inside this process and ffmpeg's detection has no temp folder on its
+    # command line, so neither could be stopped. In a process of its own a cancelled item kills it at once.
+    # Returns False if cancelled.
+    proc = multiprocessing.get_context('spawn').Process(target=detect_scenes, args=(args, args['scenes']))
+    proc.start()
+    try:
+        while proc.is_alive():
+            if cancelled():
+                return False
+            proc.join(POLL_INTERVAL)
+    finally:
+        if proc.is_alive():
+            kill_process_tree(psutil.Process(proc.pid))
+            proc.join()
+    if proc.exitcode != 0:
+        raise RuntimeError("scene detection exited with " + str(proc.exitcode))
+    return True
+
+
+class ScenePrefetcher:
+    # Runs scene detection for queue items ahead of time, a few at a time, while earlier items
+    # encode. When an item starts its scenes are already in the cache and av1an goes straight to chunking.
+    def __init__(self, workers, listener, skip=None):
+        self.executor = concurrent.futures.ThreadPoolExecutor(max_workers=max(1, workers))
+        self.enabled = workers > 0
+        self.listener = listener
+        self.skip = skip if skip is not None else (lambda index: False)
+        self.futures = {}
+
+    def submit(self, index, dictargs):
+        if self.enabled:
+            self.futures[index] = self.executor.submit(self.prepare, index, dictargs)
+
+    def prepare(self, index, dictargs):
+        args = with_cached_scenes(dictargs)
+        if self.skip(index) or not needs_detection(args):
+            return args
+        if args['split_method'] == 'pyscene':
+            self.listener.new_task(index, "Pyscenedetect... please wait", 0)
+        else:
+            self.listener.new_task(index, "Scene detection... please wait", 0)
+        detect_in_process(args, lambda: self.skip(index))
+        return args
+
+    def get(self, index, dictargs):
+        # Waits for the item's detection if it is still running. On any failure av1an detects scenes itself.
+        future = self.futures.pop(index, None)
+        if future is not None:
+            try:
+                return future.result()
+            except concurrent.futures.CancelledError:
+                pass
+            except Exception as e:
+                print("Scene detection failed for " + str(dictargs['input']) + ": " + str(e))
+                traceback.print_exc()
+        else:
+            # Detected here rather than by av1an, so cancelling the item can stop it
+            try:
+                return self.prepare(index, dictargs)
+            except Exception as e:
+                print("Scene detection failed for " + str(dictargs['input']) + ": " + str(e))
+                traceback.print_exc()
+        return with_cached_scenes(dictargs)
+
+    def shutdown(self):
+        for future in self.futures.values():
+            future.cancel()
+        self.executor.shutdown(wait=False)
@@ -0,0 +1,84 @@
+# This Python file uses the following encoding: utf-8
+# Parallel pyscenedetect for a single long input. The timeline is cut into ranges which are
+# detected in separate processes. Each range is decoded with some extra frames on both sides so
+# the detector has context at its edges, then every range keeps only the cuts in the part it owns.
+import concurrent.futures
+import os
+
+MIN_RANGE_FRAMES = 2000
+
+
+def video_frames(path):
+    from scenedetect.video_manager import VideoManager
+    video_manager = VideoManager([str(path)])
+    try:
+        duration = video_manager.get_duration()
+        if isinstance(duration, tuple):
+            duration = duration[0]
+        return int(duration.get_frames())
+    finally:
+        video_manager.release()
+
+
+def detect_range(path, start, end, threshold, min_scene_len):
+    from scenedetect.detectors import ContentDetector
+    from scenedetect.scene_manager import SceneManager
+    from scenedetect.video_manager import VideoManager
+    video_manager = VideoManager([str(path)])
+    scene_manager = SceneManager()
+    scene_manager.add_detector(ContentDetector(threshold=threshold, min_scene_len=min_scene_len))
+    try:
+        base_timecode = video_manager.get_base_timecode()
+        video_manager.set_duration(start_time=base_timecode + start, end_time=base_timecode + end)
+        video_manager.set_downscale_factor()
+        video_manager.start()
+        scene_manager.detect_scenes(frame_source=video_manager)
+        scene_list = scene_manager.get_scene_list(base_timecode)
+    finally:
+        video_manager.release()
+    return [int(scene[0].get_frames()) for scene in scene_list]
+
+
+def split_ranges(frames, segments, overlap):
+    # Returns (owned start, owned end, decode start, decode end) for every range
+    size = -(-frames // segments)
+    ranges = []
+    for start in range(0, frames, size):
+        end = min(frames, start + size)
+        ranges.append((start, end, max(0, start - overlap), min(frames, end + overlap)))
+    return ranges
+
+
+def merge_cuts(ranges, cuts, min_scene_len):
+    merged = []
+    for (ownStart, ownEnd, _, _), rangeCuts in zip(ranges, cuts):
+        merged.extend(c for c in rangeCuts if ownStart <= c < ownEnd)
+    kept = []
+    for cut in sorted(set(merged)):
+        if cut <= 0:
+            continue
+        # A cut near a range edge can be found by both neighbours a frame or two apart
+        if kept and cut - kept[-1] < min_scene_len:
+            continue
+        kept.append(cut)
+    return kept
+
+
+def default_segments(frames, workers=None):
+    workers = workers or os.cpu_count() or 1
+    return max(1, min(workers, frames // MIN_RANGE_FRAMES))
+
+
+def parallel_detect(path, threshold, min_scene_len, frames=None, segments=None, overlap=None):
+    # Returns (cut frames, total frames) in the same form av1an's pyscene split produces
+    if frames is None:
+        frames = video_frames(path)
+    segments = segments or default_segments(frames)
+    overlap = overlap if overlap is not None else min_scene_len + 24
+    ranges = split_ranges(frames, segments, overlap)
+    if len(ranges) <= 1:
+        return merge_cuts(ranges, [detect_range(path, 0, frames, threshold, min_scene_len)], min_scene_len), frames
+    with concurrent.futures.ProcessPoolExecutor(max_workers=len(ranges)) as executor:
+        futures = [executor.submit(detect_range, str(path), r[2], r[3], threshold, min_scene_len) for r in ranges]
+        cuts = [f.result() for f in futures]
+    return merge_cuts(ranges, cuts, min_scene_len), frames
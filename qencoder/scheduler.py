@@ -0,0 +1,419 @@
+# This Python file uses the following encoding: utf-8
+# Machine wide budget of cpu threads shared by every queue item that is encoding at once.
+# Each chunk encode costs the --threads value of its item. Free budget is handed to the
+# items that still have chunks waiting, so one item reaching its tail does not leave cores idle.
+# Chunks also need memory, new ones wait while the machine is short of it.
+# Also decides in which order queue items are started.
+import collections
+import concurrent.futures
+import os
+import statistics
+import threading
+import time
+from contextlib import contextmanager
+
+import psutil
+
+ORDER_POLICIES = ['manual', 'lpt', 'spt']
+
+# Rough time per pixel of each --cpu-used value relative to the fastest, for aomenc and vpxenc.
+# Only the ratios between queue items matter.
+AOM_SPEED_COST = [60, 30, 14, 7, 4, 2.5, 1.6, 1.2, 1]
+VPX_SPEED_COST = [8, 4, 2.5, 1.6, 1.2, 1]
+
+# Resident memory of one encoder process is roughly a fixed part plus a number of bytes per pixel of
+# the frame size, mostly for lookahead and reference frames. High bit depth doubles the frame buffers.
+ENCODER_BASE_MEMORY = 150 << 20
+AOM_BYTES_PER_PIXEL = 260
+VPX_BYTES_PER_PIXEL = 90
+THREAD_MEMORY = 16 << 20
+# A new chunk's memory is counted as used, less and less, until its encoder had time to allocate it
+MEMORY_RAMP = 10
+MEMORY_POLL = 1
+MEMORY_NOTICE_INTERVAL = 60
+# The load controller looks at the cpu every LOAD_PERIOD seconds and adds workers below LOAD_LOW percent
+LOAD_PERIOD = 5
+LOAD_LOW = 85
+
+
+def chunk_memory(width, height, encoder='aom', bitDepth=8, threads=1):
+    perPixel = AOM_BYTES_PER_PIXEL if encoder == 'aom' else VPX_BYTES_PER_PIXEL
+    if bitDepth > 8:
+        perPixel *= 1.7
+    return int(ENCODER_BASE_MEMORY + width * height * perPixel + threads * THREAD_MEMORY)
+
+
+class MemoryGate:
+    # Admits a new chunk only if the memory it is expected to need is available, keeping reserve bytes
+    # free for everything else. Running encoders are never touched, the machine just starts fewer new ones.
+    def __init__(self, reserve=None):
+        total = psutil.virtual_memory().total
+        self.reserve = reserve if reserve is not None else max(512 << 20, total // 20)
+        self.launches = collections.deque()
+        self.lastNotice = None
+
+    def ramping(self):
+        now = time.monotonic()
+        while self.launches and now - self.launches[0][0] > MEMORY_RAMP:
+            self.launches.popleft()
+        return sum(need * (1 - (now - started) / MEMORY_RAMP) for started, need in self.launches)
+
+    def admits(self, need):
+        available = int(psutil.virtual_memory().available - self.reserve - self.ramping())
+        admitted = available >= need
+        if not admitted and (self.lastNotice is None or time.monotonic() - self.lastNotice > MEMORY_NOTICE_INTERVAL):
+            self.lastNotice = time.monotonic()
+            print("Low on memory, delaying new chunks (" + str(max(0, available) >> 20) + " MiB free, a chunk needs about " +
+                  str(need >> 20) + " MiB)")
+        return admitted
+
+    def started(self, need):
+        self.launches.append((time.monotonic(), need))
+
+
+def speed_cost(preset):
+    table = AOM_SPEED_COST if preset['enc'] == 0 else VPX_SPEED_COST
+    cost = table[max(0, min(preset['cpuused'], len(table) - 1))]
+    if preset['enc'] >= 1:
+        # libvpx is several times faster than libaom at the same cpu-used
+        cost /= 4
+    if preset['rtenc']:
+        cost /= 2
+    if preset['2p']:
+        # The first pass is much cheaper than the second
+        cost *= 1.3
+    if preset['isTargetVMAF']:
+        cost *= 1 + 0.5 * preset['TargetVMAFSteps'] / 4
+    return cost
+
+
+def job_cost(item):
+    # Estimated encode time of an [args, preset] queue item in arbitrary units, None when the
+    # input has not been probed
+    args, preset = item
+    info = args.get('media_info')
+    if not info or not info.get('frames'):
+        return None
+    width, height = info.get('width') or 1920, info.get('height') or 1080
+    if preset.get('rescale'):
+        width, height = preset['rescalex'], preset['rescaley']
+    return info['frames'] * width * height * speed_cost(preset)
+
+
+def queue_order(items, policy):
+    # Order to start queue items in, as a list of indexes. lpt starts the longest jobs first so the
+    # last ones to finish are short and run alongside each other instead of one long job running alone
+    # at the end. spt starts the shortest first so finished files show up sooner.
+    if policy not in ('lpt', 'spt'):
+        return list(range(len(items)))
+    costs = [job_cost(item) for item in items]
+    known = [c for c in costs if c is not None]
+    # Items that could not be probed are treated as typical ones
+    typical = statistics.median(known) if known else 0
+    costs = [typical if c is None else c for c in costs]
+    return sorted(range(len(items)), key=lambda i: costs[i], reverse=(policy == 'lpt'))
+
+
+def fair_shares(slots, demands):
+    # Water filling: every item gets an equal share of the budget, items that need less than
+    # their share give the rest back to the others. demands maps key -> (wanted, cost per chunk)
+    shares = {}
+    remaining = slots
+    pending = sorted(demands, key=lambda k: demands[k][0] * demands[k][1])
+    while pending:
+        share = remaining / len(pending)
+        key = pending.pop(0)
+        wanted, cost = demands[key]
+        given = min(wanted * cost, share)
+        shares[key] = given
+        remaining -= given
+    return shares
+
+
+class CoreBudget:
+    def __init__(self, slots=None, memory=None):
+        self.slots = slots if slots else (os.cpu_count() or 1)
+        self.memory = memory
+        self.cond = threading.Condition()
+        self.cost = {}
+        self.cap = {}
+        self.need = {}
+        self.backlog = {}
+        self.running = {}
+
+    def register(self, key, chunks, cost=1, cap=0, need=0):
+        # need is the memory one chunk is expected to use
+        with self.cond:
+            self.cost[key] = max(1, min(cost, self.slots))
+            self.cap[key] = cap
+            self.need[key] = need
+            self.backlog[key] = chunks
+            self.running[key] = 0
+            self.cond.notify_all()
+
+    def unregister(self, key):
+        with self.cond:
+            for d in (self.cost, self.cap, self.need, self.backlog, self.running):
+                d.pop(key, None)
+            self.cond.notify_all()
+
+    def set_slots(self, slots):
+        with self.cond:
+            self.slots = max(1, slots)
+            self.cond.notify_all()
+
+    def max_workers(self, cost=1):
+        return max(1, self.slots // max(1, cost))
+
+    def used(self):
+        return sum(self.running[k] * self.cost[k] for k in self.running)
+
+    def allowance(self, key):
+        demands = {k: (self.running[k] + self.backlog[k], self.cost[k]) for k in self.running}
+        return fair_shares(self.slots, demands)[key]
+
+    def can_start(self, key):
+        cost = self.cost[key]
+        if self.cap[key] and self.running[key] >= self.cap[key]:
+            return False
+        if self.running[key] == 0:
+            # Always let an item run at least one chunk so nothing starves
+            fits = self.used() + cost <= self.slots or self.used() == 0
+        elif self.used() + cost > self.slots:
+            return False
+        else:
+            fits = (self.running[key] + 1) * cost <= self.allowance(key)
+        # With nothing running a chunk always starts, waiting would not free any memory
+        return fits and (self.memory is None or self.used() == 0 or self.memory.admits(self.need[key]))
+
+    def wait(self):
+        # Memory is freed without anyone notifying, so poll while a memory gate is in use
+        self.cond.wait(MEMORY_POLL if self.memory is not None else None)
+
+    def acquire(self, key):
+        with self.cond:
+            while key in self.running and not self.can_start(key):
+                self.wait()
+            if key in self.running:
+                self.take(key)
+
+    def take(self, key):
+        # Caller holds cond and has checked can_start
+        self.running[key] += 1
+        self.backlog[key] = max(0, self.backlog[key] - 1)
+        if self.memory is not None:
+            self.memory.started(self.need[key])
+
+    def release(self, key):
+        with self.cond:
+            if key in self.running:
+                self.running[key] -= 1
+            self.cond.notify_all()
+
+    @contextmanager
+    def slot(self, key):
+        self.acquire(key)
+        try:
+            yield
+        finally:
+            self.release(key)
+
+
+class SlotLost(Exception):
+    # Raised by a job when the slot running it went away, like a remote worker disconnecting.
+    # The job is put back for another slot and the slot is dropped from the pool.
+    pass
+
+
+def drop(jobs):
+    # A cancelled future only wakes as_completed and wait once it is told it will never run
+    for future, _, _ in jobs:
+        if future.cancel():
+            future.set_running_or_notify_cancel()
+        elif future.running():
+            # Put back by a lost slot, nobody is waiting for its result anymore
+            future.set_result(None)
+
+
+class ChunkPool:
+    # One set of threads encodes the chunks of every running queue item. Items submit all their
+    # chunks up front and whichever thread is free takes the next chunk the budget allows, from
+    # any item, so an item down to its last chunks never holds on to idle workers.
+    # Waits on the budget's condition so releases and budget changes wake the pool directly.
+    # Extra slots, like remote workers, can be added. They take chunks without using the local budget.
+    def __init__(self, budget):
+        self.budget = budget
+        self.cond = budget.cond
+        self.pending = collections.OrderedDict()
+        self.threads = []
+        self.slots = []
+        self.local = threading.local()
+        self.closed = False
+
+    def submit(self, key, fn, *args):
+        future = concurrent.futures.Future()
+        with self.cond:
+            if self.closed:
+                raise RuntimeError("chunk pool is shut down")
+            self.pending.setdefault(key, collections.deque()).append((future, fn, args))
+            self.grow()
+            self.cond.notify_all()
+        return future
+
+    def grow(self):
+        # Enough threads for the budget to be used up by chunks that cost one slot each
+        while len(self.threads) < self.budget.slots:
+            t = threading.Thread(target=self.work, daemon=True)
+            self.threads.append(t)
+            t.start()
+
+    def add_slot(self, slot, accepts):
+        # accepts(key) tells whether the slot can run that item's chunks. Jobs see the slot through current_slot().
+        with self.cond:
+            self.slots.append(slot)
+        threading.Thread(target=self.work, args=[slot, accepts], daemon=True).start()
+
+    def current_slot(self):
+        return getattr(self.local, 'slot', None)
+
+    def cancel(self, key):
+        with self.cond:
+            jobs = self.pending.pop(key, ())
+            self.cond.notify_all()
+        drop(jobs)
+
+    def take(self, key):
+        jobs = self.pending[key]
+        job = jobs.popleft()
+        if not jobs:
+            del self.pending[key]
+        return key, job
+
+    def pick(self, accepts=None):
+        # Items that submitted first get the first chance, the budget keeps the split fair
+        for key in list(self.pending):
+            if key not in self.budget.running:
+                # Unregistered while chunks were waiting, nothing will run them
+                drop(self.pending.pop(key))
+            elif accepts is not None:
+                if accepts(key):
+                    self.budget.backlog[key] = max(0, self.budget.backlog[key] - 1)
+                    return self.take(key)
+            elif self.budget.can_start(key):
+                self.budget.take(key)
+                return self.take(key)
+        return None
+
+    def requeue(self, key, job):
+        with self.cond:
+            if key in self.budget.running and not self.closed:
+                self.pending[key] = self.pending.get(key, collections.deque())
+                self.pending[key].appendleft(job)
+                self.budget.backlog[key] += 1
+                self.cond.notify_all()
+                return
+        drop([job])
+
+    def work(self, slot=None, accepts=None):
+        self.local.slot = slot
+        while True:
+            with self.cond:
+                picked = None
+                while not self.closed:
+                    picked = self.pick(accepts)
+                    if picked is not None:
+                        break
+                    self.budget.wait()
+                if picked is None:
+                    return
+            key, job = picked
+            future, fn, args = job
+            try:
+                if future.running() or future.set_running_or_notify_cancel():
+                    try:
+                        future.set_result(fn(*args))
+                    except SlotLost as e:
+                        print("Lost " + str(slot) + ": " + str(e))
+                        self.requeue(key, job)
+                        with self.cond:
+                            self.slots.remove(slot)
+                        return
+                    except BaseException as e:
+                        future.set_exception(e)
+            finally:
+                if slot is None:
+                    self.budget.release(key)
+
+    def shutdown(self):
+        with self.cond:
+            self.closed = True
+            jobs = [job for queued in self.pending.values() for job in queued]
+            self.pending.clear()
+            self.cond.notify_all()
+        drop(jobs)
+        for slot in list(self.slots):
+            slot.close()
+
+
+class LoadController:
+    # Optional. Moves the budget between minSlots and maxSlots following the machine's cpu load, one
+    # worker (step slots) at a time. Adds a worker while cores sit idle and chunks are waiting, and
+    # gives one back when other programs need the cores the budget counts on.
+    def __init__(self, budget, pool, minSlots, maxSlots, step=1):
+        self.budget = budget
+        self.pool = pool
+        self.step = max(1, step)
+        self.minSlots = max(self.step, minSlots)
+        self.maxSlots = max(self.minSlots, maxSlots)
+        self.procs = {}
+        self.stopped = threading.Event()
+
+    def own_load(self):
+        # Cores used by qencoder and every encoder it started. psutil reports a process' use since
+        # the previous call, so the same Process objects are kept between samples.
+        me = psutil.Process()
+        total = 0.0
+        seen = {}
+        for proc in [me] + me.children(recursive=True):
+            proc = self.procs.get(proc.pid, proc)
+            try:
+                total += proc.cpu_percent(None)
+            except psutil.Error:
+                continue
+            seen[proc.pid] = proc
+        self.procs = seen
+        return total / 100
+
+    def sample(self):
+        cores = psutil.cpu_count() or 1
+        busy = psutil.cpu_percent(None) / 100 * cores
+        others = max(0.0, busy - self.own_load())
+        with self.budget.cond:
+            slots = self.budget.slots
+            waiting = any(self.budget.backlog.values())
+            saturated = self.budget.used() + self.step > slots
+            if others > max(0, cores - slots) + self.step / 2 and slots - self.step >= self.minSlots:
+                slots -= self.step
+            elif waiting and saturated and busy < cores * LOAD_LOW / 100 and slots + self.step <= self.maxSlots:
+                slots += self.step
+            else:
+                return
+            self.budget.set_slots(slots)
+            self.pool.grow()
+        print("CPU " + str(int(100 * busy / cores)) + "% busy, now running up to " + str(slots // self.step) +
+              " chunks at once")
+
+    def run(self):
+        while not self.stopped.wait(LOAD_PERIOD):
+            self.sample()
+
+    def start(self):
+        with self.budget.cond:
+            self.budget.set_slots(max(self.minSlots, min(self.maxSlots, self.budget.slots)))
+        # The first sample of each counter only starts the measurement
+        psutil.cpu_percent(None)
+        self.own_load()
+        threading.Thread(target=self.run, daemon=True).start()
+
+    def stop(self):
+        self.stopped.set()
@@ -0,0 +1,367 @@
+# This Python file uses the following encoding: utf-8
+# Per scene target quality for av1an. This replaces av1an's per_shot_target_quality so probe results
+# (q -> vmaf) are saved on disk for every scene. Encoding the same scene again with another target, or
+# resuming an encode, reuses them and only runs probe encodes the saved points cannot answer.
+import math
+import os
+import re
+import sqlite3
+import subprocess
+import threading
+import time
+
+from qencoder.cache import cache_dir, cache_key, file_fingerprint
+from qencoder.metrics import record_busy
+
+# Bump when the probe encodes change (av1an's probe speed and settings) so older results are not reused
+PROBE_VERSION = 1
+# Change of transformed vmaf per q step av1an assumes before anything is measured
+DEFAULT_SLOPE = -0.18
+# Adaptive probing aims for about this many frames in every probe
+SAMPLED_FRAMES = 48
+
+cacheLock = threading.Lock()
+probeCache = None
+fingerprints = {}
+frameRates = {}
+
+
+def transform_vmaf(vmaf):
+    # Same transform av1an uses, vmaf is close to linear in q after it
+    if vmaf < 99.99:
+        return -math.log(1 - vmaf / 100)
+    return 9.210340371976184
+
+
+class ProbeCache:
+    def __init__(self, path=None):
+        self.path = path or os.path.join(cache_dir('probes'), 'probes.sqlite')
+        self.lock = threading.Lock()
+        self.db = sqlite3.connect(self.path, timeout=30, check_same_thread=False)
+        with self.lock, self.db:
+            self.db.execute("CREATE TABLE IF NOT EXISTS probes (scene TEXT, q INTEGER, vmaf REAL, "
+                            "PRIMARY KEY (scene, q))")
+
+    def points(self, scene):
+        with self.lock:
+            return dict(self.db.execute("SELECT q, vmaf FROM probes WHERE scene = ?", (scene,)).fetchall())
+
+    def add(self, scene, q, vmaf):
+        with self.lock, self.db:
+            self.db.execute("INSERT OR REPLACE INTO probes VALUES (?, ?, ?)", (scene, q, vmaf))
+
+
+def probe_cache():
+    global probeCache
+    with cacheLock:
+        if probeCache is None:
+            probeCache = ProbeCache()
+        return probeCache
+
+
+def content_fingerprint(path):
+    st = os.stat(path)
+    stamp = (str(path), st.st_size, st.st_mtime_ns)
+    if stamp not in fingerprints:
+        fingerprints[stamp] = file_fingerprint(path)
+    return fingerprints[stamp]
+
+
+def scene_key(project, chunk, rate):
+    # Files in the chunk's generation command are hashed instead of using their paths,
+    # so the same scene encoded to another output (another temp folder) gets the same key.
+    source = project.input[0] if isinstance(project.input, (list, tuple)) else project.input
+    temp = str(project.temp)
+    gen = []
+    for arg in chunk.ffmpeg_gen_cmd:
+        arg = str(arg)
+        if arg.endswith('.vpy'):
+            # vapoursynth scripts are written to temp and load the source
+            gen.append(content_fingerprint(source))
+        elif os.path.isfile(arg):
+            gen.append(content_fingerprint(arg))
+        else:
+            gen.append(arg.replace(temp, ''))
+    return cache_key({'gen': gen, 'frames': chunk.frames, 'encoder': project.encoder,
+                      'ffmpeg': project.ffmpeg_pipe, 'vmaf_path': project.vmaf_path,
+                      'vmaf_res': project.vmaf_res, 'vmaf_filter': project.vmaf_filter,
+                      'rate': rate, 'version': PROBE_VERSION})
+
+
+class SceneProbes:
+    # The known q -> vmaf points of one scene. Starts with the cached ones, probes whatever else is asked for.
+    def __init__(self, project, chunk, rate, cache=None):
+        self.project = project
+        self.chunk = chunk
+        self.rate = rate
+        self.cache = cache
+        self.key = None
+        self.points = {}
+        self.probed = 0
+        if cache is not None:
+            try:
+                self.key = scene_key(project, chunk, rate)
+                self.points = cache.points(self.key)
+            except (OSError, sqlite3.Error) as e:
+                print("Unable to use the probe cache: " + str(e))
+                self.cache = None
+
+    def score(self, q):
+        if q not in self.points:
+            from av1an.target_quality.target_quality import vmaf_probe
+            from av1an.vmaf import VMAF
+            self.points[q] = VMAF.read_weighted_vmaf(vmaf_probe(self.chunk, q, self.project, self.rate))
+            self.probed += 1
+            if self.cache is not None:
+                try:
+                    self.cache.add(self.key, q, self.points[q])
+                except sqlite3.Error as e:
+                    print("Unable to save probe: " + str(e))
+        return self.points[q]
+
+
+def clamp(q, minQ, maxQ):
+    return max(minQ, min(maxQ, q))
+
+
+def interpolate_q(q1, vmaf1, q2, vmaf2, target):
+    if transform_vmaf(vmaf1) == transform_vmaf(vmaf2):
+        return q1
+    t = (transform_vmaf(target) - transform_vmaf(vmaf1)) / (transform_vmaf(vmaf2) - transform_vmaf(vmaf1))
+    return int(round(q1 + t * (q2 - q1)))
+
+
+def known_q(points, target, minQ, maxQ, gap=2):
+    # Answers from known points alone when they already pin the target down: either an end of the
+    # q range settles it, or two points at most gap apart lie on both sides of the target.
+    if minQ in points and points[minQ] < target:
+        return minQ
+    if maxQ in points and points[maxQ] >= target:
+        return maxQ
+    above = [q for q in points if minQ <= q <= maxQ and points[q] >= target]
+    below = [q for q in points if minQ <= q <= maxQ and points[q] < target]
+    if not above or not below:
+        return None
+    hi = max(above)
+    lo = min(below)
+    if lo < hi or lo - hi > gap:
+        return None
+    return clamp(interpolate_q(hi, points[hi], lo, points[lo], target), hi, lo)
+
+
+def search_q(probes, target, minQ, maxQ, steps):
+    # av1an's per shot search, with every probe going through the cache
+    from av1an.target_quality.target_quality import get_target_q, weighted_search
+    lastQ = (minQ + maxQ) // 2
+    score = probes.score(lastQ)
+    if steps < 3:
+        # Euler's method with the known relation between cq and vmaf, then once more with the measured slope
+        nextQ = int(round(lastQ + (transform_vmaf(target) - transform_vmaf(score)) / DEFAULT_SLOPE))
+        nextQ = clamp(nextQ, minQ, maxQ)
+        if steps == 1 or nextQ == lastQ:
+            return nextQ
+        score2 = probes.score(nextQ)
+        deriv = (transform_vmaf(score2) - transform_vmaf(score)) / (nextQ - lastQ)
+        if deriv == 0:
+            return nextQ
+        return clamp(int(round(nextQ + (transform_vmaf(target) - transform_vmaf(score2)) / deriv)), minQ, maxQ)
+
+    visited = [(score, lastQ)]
+    nextQ = minQ if score < target else maxQ
+    score = probes.score(nextQ)
+    visited.append((score, nextQ))
+    if nextQ == minQ and score < target:
+        return nextQ
+    if nextQ == maxQ and score > target:
+        return nextQ
+    lower, qLower = visited[0]
+    upper, qUpper = visited[0]
+    if score < target:
+        lower, qLower = score, nextQ
+    else:
+        upper, qUpper = score, nextQ
+    for _ in range(steps - 2):
+        newQ = weighted_search(qLower, lower, qUpper, upper, target)
+        if newQ in [x[1] for x in visited]:
+            break
+        score = probes.score(newQ)
+        visited.append((score, newQ))
+        if score < target:
+            lower, qLower = score, newQ
+        else:
+            upper, qUpper = score, newQ
+    return get_target_q(visited, target)[0]
+
+
+def fit_line(points):
+    # Least squares line through (q, transformed vmaf), returns (slope, intercept)
+    qs = list(points)
+    ts = [transform_vmaf(points[q]) for q in qs]
+    meanQ = sum(qs) / len(qs)
+    meanT = sum(ts) / len(ts)
+    var = sum((q - meanQ) ** 2 for q in qs)
+    if var == 0:
+        return None
+    slope = sum((q - meanQ) * (t - meanT) for q, t in zip(qs, ts)) / var
+    return slope, meanT - slope * meanQ
+
+
+def predict_q(points, target, slope):
+    # Secant through the two points closest to the target, or the given slope from the closest point
+    nearest = sorted(points, key=lambda q: abs(points[q] - target))
+    q1 = nearest[0]
+    if len(nearest) > 1:
+        q2 = nearest[1]
+        measured = (transform_vmaf(points[q2]) - transform_vmaf(points[q1])) / (q2 - q1)
+        if measured < 0:
+            slope = measured
+    return int(round(q1 + (transform_vmaf(target) - transform_vmaf(points[q1])) / slope))
+
+
+def fit_search_q(probes, target, minQ, maxQ, steps, seed=None, tolerance=0.5):
+    # Probes where the scene's q -> vmaf line says the target is. The first guess comes from a neighbouring
+    # scene's line when there is one, and the search stops once a probe lands within tolerance of the target.
+    slope = DEFAULT_SLOPE
+    if seed is not None:
+        slope = seed[0]
+        q = clamp(int(round((transform_vmaf(target) - seed[1]) / seed[0])), minQ, maxQ)
+    else:
+        q = (minQ + maxQ) // 2
+    for _ in range(steps):
+        score = probes.score(q)
+        if abs(score - target) <= tolerance:
+            return q
+        points = {k: v for k, v in probes.points.items() if minQ <= k <= maxQ}
+        answer = known_q(points, target, minQ, maxQ, 1)
+        if answer is not None:
+            return answer
+        nextQ = clamp(predict_q(points, target, slope), minQ, maxQ)
+        above = [k for k in points if points[k] >= target]
+        below = [k for k in points if points[k] < target]
+        if above and below and max(above) + 1 < min(below):
+            nextQ = clamp(nextQ, max(above) + 1, min(below) - 1)
+        if nextQ in points:
+            break
+        q = nextQ
+    points = {k: v for k, v in probes.points.items() if minQ <= k <= maxQ}
+    answer = known_q(points, target, minQ, maxQ, maxQ - minQ)
+    if answer is not None:
+        return answer
+    return clamp(predict_q(points, target, slope), minQ, maxQ)
+
+
+def scene_line(points, minQ, maxQ):
+    points = {k: v for k, v in points.items() if minQ <= k <= maxQ}
+    if not points:
+        return None
+    line = fit_line(points)
+    if line is None or line[0] >= 0:
+        q = next(iter(points))
+        return DEFAULT_SLOPE, transform_vmaf(points[q]) - DEFAULT_SLOPE * q
+    return line
+
+
+def neighbour_line(project, index):
+    lines = getattr(project, 'tq_lines', {})
+    if not lines:
+        return None
+    return lines[min(lines, key=lambda i: abs(i - index))]
+
+
+def save_line(project, index, line):
+    with cacheLock:
+        if not hasattr(project, 'tq_lines'):
+            project.tq_lines = {}
+    if line is not None:
+        project.tq_lines[index] = line
+
+
+def chunk_start(chunk):
+    cmd = [str(arg) for arg in chunk.ffmpeg_gen_cmd]
+    if cmd[0] == 'vspipe' and '-s' in cmd:
+        return int(cmd[cmd.index('-s') + 1])
+    for arg in cmd:
+        m = re.search(r"between\(n\\,(\d+)\\,", arg)
+        if m:
+            return int(m.group(1))
+    return None
+
+
+def frame_rate(source):
+    if source not in frameRates:
+        out = subprocess.run(['ffprobe', '-v', 'error', '-select_streams', 'v:0', '-show_entries',
+                              'stream=r_frame_rate', '-of', 'csv=p=0', str(source)],
+                             stdout=subprocess.PIPE, check=True, universal_newlines=True).stdout
+        num, _, den = out.strip().partition('/')
+        frameRates[source] = float(num) / float(den or 1)
+    return frameRates[source]
+
+
+def packet_bytes(source, start, frames):
+    # Only demuxes, so this is cheap even for long chunks
+    interval = "%.3f" % (start / frame_rate(source)) + "%+#" + str(frames)
+    out = subprocess.run(['ffprobe', '-v', 'error', '-select_streams', 'v:0', '-read_intervals', interval,
+                          '-show_entries', 'packet=size', '-of', 'csv=p=0', str(source)],
+                         stdout=subprocess.PIPE, check=True, universal_newlines=True).stdout
+    return sum(int(line) for line in out.split() if line.isdigit())
+
+
+def chunk_complexity(project, chunk):
+    # Compressed bytes per frame of the chunk compared with the whole source. Busy, high motion
+    # scenes compress worse than static ones, so this works as a cheap measure of complexity.
+    source = project.input[0] if isinstance(project.input, (list, tuple)) else project.input
+    try:
+        average = os.path.getsize(str(source)) / project.get_frames()
+        if chunk.fake_input_path.exists():
+            size = chunk.fake_input_path.stat().st_size
+        else:
+            start = chunk_start(chunk)
+            if start is None:
+                return None
+            size = packet_bytes(source, start, chunk.frames)
+        return size / chunk.frames / average
+    except (OSError, ValueError, ZeroDivisionError, subprocess.SubprocessError) as e:
+        print("Unable to measure complexity of chunk " + str(chunk.name) + ": " + str(e))
+        return None
+
+
+def adaptive_rate(frames, complexity, minRate, maxRate):
+    # Long scenes are probed sparser, and complex ones denser than their length alone would give
+    rate = frames / SAMPLED_FRAMES
+    if complexity:
+        rate /= clamp(complexity, 0.5, 2.0)
+    return clamp(int(rate), minRate, maxRate)
+
+
+def probing_rate(project, chunk):
+    minRate = getattr(project, 'probe_rate_min', None)
+    maxRate = getattr(project, 'probe_rate_max', None)
+    if not minRate or not maxRate:
+        # av1an only honours 1 and 2, anything else probes every 4th frame
+        return project.probing_rate if project.probing_rate in (1, 2) else 4
+    if minRate >= maxRate:
+        return minRate
+    return adaptive_rate(chunk.frames, chunk_complexity(project, chunk), minRate, maxRate)
+
+
+def per_shot_target_quality(chunk, project):
+    from av1an.logger import log
+    rate = probing_rate(project, chunk)
+    probes = SceneProbes(project, chunk, rate, probe_cache())
+    cached = len(probes.points)
+    q = known_q(probes.points, project.target_quality, project.min_q, project.max_q)
+    if q is None and getattr(project, 'tq_search', 'bisect') == 'fit':
+        q = fit_search_q(probes, project.target_quality, project.min_q, project.max_q, project.probes,
+                         neighbour_line(project, chunk.index), getattr(project, 'tq_tolerance', 0.5))
+    elif q is None:
+        q = search_q(probes, project.target_quality, project.min_q, project.max_q, project.probes)
+    save_line(project, chunk.index, scene_line(probes.points, project.min_q, project.max_q))
+    log("Chunk: " + str(chunk.name) + ", Rate: " + str(rate) + ", Fr: " + str(chunk.frames) + "\n" +
+        "Target Q: " + str(q) + ", probes: " + str(probes.probed) + ", cached points: " + str(cached) + "\n\n")
+    return q
+
+
+def per_shot_target_quality_routine(project, chunk):
+    start = time.perf_counter()
+    chunk.per_shot_target_quality_cq = per_shot_target_quality(chunk, project)
+    record_busy(project, 'target_quality', time.perf_counter() - start)
@@ -1,51 +1,34 @@
 #!/usr/bin/python3
 # This Python file uses the following encoding: utf-8
-import glob
 import shlex
-import concurrent
-import concurrent.futures
-import threading
 
 from PyQt5 import QtCore
-from PyQt5.QtWidgets import QFileDialog, QMainWindow, QMessageBox
+from PyQt5.QtWidgets import QFileDialog, QMainWindow, QMessageBox, QProgressDialog
 from functools import partial
 
 import signal
 import sys
+import threading
 
-from qencoder.av1anworkarounds import run_av1an, get_av1an, get_av1an_proj, merge_args, done_count
+from qencoder.autotune import AutotuneError, autotune
+from qencoder.av1anworkarounds import lsmash_available, scenedetect_available
+from qencoder.ingest import ingest_folder
 from qencoder.mainwindow import Ui_qencoder
-from av1an.arg_parse import Args
-from av1an.manager import Manager
-from av1an.startup.setup import startup_check
-
-import traceback
+from qencoder.mediaprobe import media_info
+from qencoder.presets import config_path, encode_size, get_args, get_audio_params, get_ffmpeg_params, \
+    get_split_method, get_video_params, get_vmaf_filter, get_vmaf_res, match_input_format
+from qencoder.queuemodel import QueueModel
+from qencoder.queuestore import QueueList, QueueStore, autosave_path
+from qencoder.runner import QueueRunner
+from qencoder.scheduler import ORDER_POLICIES, queue_order
 
 from pathlib import Path
 import os
-from time import sleep
-import psutil
 import multiprocessing
 from multiprocessing.managers import BaseManager, NamespaceProxy
 
 import pickle
 
-canLoadScenedetect = 1
-
-try:
-    from scenedetect.video_manager import VideoManager
-except ImportError as e:
-    canLoadScenedetect = 0
-    print("Error loading pyscenedetect. Either it is missing or not properly installed.")
-
-hasLsmash = 1
-try:
-    from vapoursynth import core
-    core.lsmas.get_functions()
-except:
-    hasLsmash = 0
-    print("Error loading lsmash. Either vapoursynth is missing or lsmash is not installed.")
-
 # baseUIClass, baseUIWidget = uic.loadUiType("mainwindow.ui")
 
 
@@ -58,27 +41,31 @@ class window(QMainWindow, Ui_qencoder):
     runningQueueMode = False
     currentFrames = 0
     totalFrames = 0
+    currentChunks = []
     encodeStage = 0
-    encodeList = []
     currentFile = ""
     scenedetectFailState = -1
     currentlyRunning = 0
-    killFlag = 0
-    if 'APPDATA' in os.environ:
-        confighome = os.environ['APPDATA']
-    elif 'XDG_CONFIG_HOME' in os.environ:
-        confighome = os.environ['XDG_CONFIG_HOME']
-    else:
-        confighome = os.path.join(os.environ['HOME'], '.config')
-    configpath = os.path.join(confighome, 'qencoder.qec')
+    configpath = config_path()
 
     def __init__(self, *args, **kwargs):
-        global canLoadScenedetect
-        global hasLsmash
-        self.canLoadScenedetect = canLoadScenedetect
-        self.hasLsmash = hasLsmash
+        self.canLoadScenedetect = 1
+        self.hasLsmash = 0
         QMainWindow.__init__(self, *args, **kwargs)
         self.setupUi(self)
+        # The queue is journaled to the config folder as it changes, so it survives crashes and restarts
+        self.queueStore = QueueStore(autosave_path())
+        self.encodeList = QueueList(self.queueStore)
+        self.queueModel = QueueModel(self.encodeList, self)
+        self.listView_queue.setModel(self.queueModel)
+        # Autotune results by tune_key, saved with the preset
+        self.autotuneTable = {}
+        self.autotuneWorker = None
+        self.stoppingEncode = False
+        # (path, media info) from the last input probe, see currentInputInfo
+        self.inputInfo = (None, None)
+        # Queue items that encoded successfully, removed from the queue once the run is over
+        self.completedItems = set()
         self.inputFileChoose.clicked.connect(self.inputFileSelect)
         self.outputFileChoose.clicked.connect(self.outputFileSelect)
         self.pushButton_vmafmodel.clicked.connect(self.inputVmafSelect)
@@ -117,18 +104,22 @@ class window(QMainWindow, Ui_qencoder):
         self.actionOpen_Preset.triggered.connect(self.openPresetFrom)
         self.actionReset_All_Settings.triggered.connect(self.resetAllSettings)
         self.actionAdd_folder_to_queue.triggered.connect(self.addFolderToQueue)
+        self.actionAutotune.triggered.connect(self.autotuneSplit)
         self.pushButton_save.setEnabled(0)
         self.pushButton_save.clicked.connect(self.saveToQueue)
         self.tabWidget.currentChanged[int].connect(self.setCustomText)
         self.pushButton_up.clicked.connect(self.queueMoveUp)
         self.pushButton_down.clicked.connect(self.queueMoveDown)
         self.pushButton_del.clicked.connect(self.removeFromQueue)
+        self.pushButton_cancelitem.clicked.connect(self.cancelQueueItem)
         self.pushButton_edit.clicked.connect(self.editCurrentQueue)
         self.checkBox_cropping.clicked.connect(self.enableCropping)
         self.checkBox_rescale.clicked.connect(self.enableRescale)
         self.checkBox_vmaf.clicked.connect(self.enableDisableVmaf)
+        self.checkBox_adaptive.clicked.connect(self.enableAdaptive)
         if (len(sys.argv) > 1):
             self.inputPath.setText(sys.argv[1])
+            self.probeInput(sys.argv[1])
 
         # this dictionary will be use to map combobox index into a values
         self.qualitydict = {
@@ -167,13 +158,28 @@ class window(QMainWindow, Ui_qencoder):
             self.enableCropping()
             self.enableRescale()
             self.enableDisableVmaf()
+        self.updateQueueButtons()
         # self.speedButton.changeEvent.connect(self.setSpeed)
-        self.checkBox_lsmash.setEnabled(hasLsmash)
-        if canLoadScenedetect == 0:
+        self.checkBox_lsmash.setEnabled(self.hasLsmash)
+        self.changeSplitmode(self.comboBox_splitmode.currentIndex(), False)
+        # Importing vapoursynth and scenedetect is slow, so check for them once the window is up
+        self.capabilityProbe = CapabilityProbe()
+        self.capabilityProbe.finished.connect(self.setCapabilities)
+        QtCore.QTimer.singleShot(0, self.capabilityProbe.start)
+
+    def setCapabilities(self, canLoadScenedetect, hasLsmash):
+        self.canLoadScenedetect = canLoadScenedetect
+        self.hasLsmash = hasLsmash
+        if not hasLsmash:
+            print("Error loading lsmash. Either vapoursynth is missing or lsmash is not installed.")
+        if not self.runningEncode:
+            self.checkBox_lsmash.setEnabled(hasLsmash)
+        if not canLoadScenedetect:
+            print("Error loading pyscenedetect. Either it is missing or not properly installed.")
             if self.comboBox_splitmode.currentIndex() == 2:
                 self.comboBox_splitmode.setCurrentIndex(0)
+                self.changeSplitmode(0)
             self.comboBox_splitmode.model().item(2).setEnabled(False)
-        self.changeSplitmode(self.comboBox_splitmode.currentIndex(), False)
 
     def changeSplitmode(self, newPreset, setval=True):
         if newPreset == 0:
@@ -197,6 +203,7 @@ class window(QMainWindow, Ui_qencoder):
             self.doubleSpinBox_split.setSingleStep(1)
             self.doubleSpinBox_split.setDecimals(0)
             self.spinBox_maxkfdist.setMinimum(0)
+        self.checkBox_parallelsd.setEnabled(newPreset == 2 and not self.runningEncode)
 
     def enableDisableVmaf(self):
         state = self.checkBox_vmaf.isChecked()
@@ -210,6 +217,17 @@ class window(QMainWindow, Ui_qencoder):
         self.doubleSpinBox_vmaf.setEnabled(state)
         self.spinBox_maxq.setEnabled(state)
         self.label_maxq.setEnabled(state)
+        self.label_tqsearch.setEnabled(state)
+        self.comboBox_tqsearch.setEnabled(state)
+        self.label_proberate.setEnabled(state)
+        self.spinBox_proberatemin.setEnabled(state)
+        self.spinBox_proberatemax.setEnabled(state)
+
+    def enableAdaptive(self):
+        state = self.checkBox_adaptive.isChecked() and self.checkBox_adaptive.isEnabled()
+        self.spinBox_adaptivemin.setEnabled(state)
+        self.label_adaptiveto.setEnabled(state)
+        self.spinBox_adaptivemax.setEnabled(state)
 
     def enableRescale(self):
         state = self.checkBox_rescale.isChecked()
@@ -227,38 +245,75 @@ class window(QMainWindow, Ui_qencoder):
 
     def addFolderToQueue(self):
         buttonReply = QMessageBox.question(self, 'Add folder to queue?',
-                                           "The folder chosen will have all detected video files in it added to the queue using the current settings. Make sure your settings are correct before doing this. Continue?",
+                                           "The folder chosen and all folders inside it will have their video files added to the queue using the current settings. Make sure your settings are correct before doing this. Continue?",
                                            QMessageBox.Yes | QMessageBox.No, QMessageBox.No)
         if buttonReply != QMessageBox.Yes:
             return
-        else:
-            foldername = QFileDialog.getExistingDirectory(caption="Input Folder")
-            newfoldername = QFileDialog.getExistingDirectory(caption="Output Folder")
-            add_enc = False
-            if foldername == newfoldername:
-                add_enc = True
-            types = ('*.mkv', '*.mp4', '*.webm', '*.y4m', '*.avi')
-            files_grabbed = []
-            for files in types:
-                files_grabbed.extend(glob.glob(foldername + "/" + files))
-            for fil in files_grabbed:
-                if os.path.isdir(fil):
-                    continue
-                self.inputPath.setText(fil)
-                dirn, fname = os.path.split(fil)
-                if add_enc:
-                    fname = "enc_" + fname
-                if not fname.endswith(".mkv") and not fname.endswith(".webm"):
-                    fname = fname + ".mkv"
-                self.outputPath.setText(os.path.join(newfoldername, fname))
-                self.saveToQueue()
-            self.inputPath.setText("")
-            self.outputPath.setText("")
-            self.pushButton.setEnabled(False)
+        foldername = QFileDialog.getExistingDirectory(caption="Input Folder")
+        if not foldername:
+            return
+        newfoldername = QFileDialog.getExistingDirectory(caption="Output Folder")
+        if not newfoldername:
+            return
+        self.ingestProgress = QProgressDialog("Looking for videos...", "Cancel", 0, 0, self)
+        self.ingestProgress.setWindowTitle("Add folder to queue")
+        self.ingestProgress.setMinimumDuration(500)
+        self.ingestWorker = IngestWorker(foldername, newfoldername, self.getPresetDict(),
+                                         self.checkBox_lsmash.isEnabled())
+        self.ingestWorker.batch.connect(self.ingestBatch)
+        self.ingestWorker.progress.connect(self.ingestStatus)
+        self.ingestWorker.finished.connect(self.ingestFinished)
+        self.ingestProgress.canceled.connect(self.ingestWorker.cancel)
+        self.actionAdd_folder_to_queue.setEnabled(False)
+        self.ingestWorker.start()
+
+    def ingestBatch(self, items):
+        self.queueModel.append_items(items)
+        self.updateQueueButtons()
+
+    def ingestStatus(self, added, skipped):
+        self.ingestProgress.setLabelText("Added " + str(added) + " videos, skipped " + str(skipped) + " files")
+
+    def ingestFinished(self, added, skipped):
+        self.ingestProgress.reset()
+        self.label_queueprog.setText("Added " + str(added) + " videos from folder, skipped " + str(skipped))
+        self.actionAdd_folder_to_queue.setEnabled(True)
+        self.updateQueueButtons()
+        if added:
             self.tabWidget.setCurrentIndex(5)
 
+    def autotuneSplit(self):
+        if self.runningEncode or self.autotuneWorker is not None:
+            return
+        if not os.path.isfile(self.inputPath.text()):
+            self.label_status.setText("Choose an input video to autotune with")
+            return
+        buttonReply = QMessageBox.question(self, 'Autotune jobs and threads?',
+                                           "A short sample of the input video will be encoded with the current settings at several jobs and threads splits. This uses every core and can take a few minutes, start encodes once it is done. Continue?",
+                                           QMessageBox.Yes | QMessageBox.No, QMessageBox.No)
+        if buttonReply != QMessageBox.Yes:
+            return
+        self.autotuneWorker = AutotuneWorker(self.getPresetDict(), self.inputPath.text())
+        self.autotuneWorker.progress.connect(self.label_status.setText)
+        self.autotuneWorker.finished.connect(self.autotuneFinished)
+        self.actionAutotune.setEnabled(False)
+        self.autotuneWorker.start()
+
+    def autotuneFinished(self, result, error):
+        self.autotuneWorker = None
+        self.actionAutotune.setEnabled(not self.runningEncode)
+        if error:
+            self.label_status.setText("Autotune failed: " + error)
+            return
+        key, best, results = result
+        self.autotuneTable[key] = best
+        self.spinBox_jobs.setValue(best['jobs'])
+        self.spinBox_threads.setValue(best['threads'])
+        self.label_status.setText("Autotune: " + str(best['jobs']) + " jobs x " + str(best['threads']) +
+                                  " threads is fastest for " + key + " at " + str(best['fps']) + " fps")
+
     def editCurrentQueue(self):
-        if (self.listWidget.currentRow() <= -1):
+        if (self.currentQueueRow() <= -1):
             return
         buttonReply = QMessageBox.question(self, 'Overwrite existing encode settings?',
                                            "Clicking yes will move the queue item into your current encoding settings allowing you to edit it, but it will also override your existing encoding settings.",
@@ -266,13 +321,14 @@ class window(QMainWindow, Ui_qencoder):
         if buttonReply != QMessageBox.Yes:
             return
         else:
-            self.setFromPresetDict(self.encodeList[self.listWidget.currentRow()][1], True)
-            self.inputPath.setText(str(self.encodeList[self.listWidget.currentRow()][0]['input'][0]))
-            self.outputPath.setText(str(self.encodeList[self.listWidget.currentRow()][0]['output_file']))
+            self.setFromPresetDict(self.encodeList[self.currentQueueRow()][1], True)
+            self.inputPath.setText(str(self.encodeList[self.currentQueueRow()][0]['input'][0]))
+            self.inputInfo = (self.inputPath.text(), self.encodeList[self.currentQueueRow()][0].get('media_info'))
+            self.outputPath.setText(str(self.encodeList[self.currentQueueRow()][0]['output_file']))
             self.pushButton.setEnabled(1)
             self.pushButton_save.setEnabled(1)
-            del self.encodeList[self.listWidget.currentRow()]
-            self.redrawQueueList()
+            self.queueModel.remove_row(self.currentQueueRow())
+            self.updateQueueButtons()
             self.enableCropping()
             self.enableRescale()
             self.enableDisableVmaf()
@@ -284,7 +340,11 @@ class window(QMainWindow, Ui_qencoder):
                 self.pushButton.setEnabled(1)
                 self.label_status.setText("Encoding complete!")
                 self.progressBar_total.setValue(100)
-                self.finalizeEncode()
+                self.finalizeEncode(cancel=False)
+            elif errorCode == 2:
+                if self.runningEncode:
+                    self.finalizeEncode()
+                self.label_status.setText("Encode cancelled")
             else:
                 self.pushButton.setEnabled(1)
                 self.pushButton.setStyleSheet("color: red; background-color: white")
@@ -292,26 +352,54 @@ class window(QMainWindow, Ui_qencoder):
                 self.label_status.setText("ERR. See temp/log.log")
         else:
             taskNumber = int(taskname)
-            q = self.getQueueIndexData(taskNumber)
-            item = self.listWidget.item(taskNumber)
+            if taskNumber >= len(self.encodeList):
+                return
             if errorCode == 0:
-                item.setText("Complete: " + q)
+                self.queueModel.set_status(taskNumber, "Complete: ")
+                self.completedItems.add(self.encodeList.ids[taskNumber])
+            elif errorCode == 2:
+                self.queueModel.set_status(taskNumber, "Cancelled: ")
             else:
-                item.setText("Failed: " + q)
+                self.queueModel.set_status(taskNumber, "Failed: ")
+
+    def workerFinished(self):
+        if self.stoppingEncode:
+            self.finalizeEncode()
+
+    def cancelQueueItem(self):
+        if (not self.runningEncode) or (not self.runningQueueMode) or self.currentQueueRow() <= -1:
+            return
+        buttonReply = QMessageBox.question(self, 'Cancel queue item?',
+                                           "The selected item will stop encoding. Other items keep running and its temp folder is kept so it can be resumed later.",
+                                           QMessageBox.Yes | QMessageBox.No, QMessageBox.No)
+        if buttonReply != QMessageBox.Yes:
+            return
+        self.worker.runner.cancel_job(self.currentQueueRow())
 
     def addFrames(self, taskname, addFrames):
         if not self.runningQueueMode:
             self.currentFrames += addFrames
             self.progressBar_total.setValue(int(90 * self.currentFrames / self.totalFrames) + 10)
-            self.label_status.setText("Encoding: " + str(self.currentFrames) + "/" + str(self.totalFrames))
+            self.label_status.setText("Encoding: " + str(self.currentFrames) + "/" + str(self.totalFrames) +
+                                      self.getChunkText(0))
         else:
             taskNumber = int(taskname)
+            if taskNumber >= len(self.encodeList):
+                return
             self.currentFrames[taskNumber] += addFrames
-            q = self.getQueueIndexData(taskNumber)
-            item = self.listWidget.item(taskNumber)
-            item.setText("Encoding: " + str(self.currentFrames[taskNumber]) + "/" +
-                         str(self.totalFrames[taskNumber]) + " progress: " +
-                         str(int(90 * self.currentFrames[taskNumber] / self.totalFrames[taskNumber]) + 10) + "% " + q)
+            self.queueModel.set_status(taskNumber, "Encoding: " + str(self.currentFrames[taskNumber]) + "/" +
+                                       str(self.totalFrames[taskNumber]) + " progress: " +
+                                       str(int(90 * self.currentFrames[taskNumber] / self.totalFrames[taskNumber]) + 10) +
+                                       "%" + self.getChunkText(taskNumber) + " ")
+
+    def chunksDone(self, taskname, doneChunks, totalChunks):
+        taskNumber = int(taskname) if self.runningQueueMode else 0
+        self.currentChunks[taskNumber] = (doneChunks, totalChunks)
+
+    def getChunkText(self, taskNumber):
+        if self.currentChunks[taskNumber] is None:
+            return ""
+        return " (" + str(self.currentChunks[taskNumber][0]) + "/" + str(self.currentChunks[taskNumber][1]) + " chunks)"
 
     def startEncode(self, taskname, totalFrames, initFrames):
         if not self.runningQueueMode:
@@ -321,11 +409,12 @@ class window(QMainWindow, Ui_qencoder):
             self.label_status.setText("Encoding: " + str(initFrames) + "/" + str(totalFrames))
         else:
             taskNumber = int(taskname)
+            if taskNumber >= len(self.encodeList):
+                return
             self.currentFrames[taskNumber] = initFrames
             self.totalFrames[taskNumber] = totalFrames
-            q = self.getQueueIndexData(taskNumber)
-            item = self.listWidget.item(taskNumber)
-            item.setText("Encoding: " + str(initFrames) + "/" + str(totalFrames) + " progress: " + str(int(90 * initFrames / totalFrames) + 10) + "% " + q)
+            self.queueModel.set_status(taskNumber, "Encoding: " + str(initFrames) + "/" + str(totalFrames) + " progress: " +
+                                       str(int(90 * initFrames / totalFrames) + 10) + "% ")
             self.label_status.setText("See queue for progress")
 
     def newTask(self, taskname, taskDesc: str, taskFrames: int):
@@ -336,9 +425,9 @@ class window(QMainWindow, Ui_qencoder):
         else:
             if taskDesc.startswith("Pyscene"):
                 taskNumber = int(taskname)
-                q = self.getQueueIndexData(taskNumber)
-                item = self.listWidget.item(taskNumber)
-                item.setText("Pyscenedetect... please wait " + q)
+                if taskNumber >= len(self.encodeList):
+                    return
+                self.queueModel.set_status(taskNumber, "Pyscenedetect... please wait ")
 
     def resetAllSettings(self):
         buttonReply = QMessageBox.question(self, 'Factory reset all settings?',
@@ -390,8 +479,7 @@ class window(QMainWindow, Ui_qencoder):
         if (len(self.currentFile) < 1):
             self.saveQueueTo()
         else:
-            file_pi = open(self.currentFile, 'wb')
-            pickle.dump(self.encodeList, file_pi)
+            self.queueStore.save_to(self.currentFile)
 
     def saveQueueTo(self):
         filename = QFileDialog.getSaveFileName(filter="Qencoder encoder queue data (*.eqd)")
@@ -401,8 +489,7 @@ class window(QMainWindow, Ui_qencoder):
             self.outputPath.setText(filename[0] + ".eqd")
         else:
             return
-        file_pi = open(filename[0], 'wb')
-        pickle.dump(self.encodeList, file_pi)
+        self.queueStore.save_to(filename[0])
         self.currentFile = filename[0]
 
     def openQueueFrom(self):
@@ -414,66 +501,43 @@ class window(QMainWindow, Ui_qencoder):
             self.outputPath.setText(filename[0] + ".eqd")
         else:
             return
-        filehandler = open(filename[0], 'rb')
-        self.encodeList = pickle.load(filehandler)
+        self.queueStore.load_from(filename[0])
+        self.encodeList.refresh()
         self.currentFile = filename[0]
         self.redrawQueueList()
         self.tabWidget.setCurrentIndex(5)
 
+    def currentQueueRow(self):
+        return self.listView_queue.currentIndex().row()
+
     def queueMoveUp(self):
-        if (self.listWidget.currentRow() > 0):
-            self.encodeList[self.listWidget.currentRow()], self.encodeList[self.listWidget.currentRow() - 1] = \
-            self.encodeList[self.listWidget.currentRow() - 1], self.encodeList[self.listWidget.currentRow()]
-            self.redrawQueueList()
+        row = self.currentQueueRow()
+        if (row > 0) and self.queueModel.move_row(row, row - 1):
+            self.listView_queue.setCurrentIndex(self.queueModel.index(row - 1))
 
     def queueMoveDown(self):
-        if (self.listWidget.currentRow() < (self.listWidget.count() - 1)):
-            self.encodeList[self.listWidget.currentRow()], self.encodeList[self.listWidget.currentRow() + 1] = \
-            self.encodeList[self.listWidget.currentRow() + 1], self.encodeList[self.listWidget.currentRow()]
-            self.redrawQueueList()
+        row = self.currentQueueRow()
+        if (row > -1) and self.queueModel.move_row(row, row + 1):
+            self.listView_queue.setCurrentIndex(self.queueModel.index(row + 1))
 
     def removeFromQueue(self):
-        if (len(self.encodeList) > 0):
-            index = self.listWidget.currentRow()
-            del self.encodeList[index]
-            self.redrawQueueList()
+        if (len(self.encodeList) > 0) and self.currentQueueRow() > -1:
+            self.queueModel.remove_row(self.currentQueueRow())
+            self.updateQueueButtons()
 
     def saveToQueue(self):
-        self.encodeList.append([self.getArgs(), self.getPresetDict()])
-        self.redrawQueueList()
+        self.queueModel.append_items([[self.getArgs(), self.getPresetDict()]])
+        self.updateQueueButtons()
         self.outputPath.setText("")
         self.pushButton.setEnabled(0)
         self.pushButton_encQueue.setEnabled(1)
         self.pushButton_save.setEnabled(0)
 
-    def getQueueIndexData(self, index):
-        q = self.encodeList[index]
-        return str(q[0]['input'][0].parts[-1]) + " -> " + str(q[0]['output_file'].parts[-1])
-
     def redrawQueueList(self):
-        self.listWidget.clear()
-        for i in self.encodeList:
-            inputFile = i[0]['input'][0].parts[-1]
-            outputFile = i[0]['output_file'].parts[-1]
-            finalString = inputFile + " -> " + outputFile
-            if (i[1]['brmode']):
-                finalString += ", " + str(i[1]['qual']) + "kbps"
-            else:
-                finalString += ", crf=" + str(i[1]['qual']) + ""
-            if (i[1]['rtenc']):
-                finalString += ", spd=" + str(i[1]['cpuused']) + "r"
-            else:
-                finalString += ", spd=" + str(i[1]['cpuused'])
-            finalString += ", 2p=" + str(int(i[1]['2p']))
-            if (i[1]['enc'] == 0):
-                finalString += ", enc=av1"
-            elif (i[1]['enc'] == 1):
-                finalString += ", enc=vp9"
-            else:
-                finalString += ", enc=vp8"
-            if (i[1]['audio']):
-                finalString += ", aud=" + str(i[1]['audiobr']) + "k"
-            self.listWidget.addItem(finalString)
+        self.queueModel.reset()
+        self.updateQueueButtons()
+
+    def updateQueueButtons(self):
         if (len(self.encodeList) > 0):
             self.pushButton_encQueue.setEnabled(1)
         else:
@@ -637,10 +701,35 @@ class window(QMainWindow, Ui_qencoder):
         filename = QFileDialog.getOpenFileName(
             filter="Videos(*.mp4 *.mkv *.webm *.flv *.gif *.3gp *.wmv *.avi *.y4m);;All(*)")
         self.inputPath.setText(filename[0])
+        self.probeInput(filename[0])
         if (len(self.outputPath.text()) > 1):
             self.pushButton.setEnabled(1)
             self.pushButton_save.setEnabled(1)
 
+    def probeInput(self, path):
+        # ffprobe runs on a thread of its own, slots only ever use its last result
+        if not path or path == self.inputInfo[0]:
+            return
+        self.inputProbe = InputProbe(path)
+        self.inputProbe.finished.connect(self.inputProbed)
+        self.inputProbe.start()
+
+    def currentInputInfo(self):
+        # None until the probe of the current input has finished, the encode thread probes it then
+        if self.inputInfo[0] != self.inputPath.text():
+            return None
+        return self.inputInfo[1]
+
+    def inputProbed(self, path, info):
+        if path != self.inputPath.text() or info is None:
+            return
+        self.inputInfo = (path, info)
+        inputFmt = match_input_format(info['pix_fmt'])
+        if inputFmt is not None and self.comboBox_inputFormat.isEnabled():
+            self.comboBox_inputFormat.setCurrentIndex(inputFmt)
+        self.label_status.setText(str(info['width']) + "x" + str(info['height']) + " " + info['pix_fmt'] + ", " +
+                                  str(info['frames']) + " frames")
+
     def outputFileSelect(self):
         filename = QFileDialog.getSaveFileName(filter="mkv and webm videos(*.mkv *.webm)")
         if (filename[0].endswith(".mkv") or filename[0].endswith(".webm")):
@@ -682,108 +771,23 @@ class window(QMainWindow, Ui_qencoder):
         self.label_quality.setEnabled(1)
 
     def getFFMPEGParams(self):
-        if (self.checkBox_ffmpegcmd.isChecked()):
-            return self.textEdit_ffmpegcmd.toPlainText()
-        astr = " "
-        addedStuff = False
-        if (self.checkBox_cropping.isChecked() and (
-                self.spinBox_cropdown.value() > 0 or self.spinBox_cropright.value() > 0 or self.spinBox_croptop.value() > 0 or self.spinBox_cropleft.value() > 0)):
-            widthSub = self.spinBox_cropright.value() + self.spinBox_cropleft.value()
-            heightSub = self.spinBox_croptop.value() + self.spinBox_cropdown.value()
-            astr += "-filter:v \"crop=iw-" + str(widthSub) + ":ih-" + str(heightSub) + ":" + str(
-                self.spinBox_cropleft.value()) + ":" + str(self.spinBox_croptop.value())
-            addedStuff = True
-        if (self.checkBox_rescale.isChecked()):
-            if (addedStuff):
-                astr += ",scale=" + str(self.spinBox_xres.value()) + ":" + str(self.spinBox_yres.value())
-            else:
-                astr += "-filter:v \"scale=" + str(self.spinBox_xres.value()) + ":" + str(self.spinBox_yres.value())
-                addedStuff = True
-        if (addedStuff):
-            astr += "\" "
-        return astr
+        return get_ffmpeg_params(self.getPresetDict())
 
     def getVideoParams(self):
-        if (self.checkBox_videocmd.isChecked()):
-            return self.textEdit_videocmd.toPlainText()
-        vparams = " --threads=" + str(self.spinBox_threads.value())
-        if (self.spinBox_maxkfdist.value() > 0 and self.comboBox_splitmode.currentIndex() != 1):
-            vparams += " --kf-max-dist=" + str(self.spinBox_maxkfdist.value())
-        if (self.comboBox_encoder.currentIndex() < 2):
-            vparams += " --tile-columns=1 --tile-rows=0 --cpu-used=" + str(self.spinBox_speed.value())
-        else:
-            vparams += " --codec=vp8 --cpu-used=" + str(self.spinBox_speed.value())
-
-        if (self.comboBox_encoder.currentIndex() == 1):
-            vparams += " --codec=vp9"
-
-        if (self.checkBox_rtenc.isChecked()):
-            vparams += " --rt"
-        else:
-            vparams += " --good"
-        if (self.checkBox_bitrate.isChecked()):
-            vparams += " --end-usage=vbr --target-bitrate=" + str(self.spinBox_quality.value())
-        else:
-            if (self.spinBox_quality.value() < 4 and self.comboBox_encoder.currentIndex() == 2):
-                vparams += " --end-usage=q --cq-level=4"
-            else:
-                vparams += " --end-usage=q --cq-level=" + str(self.spinBox_quality.value())
-            if (self.spinBox_quality.value() == 0 and self.comboBox_encoder.currentIndex() <= 1):
-                vparams += " --lossless=1"
-
-        if (self.checkBox_hdr.isChecked()):
-            vparams += " --bit-depth=10 "
-        else:
-            vparams += " --bit-depth=8 "
-        input_depth = 8 + 2 * (self.comboBox_inputFormat.currentIndex() % 3)
-        vparams += "--input-bit-depth=" + str(input_depth) + " "
-        vparams += self.lineEdit_colordata.text()
-        if (self.comboBox_inputFormat.currentIndex() <= 2):
-            vparams += " --i420"
-        elif (self.comboBox_inputFormat.currentIndex() <= 5):
-            vparams += " --i422"
-        else:
-            vparams += " --i444 "
-        return vparams
+        preset = self.getPresetDict()
+        return get_video_params(preset, encode_size(preset, self.currentInputInfo()))
 
     def getSplitMethod(self):
-        if (self.comboBox_splitmode.currentIndex() == 0):
-            return "ffmpeg"
-        elif (self.comboBox_splitmode.currentIndex() == 1):
-            return "none"
-        else:
-            return "pyscene"
+        return get_split_method(self.getPresetDict())
 
     def getAudioParams(self):
-        if (self.checkBox_audiocmd.isChecked()):
-            return self.textEdit_audiocmd.toPlainText()
-        if (self.checkBox_audio.isChecked()):
-            return "-b:a " + str(self.spinBox_audio.value()) + "k -c:a libopus"
-        else:
-            return "-c:a copy"
+        return get_audio_params(self.getPresetDict())
 
     def getVmafFilter(self):
-        astr = ""
-        addedStuff = False
-        if (self.checkBox_cropping.isChecked() and (
-                self.spinBox_cropdown.value() > 0 or self.spinBox_cropright.value() > 0 or self.spinBox_croptop.value() > 0 or self.spinBox_cropleft.value() > 0)):
-            widthSub = self.spinBox_cropright.value() + self.spinBox_cropleft.value()
-            heightSub = self.spinBox_croptop.value() + self.spinBox_cropdown.value()
-            astr += "crop=iw-" + str(widthSub) + ":ih-" + str(heightSub) + ":" + str(
-                self.spinBox_cropleft.value()) + ":" + str(self.spinBox_croptop.value())
-            addedStuff = True
-        if self.checkBox_rescale.isChecked():
-            if addedStuff:
-                astr += ",scale=" + str(self.spinBox_xres.value()) + ":" + str(self.spinBox_yres.value())
-            else:
-                astr += "scale=" + str(self.spinBox_xres.value()) + ":" + str(self.spinBox_yres.value())
-        return astr
+        return get_vmaf_filter(self.getPresetDict())
 
     def getVmafRes(self):
-        if self.checkBox_rescale.isChecked():
-            return str(self.spinBox_xres.value()) + "x" + str(self.spinBox_yres.value())
-        else:
-            return "1920x1080"
+        return get_vmaf_res(self.getPresetDict())
 
     def setFromPresetDict(self, dict, restoreCropping):
         # 1.1 variables
@@ -839,6 +843,21 @@ class window(QMainWindow, Ui_qencoder):
         self.changeSplitmode(dict['splitmethod'])
         self.doubleSpinBox_split.setValue(dict['splittr'])
         self.spinBox_qjobs.setValue(dict['qjobs'])
+
+        # 2.2 variables
+        self.checkBox_parallelsd.setChecked(dict.get('parallelsd', False))
+        self.comboBox_tqsearch.setCurrentIndex(dict.get('tqsearch', 0))
+        self.spinBox_proberatemin.setValue(dict.get('TargetVMAFMinRate', 2))
+        self.spinBox_proberatemax.setValue(dict.get('TargetVMAFMaxRate', 8))
+        self.comboBox_qorder.setCurrentIndex(dict.get('qorder', 0))
+        self.checkBox_adaptive.setChecked(dict.get('adaptive', False))
+        self.spinBox_adaptivemin.setValue(dict.get('adaptivemin', 1))
+        self.spinBox_adaptivemax.setValue(dict.get('adaptivemax', 64))
+        self.enableAdaptive()
+        self.autotuneTable = dict.get('autotune', {}).copy()
+        self.actionUse_autotune.setChecked(dict.get('useautotune', True))
+        self.spinBox_tilecols.setValue(dict.get('tilecols', -1))
+        self.spinBox_tilerows.setValue(dict.get('tilerows', -1))
         if restoreCropping:
             self.checkBox_cropping.setChecked(dict["iscropping"])
             self.checkBox_rescale.setChecked(dict["rescale"])
@@ -875,37 +894,27 @@ class window(QMainWindow, Ui_qencoder):
                 'croptop' : self.spinBox_croptop.value(), 'cropright' : self.spinBox_cropright.value(),
                 'cropleft' : self.spinBox_cropleft.value(), 'cropdown' : self.spinBox_cropdown.value(),
                 'rescale' : self.checkBox_rescale.isChecked(), 'rescalex' : self.spinBox_xres.value(),
-                'rescaley' : self.spinBox_yres.value()
+                'rescaley' : self.spinBox_yres.value(), 'parallelsd' : self.checkBox_parallelsd.isChecked(),
+                'tqsearch' : self.comboBox_tqsearch.currentIndex(),
+                'TargetVMAFMinRate' : self.spinBox_proberatemin.value(),
+                'TargetVMAFMaxRate' : self.spinBox_proberatemax.value(),
+                'qorder' : self.comboBox_qorder.currentIndex(),
+                'adaptive' : self.checkBox_adaptive.isChecked(),
+                'adaptivemin' : self.spinBox_adaptivemin.value(),
+                'adaptivemax' : self.spinBox_adaptivemax.value(),
+                'autotune' : dict(self.autotuneTable), 'useautotune' : self.actionUse_autotune.isChecked(),
+                'tilecols' : self.spinBox_tilecols.value(), 'tilerows' : self.spinBox_tilerows.value()
                 }
 
-    def getArgs(self):
-        args = {'video_params': self.getVideoParams(), 'input': [Path(self.inputPath.text())], 'encoder': 'aom',
-                'workers': self.spinBox_jobs.value(), 'audio_params': self.getAudioParams(),
-                'threshold': self.doubleSpinBox_split.value(),
-                'passes': (2 if self.checkBox_twopass.isChecked() else 1), 'output_file': Path(self.outputPath.text()),
-                'scenes': None, 'resume': self.checkBox_resume.isChecked(),
-                'keep': self.checkBox_tempfolder.isChecked(),
-                'pix_format': self.comboBox_inputFormat.currentText(), 'ffmpeg': self.getFFMPEGParams(),
-                'threads': self.spinBox_threads.value(),
-                'split_method': self.getSplitMethod(),
-                'chunk_method': ("vs_lsmash" if self.checkBox_lsmash.isChecked() and self.checkBox_lsmash.isEnabled() else "segment"),
-                'temp': Path(
-                str(os.path.dirname(self.outputPath.text())) + "/temp_" + str(
-                    os.path.basename(self.outputPath.text()))), 'probes': self.spinBox_vmafsteps.value(),
-                'min_q': self.spinBox_minq.value(), 'max_q': self.spinBox_maxq.value(),
-                'target_quality': (self.doubleSpinBox_vmaf.value() if self.checkBox_vmaf.isChecked() else None),
-                'vmaf_path': self.label_vmafpath.text(), 'vmaf_filter': self.getVmafFilter(),
-                'vmaf_res': self.getVmafRes(), 'min_scene_len': 60, 'target_quality_method': 'per_shot',
-                'probing_rate' : 2, 'n_threads': self.spinBox_threads.value()}
-        if self.comboBox_splitmode.currentIndex() == 1:
-            args["extra_split"] = self.spinBox_maxkfdist.value()
-        else:
-            args["extra_split"] = None
+    def adaptiveWorkers(self):
+        if not self.checkBox_adaptive.isChecked():
+            return None
+        low = self.spinBox_adaptivemin.value()
+        return low, max(low, self.spinBox_adaptivemax.value())
 
-        if self.comboBox_encoder.currentIndex() >= 1:
-            args['encoder'] = 'vpx'
-        args['temp'] = Path(str((args['temp'])).replace("'", "_"))
-        return args
+    def getArgs(self):
+        return get_args(self.getPresetDict(), self.inputPath.text(), self.outputPath.text(),
+                        self.checkBox_lsmash.isEnabled(), self.currentInputInfo())
 
     def encodeVideoQueue(self):
         if (self.runningEncode):
@@ -915,16 +924,25 @@ class window(QMainWindow, Ui_qencoder):
         self.runningEncode = True
         self.runningQueueMode = True
         self.currentFrames = [0] * len(self.encodeList)
-        self.totalFrames = [0] * len(self.encodeList)
-        self.worker = EncodeWorker(self.encodeList, self, self.checkBox_shutdown.isChecked(), self.spinBox_qjobs.value())
+        # Probed frame counts give totals before av1an has counted anything
+        self.totalFrames = [(item[0].get('media_info') or {}).get('frames', 0) for item in self.encodeList]
+        self.currentChunks = [None] * len(self.encodeList)
+        if all(self.totalFrames):
+            self.label_status.setText("Queue: " + str(len(self.totalFrames)) + " videos, " +
+                                      str(sum(self.totalFrames)) + " frames")
+        self.worker = EncodeWorker(list(self.encodeList), self, self.checkBox_shutdown.isChecked(), self.spinBox_qjobs.value(),
+                                   ORDER_POLICIES[self.comboBox_qorder.currentIndex()], self.adaptiveWorkers())
         self.workerThread = QtCore.QThread()
         self.worker.newFrames.connect(self.addFrames)
+        self.worker.chunksDone.connect(self.chunksDone)
         self.worker.startEncode.connect(self.startEncode)
         self.worker.newTask.connect(self.newTask)
         self.worker.encodeFinished.connect(self.encodeFinished)
+        self.worker.finished.connect(self.workerFinished)
         self.worker.moveToThread(self.workerThread)  # Move the Worker object to the Thread object
         self.workerThread.started.connect(self.worker.run)  # Init worker run() at startup (optional)
         self.workerThread.start()
+        self.pushButton_cancelitem.setEnabled(1)
 
     def encodeVideo(self):
         if (self.runningEncode):
@@ -935,12 +953,18 @@ class window(QMainWindow, Ui_qencoder):
         print("Running in non-queued mode with a single video")
         self.runningEncode = True
         self.runningQueueMode = False
-        self.worker = EncodeWorker([args], self, self.checkBox_shutdown.isChecked(), 1)
+        self.currentChunks = [None]
+        if args[0].get('media_info'):
+            self.label_status.setText("Preparing " + str(args[0]['media_info']['frames']) + " frames")
+        self.worker = EncodeWorker([args], self, self.checkBox_shutdown.isChecked(), 1,
+                                   adaptive=self.adaptiveWorkers())
         self.workerThread = QtCore.QThread()
         self.worker.newFrames.connect(self.addFrames)
+        self.worker.chunksDone.connect(self.chunksDone)
         self.worker.startEncode.connect(self.startEncode)
         self.worker.newTask.connect(self.newTask)
         self.worker.encodeFinished.connect(self.encodeFinished)
+        self.worker.finished.connect(self.workerFinished)
         self.worker.moveToThread(self.workerThread)  # Move the Worker object to the Thread object
         self.workerThread.started.connect(self.worker.run)  # Init worker run() at startup (optional)
         self.workerThread.start()
@@ -953,7 +977,7 @@ class window(QMainWindow, Ui_qencoder):
                                                    QMessageBox.Yes | QMessageBox.No, QMessageBox.No)
                 if buttonReply != QMessageBox.Yes:
                     return
-
+                self.label_status.setText("Stopping...")
             self.finalizeEncode()
             return
         print("Writing current settings to config")
@@ -968,10 +992,15 @@ class window(QMainWindow, Ui_qencoder):
         self.actionOpen_Queue.setEnabled(0)
         self.actionSave_Preset.setEnabled(0)
         self.actionOpen_Preset.setEnabled(0)
+        self.actionAutotune.setEnabled(0)
         self.actionReset_All_Settings.setEnabled(0)
         self.label_3.setEnabled(0)
         self.label_threads.setEnabled(0)
         self.spinBox_threads.setEnabled(0)
+        self.label_tilecols.setEnabled(0)
+        self.spinBox_tilecols.setEnabled(0)
+        self.label_tilerows.setEnabled(0)
+        self.spinBox_tilerows.setEnabled(0)
         self.checkBox_videocmd.setEnabled(0)
         self.checkBox_audiocmd.setEnabled(0)
         self.checkBox_ffmpegcmd.setEnabled(0)
@@ -1045,25 +1074,45 @@ class window(QMainWindow, Ui_qencoder):
         self.doubleSpinBox_vmaf.setEnabled(0)
         self.spinBox_maxq.setEnabled(0)
         self.label_maxq.setEnabled(0)
+        self.label_tqsearch.setEnabled(0)
+        self.comboBox_tqsearch.setEnabled(0)
+        self.label_proberate.setEnabled(0)
+        self.spinBox_proberatemin.setEnabled(0)
+        self.spinBox_proberatemax.setEnabled(0)
         self.checkBox_shutdown.setEnabled(0)
         self.checkBox_lsmash.setEnabled(0)
         self.comboBox_splitmode.setEnabled(0)
         self.label_splitmode.setEnabled(0)
+        self.checkBox_parallelsd.setEnabled(0)
         self.label_qjobs.setEnabled(0)
         self.spinBox_qjobs.setEnabled(0)
-
-    def finalizeEncode(self):
+        self.comboBox_qorder.setEnabled(0)
+        self.checkBox_adaptive.setEnabled(0)
+        self.enableAdaptive()
+
+    def finalizeEncode(self, cancel=True):
+        # Killing what is still running can take a moment, the gui is reset once the worker has stopped
+        if self.worker.runningPav1n:
+            if not self.stoppingEncode:
+                self.stoppingEncode = True
+                self.pushButton.setEnabled(0)
+                self.pushButton_cancelitem.setEnabled(0)
+                if cancel:
+                    threading.Thread(target=self.worker.runner.cancel, daemon=True).start()
+            return
         self.workerThread.quit()
-        self.workerThread.wait(2000)
-        self.killFlag = True
         self.workerThread.wait()
-        self.killFlag = False
+        self.stoppingEncode = False
         self.runningEncode = False
         self.currentlyRunning = False
         self.pushButton.setStyleSheet("")
         self.pushButton.setText("▶  Encode")
         self.label_threads.setEnabled(1)
         self.spinBox_threads.setEnabled(1)
+        self.label_tilecols.setEnabled(1)
+        self.spinBox_tilecols.setEnabled(1)
+        self.label_tilerows.setEnabled(1)
+        self.spinBox_tilerows.setEnabled(1)
         self.checkBox_audio.setEnabled(1)
         self.spinBox_speed.setEnabled(1)
         self.spinBox_speed.setValue(self.spinBox_speed.value())
@@ -1083,6 +1132,7 @@ class window(QMainWindow, Ui_qencoder):
         self.label_splitmode.setEnabled(1)
         if self.comboBox_splitmode.currentIndex() != 1:
             self.doubleSpinBox_split.setEnabled(1)
+        self.checkBox_parallelsd.setEnabled(self.comboBox_splitmode.currentIndex() == 2)
 
         self.label_inputformat.setEnabled(1)
         self.label_6.setEnabled(1)
@@ -1122,7 +1172,11 @@ class window(QMainWindow, Ui_qencoder):
             self.textEdit_ffmpegcmd.setEnabled(1)
         if (self.checkBox_audiocmd.isChecked()):
             self.textEdit_audiocmd.setEnabled(1)
-        self.encodeList = []
+        # Cancelled, failed and unstarted items stay queued so they can be run or resumed later
+        for row in reversed(range(len(self.encodeList))):
+            if self.encodeList.ids[row] in self.completedItems:
+                self.queueModel.remove_row(row)
+        self.completedItems = set()
         self.redrawQueueList()
         self.pushButton_up.setEnabled(1)
         self.pushButton_down.setEnabled(1)
@@ -1131,7 +1185,6 @@ class window(QMainWindow, Ui_qencoder):
         self.pushButton_save.setEnabled(0)
         self.progressBar_total.setValue(0)
         self.pushButton.setEnabled(0)
-        self.pushButton_encQueue.setEnabled(0)
         self.label_maxkfdist.setEnabled(1)
         self.spinBox_maxkfdist.setEnabled(1)
         self.actionOpen.setEnabled(1)
@@ -1141,11 +1194,16 @@ class window(QMainWindow, Ui_qencoder):
         self.actionOpen_Queue.setEnabled(1)
         self.actionSave_Preset.setEnabled(1)
         self.actionOpen_Preset.setEnabled(1)
+        self.actionAutotune.setEnabled(self.autotuneWorker is None)
         self.actionReset_All_Settings.setEnabled(1)
         self.checkBox_cropping.setEnabled(1)
         self.checkBox_rescale.setEnabled(1)
         self.label_qjobs.setEnabled(1)
         self.spinBox_qjobs.setEnabled(1)
+        self.comboBox_qorder.setEnabled(1)
+        self.checkBox_adaptive.setEnabled(1)
+        self.enableAdaptive()
+        self.pushButton_cancelitem.setEnabled(0)
         self.checkBox_lsmash.setEnabled(self.hasLsmash)
         self.enableCropping()
         self.enableRescale()
@@ -1153,81 +1211,140 @@ class window(QMainWindow, Ui_qencoder):
         print("Enabled all buttons, returning program to normal")
 
 
+class CapabilityProbe(QtCore.QObject):
+    finished = QtCore.pyqtSignal(bool, bool)
+
+    def start(self):
+        threading.Thread(target=self.run, daemon=True).start()
+
+    def run(self):
+        self.finished.emit(scenedetect_available(), lsmash_available())
+
+
+class InputProbe(QtCore.QObject):
+    finished = QtCore.pyqtSignal(str, object)
+
+    def __init__(self, path):
+        super().__init__()
+        self.path = path
+
+    def start(self):
+        threading.Thread(target=self.run, daemon=True).start()
+
+    def run(self):
+        self.finished.emit(self.path, media_info(self.path))
+
+
+class AutotuneWorker(QtCore.QObject):
+    progress = QtCore.pyqtSignal(str)
+    finished = QtCore.pyqtSignal(object, str)
+
+    def __init__(self, preset, path):
+        super().__init__()
+        self.preset = preset
+        self.path = path
+
+    def start(self):
+        threading.Thread(target=self.run, daemon=True).start()
+
+    def run(self):
+        try:
+            result = autotune(self.preset, self.path, media_info(self.path), on_progress=self.progress.emit)
+        except AutotuneError as e:
+            self.finished.emit(None, str(e))
+            return
+        self.finished.emit(result, "")
+
+
+class IngestWorker(QtCore.QObject):
+    batch = QtCore.pyqtSignal(list)
+    progress = QtCore.pyqtSignal(int, int)
+    finished = QtCore.pyqtSignal(int, int)
+
+    def __init__(self, inputDir, outputDir, preset, lsmash):
+        super().__init__()
+        self.inputDir = inputDir
+        self.outputDir = outputDir
+        self.preset = preset
+        self.lsmash = lsmash
+        self.cancelled = False
+
+    def start(self):
+        threading.Thread(target=self.run, daemon=True).start()
+
+    def cancel(self):
+        self.cancelled = True
+
+    def makeItem(self, inputPath, outputPath, info):
+        return [get_args(self.preset, inputPath, outputPath, self.lsmash, info), self.preset]
+
+    def run(self):
+        added, skipped = ingest_folder(self.inputDir, self.outputDir, self.makeItem, self.batch.emit,
+                                       self.progress.emit, lambda: self.cancelled)
+        self.finished.emit(added, skipped)
+
+
 class EncodeWorker(QtCore.QObject):
     newTask = QtCore.pyqtSignal(str, str, int)
     startEncode = QtCore.pyqtSignal(str, int, int)
     encodeFinished = QtCore.pyqtSignal(str, int)
     newFrames = QtCore.pyqtSignal(str, int)
-    runningPav1n = False
+    chunksDone = QtCore.pyqtSignal(str, int, int)
+    finished = QtCore.pyqtSignal()
 
-    def __init__(self, argdata, window, shutdown, numcores):
+    def __init__(self, argdata, window, shutdown, numcores, order='manual', adaptive=None):
         super().__init__()
         self.argdat = argdata
         self.window = window
         self.shutdown = shutdown
         self.numcores = numcores
         self.istty = sys.stdin.isatty()
-
-    def runProcessing(self, dictargs, index):
-        if self.window.killFlag:
-            return
-        self.window.scenedetectFailState = -1
-        if os.path.isfile(dictargs['output_file']):
-            print("Already completed file: " + str(dictargs['output_file']) + " . Please delete this file first")
-            self.encodeFinished.emit(str(index), 0)
-            return
-        av1an = get_av1an(get_av1an_proj(merge_args(dictargs)))
-        proj = av1an.projects[0]
-        state = [0, 0, 0]
-        t = threading.Thread(target=run_av1an, args=[av1an])
-        t.start()
-        initFrames = 0
-        while t.is_alive():
-            if state[2] == 0:
-                state[2] = proj.frames
-                if state[2] != 0:
-                    state[0] = 1
-                    self.startEncode.emit(str(index), state[2], 0)
-            if proj.counter is not None and state[0] == 1:
-                prev = state[1]
-                initFrames = done_count(dictargs['temp'], dictargs['resume'])
-                state[1] = proj.counter.get_frames() + initFrames
-                state[2] = proj.frames
-                if prev != state[1]:
-                    self.newFrames.emit(str(index), state[1] - prev)
-                state[0] = 2
-            if state[0] == 2:
-                prev = state[1]
-                state[1] = proj.counter.get_frames() + initFrames
-                state[2] = proj.frames
-                if prev != state[1]:
-                    self.newFrames.emit(str(index), state[1] - prev)
-            sleep(0.5)
-            if self.window.killFlag:
-                self.encodeFinished.emit(str(index), 1)
-                me = psutil.Process(os.getpid())
-                for child in me.children(recursive=True):
-                    child.kill()
-                os.execl(sys.executable, sys.executable, *sys.argv)
-                return
-        self.encodeFinished.emit(str(index), 0)
-        print("\n\nEncode completed for " + str(dictargs['input']) + " -> " + str(dictargs['output_file']))
+        # Until run() has returned, the window waits for finished before resetting
+        self.runningPav1n = True
+        self.order = order
+        self.runner = QueueRunner(argdata, numcores, self, order=order, adaptive=adaptive)
+
+    def new_task(self, index, taskDesc, taskFrames):
+        self.newTask.emit(str(index), taskDesc, taskFrames)
+
+    def start_encode(self, index, totalFrames, initFrames):
+        self.startEncode.emit(str(index), totalFrames, initFrames)
+
+    def new_frames(self, index, addFrames):
+        self.newFrames.emit(str(index), addFrames)
+
+    def chunk_done(self, index, doneChunks, totalChunks):
+        self.chunksDone.emit(str(index), doneChunks, totalChunks)
+
+    def encode_finished(self, index, errorCode):
+        self.encodeFinished.emit(str(index), errorCode)
+
+    def probeItems(self):
+        # Items added before their input was probed are built again with it, on this thread
+        # rather than the gui's. Probes are cached, so this is quick for inputs seen before.
+        probed = False
+        for item in self.argdat:
+            args, preset = item
+            if self.runner.killFlag:
+                break
+            if args.get('media_info') is not None:
+                continue
+            info = media_info(args['input'][0])
+            if info is not None:
+                item[0] = get_args(preset, args['input'][0], args['output_file'],
+                                   args['chunk_method'] == 'vs_lsmash', info)
+                probed = True
+        if probed:
+            self.runner.order = queue_order(self.argdat, self.order)
 
     def run(self):
-
-        print("Running")
-        self.runningPav1n = True
-        with concurrent.futures.ThreadPoolExecutor(max_workers=self.numcores) as executor:
-            future_cmd = {executor.submit(self.runProcessing, self.argdat[i][0], i): i for i in range(len(self.argdat))}
-            for future in concurrent.futures.as_completed(future_cmd):
-                try:
-                    future.result()
-                except Exception as e:
-                    print(e)
-                    traceback.print_exc()
-        if len(self.argdat) > 1:
-            self.encodeFinished.emit("-1", 0)
-        if self.shutdown:
+        try:
+            self.probeItems()
+            self.runner.run()
+        finally:
+            self.runningPav1n = False
+            self.finished.emit()
+        if self.shutdown and not self.runner.killFlag:
             if sys.platform.startswith('win'):
                 os.system('shutdown -s')
             else:
@@ -0,0 +1,345 @@
+# This Python file uses the following encoding: utf-8
+# qencoder-worker, the agent that encodes chunks for a qencoder on another machine.
+# It only needs ffmpeg and the encoders, not av1an or Qt. The coordinator connects over tcp,
+# or runs "qencoder-worker --stdio" over ssh, and sends one chunk job at a time per connection.
+#
+# Every message is one line of json. File contents follow their message as raw bytes of the size
+# given in it. A job is the piped commands for each pass of a chunk. With shared storage the
+# commands use the coordinator's paths as they are. Otherwise the inputs are sent along, sources
+# are kept in a cache so each one only crosses the network once, and the encoded chunk is sent back.
+#
+# A job can only run ffmpeg and the encoders, with options from a fixed list for ffmpeg, and every
+# file it names has to be in the job's scratch folder, the source cache or a --shared folder.
+# Over tcp the coordinator proves it knows the token by answering a challenge, the token itself is never sent.
+import argparse
+import hmac
+import json
+import os
+import re
+import secrets
+import shutil
+import socketserver
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from collections import deque
+
+from qencoder.cache import cache_dir
+
+PROTOCOL_VERSION = 2
+DEFAULT_PORT = 7395
+BLOCK_SIZE = 1 << 20
+PROGRESS_INTERVAL = 0.5
+# Jobs may only run these, anything else in a job is refused
+PROGRAMS = ('ffmpeg', 'aomenc', 'vpxenc')
+# The ffmpeg options av1an and qencoder use, and whether they take a value
+FFMPEG_OPTIONS = {'-y': False, '-hide_banner': False, '-nostdin': False, '-an': False, '-sn': False, '-dn': False,
+                  '-loglevel': True, '-v': True, '-i': True, '-vf': True, '-filter:v': True, '-pix_fmt': True,
+                  '-strict': True, '-f': True, '-color_range': True, '-colorspace': True, '-color_primaries': True,
+                  '-color_trc': True, '-map': True, '-ss': True, '-t': True, '-to': True, '-frames:v': True,
+                  '-r': True, '-s': True, '-sws_flags': True, '-threads': True, '-vsync': True}
+FFMPEG_FORMATS = ('yuv4mpegpipe', 'rawvideo', 'matroska', 'ivf', 'webm', 'nut', 'null')
+# Filters that only work on the frames, none of them can open a file
+FFMPEG_FILTERS = ('bwdif', 'colorspace', 'crop', 'deband', 'deblock', 'decimate', 'eq', 'fieldmatch', 'format',
+                  'fps', 'framestep', 'gradfun', 'hflip', 'hqdn3d', 'nlmeans', 'null', 'pad', 'removegrain',
+                  'scale', 'select', 'setdar', 'setpts', 'setsar', 'tonemap', 'transpose', 'trim', 'unsharp',
+                  'vflip', 'yadif', 'zscale')
+
+
+def send_message(wfile, message):
+    wfile.write(json.dumps(message).encode() + b'\n')
+    wfile.flush()
+
+
+def read_message(rfile):
+    line = rfile.readline()
+    if not line:
+        raise ConnectionError("connection closed")
+    return json.loads(line)
+
+
+def send_file(wfile, path):
+    with open(path, 'rb') as f:
+        shutil.copyfileobj(f, wfile, BLOCK_SIZE)
+    wfile.flush()
+
+
+def receive_file(rfile, path, size):
+    # Written next to the destination and renamed, so an interrupted transfer is never mistaken for a file.
+    # Two connections may fetch the same source at once, each gets its own partial file.
+    fd, partial = tempfile.mkstemp(suffix='.part', dir=os.path.dirname(path))
+    with os.fdopen(fd, 'wb') as f:
+        while size > 0:
+            block = rfile.read(min(BLOCK_SIZE, size))
+            if not block:
+                raise ConnectionError("connection closed during file transfer")
+            f.write(block)
+            size -= len(block)
+    os.replace(partial, path)
+
+
+def inside(folder, rel):
+    # The path of rel in folder, refusing absolute paths and .. that would leave it
+    folder = os.path.realpath(folder)
+    path = os.path.realpath(os.path.join(folder, rel))
+    if os.path.isabs(rel) or path == folder or os.path.commonpath([path, folder]) != folder:
+        raise ValueError("path " + repr(rel) + " is outside the job's folder")
+    return path
+
+
+def check_path(path, cwd, folders):
+    if path in ('-', os.devnull):
+        return
+    # A protocol such as concat: or http: would be opened by ffmpeg whatever folder the rest points at
+    if re.match(r'[A-Za-z][A-Za-z0-9+.-]+:', path):
+        raise ValueError(repr(path) + " is not a plain file")
+    real = os.path.realpath(os.path.join(cwd, path))
+    if not any(real == folder or os.path.commonpath([real, folder]) == folder for folder in folders):
+        raise ValueError("path " + repr(path) + " is outside the worker's folders")
+
+
+def check_filters(graph):
+    # Filters are separated by unescaped commas and semicolons, each may start with [labels]
+    for part in re.split(r'(?<!\\)[,;]', graph):
+        name = re.sub(r'^(\[[^]]*\])+', '', part.strip())
+        name = re.split(r'[=@\[]', name, 1)[0].strip()
+        if name not in FFMPEG_FILTERS:
+            raise ValueError("ffmpeg filter " + repr(name) + " is not allowed")
+
+
+def check_ffmpeg(args, cwd, folders):
+    i = 0
+    while i < len(args):
+        arg = args[i]
+        if arg == '-' or not arg.startswith('-'):
+            check_path(arg, cwd, folders)
+        elif arg not in FFMPEG_OPTIONS:
+            raise ValueError("ffmpeg option " + arg + " is not allowed")
+        elif FFMPEG_OPTIONS[arg]:
+            i += 1
+            if i == len(args):
+                raise ValueError("ffmpeg option " + arg + " needs a value")
+            if arg == '-i':
+                check_path(args[i], cwd, folders)
+            elif arg == '-f' and args[i] not in FFMPEG_FORMATS:
+                raise ValueError("ffmpeg format " + repr(args[i]) + " is not allowed")
+            elif arg in ('-vf', '-filter:v'):
+                check_filters(args[i])
+        i += 1
+
+
+def check_encoder(args, cwd, folders):
+    # Options the encoders read or write files with take the file as --name=FILE or as the next argument.
+    # Both are checked, as is anything else that looks like a path. Numbers like --fps=24000/1001 are fine.
+    for arg in args:
+        if arg.startswith('--') and '=' in arg:
+            value = arg.split('=', 1)[1]
+            if (re.search(r'[/\\]', value) or value in ('.', '..')) and not re.fullmatch(r'[0-9.:/+-]+', value):
+                check_path(value, cwd, folders)
+        elif arg == '-' or not arg.startswith('-'):
+            check_path(arg, cwd, folders)
+
+
+def check_command(cmd, cwd, folders):
+    if not cmd or cmd[0] not in PROGRAMS:
+        raise ValueError("refusing to run " + repr(cmd[0] if cmd else None))
+    if cmd[0] == 'ffmpeg':
+        check_ffmpeg(cmd[1:], cwd, folders)
+    else:
+        check_encoder(cmd[1:], cwd, folders)
+
+
+def check_job(job, passes, cwd, folders):
+    for key in job['files']:
+        if not re.fullmatch(r'[0-9a-f]+', key):
+            raise ValueError("invalid file key " + repr(key))
+    for commands in passes:
+        if len(commands) != 3:
+            raise ValueError("a pass needs three piped commands")
+        for cmd in commands:
+            check_command(cmd, cwd, folders)
+
+
+def token_digest(token, nonce):
+    return hmac.new(token.encode(), nonce.encode(), 'sha256').hexdigest()
+
+
+def substitute(arg, scratch, cacheDir):
+    # {scratch} is this job's copy of the coordinator's temp folder, {file:KEY} a cached source
+    arg = arg.replace('{scratch}', scratch)
+    return re.sub(r'\{file:([0-9a-f]+)\}', lambda m: os.path.join(cacheDir, m.group(1)), arg)
+
+
+def run_pass(commands, cwd, progress, onFrames):
+    # commands is the chunk generator, the ffmpeg filter and the encoder, piped in that order like av1an does.
+    # progress is [regex, [line markers]], only lines with a marker are counted.
+    pattern, markers = progress
+    gen = subprocess.Popen(commands[0], stdout=subprocess.PIPE, stderr=subprocess.DEVNULL, cwd=cwd)
+    filt = subprocess.Popen(commands[1], stdin=gen.stdout, stdout=subprocess.PIPE, stderr=subprocess.DEVNULL, cwd=cwd)
+    enc = subprocess.Popen(commands[2], stdin=filt.stdout, stdout=subprocess.PIPE, stderr=subprocess.STDOUT,
+                           universal_newlines=True, cwd=cwd)
+    gen.stdout.close()
+    filt.stdout.close()
+    history = deque(maxlen=20)
+    frame = 0
+    fatal = False
+    for line in enc.stdout:
+        line = line.strip()
+        if not line:
+            continue
+        history.append(line)
+        if 'fatal' in line.lower():
+            fatal = True
+        if any(marker in line for marker in markers):
+            match = re.search(pattern, line)
+            if match and match.group(1).isdigit() and int(match.group(1)) > frame:
+                onFrames(int(match.group(1)) - frame)
+                frame = int(match.group(1))
+    enc.wait()
+    gen.wait()
+    filt.wait()
+    if fatal or enc.returncode not in (0, -2):
+        return "encoder exited with " + str(enc.returncode), list(history)
+    return None, list(history)
+
+
+class Agent:
+    def __init__(self, slots, token=None, cacheDir=None, shared=()):
+        self.slots = slots
+        self.token = token
+        self.cacheDir = cacheDir or cache_dir('worker')
+        os.makedirs(self.cacheDir, exist_ok=True)
+        # Folders coordinators with shared storage may name files in
+        self.shared = [os.path.realpath(folder) for folder in shared]
+        self.running = threading.Semaphore(slots)
+
+    def serve(self, rfile, wfile):
+        hello = read_message(rfile)
+        if hello.get('version') != PROTOCOL_VERSION:
+            send_message(wfile, {'type': 'error', 'error': "protocol version " + str(hello.get('version')) +
+                                                          " is not supported, this worker speaks " + str(PROTOCOL_VERSION)})
+            return
+        if self.token:
+            nonce = secrets.token_hex(16)
+            send_message(wfile, {'type': 'challenge', 'nonce': nonce})
+            reply = read_message(rfile)
+            if not hmac.compare_digest(str(reply.get('digest', '')), token_digest(self.token, nonce)):
+                send_message(wfile, {'type': 'error', 'error': "wrong token"})
+                return
+        send_message(wfile, {'type': 'hello', 'version': PROTOCOL_VERSION, 'slots': self.slots,
+                             'host': os.uname().nodename if hasattr(os, 'uname') else ''})
+        while True:
+            try:
+                job = read_message(rfile)
+            except ConnectionError:
+                return
+            with self.running:
+                self.run_job(job, rfile, wfile)
+
+    def run_job(self, job, rfile, wfile):
+        scratch = tempfile.mkdtemp(prefix='qencoder_job_')
+        try:
+            # Relative paths are relative to the scratch folder, shared storage paths are always absolute
+            cwd = scratch
+            folders = [os.path.realpath(scratch), os.path.realpath(self.cacheDir)] + self.shared
+            try:
+                passes = [[[substitute(arg, scratch, self.cacheDir) for arg in cmd] for cmd in commands]
+                          for commands in job['passes']]
+                check_job(job, passes, cwd, folders)
+                scratchFiles = [(inside(scratch, rel), size) for rel, size in job['scratch_files']]
+                outputs = [inside(scratch, rel) for rel in job['outputs']]
+            except (ValueError, TypeError, KeyError) as e:
+                send_message(wfile, {'type': 'failed', 'error': "invalid job: " + str(e), 'log': []})
+                return
+            need = [key for key in job['files'] if not os.path.exists(os.path.join(self.cacheDir, key))]
+            send_message(wfile, {'type': 'need', 'files': need})
+            for key in need:
+                receive_file(rfile, os.path.join(self.cacheDir, key), job['files'][key])
+            for path, size in scratchFiles:
+                os.makedirs(os.path.dirname(path), exist_ok=True)
+                receive_file(rfile, path, size)
+            for folder in ('split', 'encode'):
+                os.makedirs(os.path.join(scratch, folder), exist_ok=True)
+            pending = [0, time.time()]
+
+            def on_frames(frames):
+                pending[0] += frames
+                if time.time() - pending[1] >= PROGRESS_INTERVAL:
+                    send_message(wfile, {'type': 'progress', 'frames': pending[0]})
+                    pending[0] = 0
+                    pending[1] = time.time()
+
+            for commands in passes:
+                error, history = run_pass(commands, cwd, job['progress'], on_frames)
+                if error is not None:
+                    send_message(wfile, {'type': 'failed', 'error': error, 'log': history})
+                    return
+            if pending[0]:
+                send_message(wfile, {'type': 'progress', 'frames': pending[0]})
+            send_message(wfile, {'type': 'done', 'outputs': [(rel, os.path.getsize(path))
+                                                             for rel, path in zip(job['outputs'], outputs)]})
+            for path in outputs:
+                send_file(wfile, path)
+        except OSError as e:
+            send_message(wfile, {'type': 'failed', 'error': str(e), 'log': []})
+        finally:
+            shutil.rmtree(scratch, ignore_errors=True)
+
+
+def parse_address(address, defaultHost='127.0.0.1'):
+    host, _, port = address.rpartition(':')
+    return host or defaultHost, int(port or DEFAULT_PORT)
+
+
+def serve_tcp(agent, address):
+    class Handler(socketserver.StreamRequestHandler):
+        def handle(self):
+            try:
+                agent.serve(self.rfile, self.wfile)
+            except (ConnectionError, ValueError) as e:
+                print("Connection from " + str(self.client_address[0]) + " ended: " + str(e), file=sys.stderr)
+
+    class Server(socketserver.ThreadingTCPServer):
+        daemon_threads = True
+        allow_reuse_address = True
+
+    with Server(address, Handler) as server:
+        print("qencoder-worker listening on " + str(address[0]) + ":" + str(server.server_address[1]) + " with " +
+              str(agent.slots) + " slots", file=sys.stderr, flush=True)
+        server.serve_forever()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog="qencoder-worker",
+                                     description="Encode chunks for a qencoder coordinator on another machine.")
+    parser.add_argument("--listen", default="127.0.0.1:" + str(DEFAULT_PORT),
+                        help="address and port to accept coordinators on (default: %(default)s)")
+    parser.add_argument("--stdio", action="store_true",
+                        help="serve one coordinator on stdin and stdout, for starting the worker over ssh")
+    parser.add_argument("--slots", type=int, default=max(1, (os.cpu_count() or 1) // 4),
+                        help="chunks to encode at once (default: a quarter of the logical cores)")
+    parser.add_argument("--token", default=os.environ.get('QENCODER_WORKER_TOKEN'),
+                        help="only accept coordinators that know this token, required unless --stdio is used "
+                             "(default: $QENCODER_WORKER_TOKEN)")
+    parser.add_argument("--cache", help="folder for sources sent by coordinators")
+    parser.add_argument("--shared", action='append', default=[], metavar="FOLDER",
+                        help="folder on shared storage that jobs may read and write, can be given more than once. "
+                             "Without it coordinators have to use --remote-transfer")
+    args = parser.parse_args(argv)
+    if not args.stdio and not args.token:
+        parser.error("--token is required, without it anyone reaching the port could run jobs")
+    agent = Agent(max(1, args.slots), args.token, args.cache, args.shared)
+    try:
+        if args.stdio:
+            agent.serve(sys.stdin.buffer, sys.stdout.buffer)
+        else:
+            serve_tcp(agent, parse_address(args.listen))
+    except KeyboardInterrupt:
+        return 130
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
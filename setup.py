@@ -20,8 +20,12 @@ setuptools.setup(
     url="https://github.com/natis1/qencoder",
     packages=setuptools.find_packages('.', exclude='tests'),
     install_requires=REQUIRES,
-    py_modules=['qenc', 'qencoder/mainwindow', 'qencoder/window', 'qencoder/av1anworkarounds'],
-    entry_points={"console_scripts": ["qencoder=qenc:main"]},
+    py_modules=['qenc', 'qencoder/mainwindow', 'qencoder/window', 'qencoder/av1anworkarounds', 'qencoder/presets',
+                'qencoder/runner', 'qencoder/headless', 'qencoder/scheduler',
+                'qencoder/resume', 'qencoder/cache', 'qencoder/scenecache', 'qencoder/scenesplit', 'qencoder/targetquality', 'qencoder/queuestore', 'qencoder/queuemodel',
+                'qencoder/mediaprobe', 'qencoder/ingest', 'qencoder/worker', 'qencoder/distributed', 'qencoder/autotune',
+                'qencoder/metrics'],
+    entry_points={"console_scripts": ["qencoder=qenc:main", "qencoder-worker=qencoder.worker:main"]},
     classifiers=[
         "Programming Language :: Python :: 3",
         "License :: OSI Approved :: GNU General Public License v3 or later (GPLv3+)",